@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class HiveBackendConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'hive_backend'
+
+    def ready(self):
+        # Register signal handlers
+        from . import db, instrumentation, signals  # noqa: F401
@@ -8,9 +8,29 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
 import os
+import threading
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hive_backend.settings')
 
 application = get_asgi_application()
+
+# Warm the in-memory indexes before the first request
+from django.db import connections  # noqa: E402
+
+from hive_backend import cooccurrence, graph, hashtags, trending  # noqa: E402
+
+
+def _warm():
+    hashtags.warm()
+    graph.warm()
+    cooccurrence.warm()
+    trending.warm()
+    connections.close_all()
+
+
+# In a thread: uvicorn --workers imports the application inside a running event loop, where the ORM refuses sync calls
+_warm_thread = threading.Thread(target=_warm)
+_warm_thread.start()
+_warm_thread.join()
@@ -0,0 +1,161 @@
+"""
+Async versions of the hot read endpoints, for ASGI deployments (ASYNC_VIEWS setting).
+
+/posts/ (GET), /users/me/ and /hashtags/search/ are served by Django async views
+that give the event loop back while the database works, so one ASGI worker keeps
+many slow reads in flight instead of blocking a whole sync worker per request.
+Their responses match the DRF viewsets: the same querysets, serializers, keyset
+pagination and conditional GET. /posts/stream/ pushes new timeline posts as
+Server-Sent Events (events.py). DRF authentication, the django-filter lookups and
+the cache are sync-only and run in a thread via sync_to_async; the page query
+itself runs on the async ORM. Other methods on these URLs go to the sync viewsets.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import caching, events
+from .db import worker_thread
+from .hashtags import hashtag_index
+from .models import Hashtag
+from .renderers import FastJSONRenderer
+from .serializers import HashtagSerializer, PostSerializer, UserSerializer
+from .views import PostViewSet, UserViewSet, _posts_scopes, _my_scopes
+
+SAFE_METHODS = ("GET", "HEAD")
+
+_sync_post_list = sync_to_async(PostViewSet.as_view({"get": "list", "post": "create"}))
+
+
+def _render(data, status_code=status.HTTP_200_OK, headers=None):
+    content = b"" if data is None else FastJSONRenderer().render(data)
+    return HttpResponse(content, status=status_code, content_type="application/json", headers=headers)
+
+
+def _error(exc):
+    headers = {}
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        status_code = status.HTTP_401_UNAUTHORIZED
+        headers["WWW-Authenticate"] = 'Bearer realm="api"'
+    else:
+        status_code = exc.status_code
+    return _render({"detail": exc.detail}, status_code, headers)
+
+
+async def _authenticate(request, thread_sensitive=True):
+    """Wrap the request for DRF and run its authenticators in a thread; raises NotAuthenticated."""
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    user = await (sync_to_async if thread_sensitive else worker_thread)(lambda: drf_request.user)()
+    if not user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    return drf_request
+
+
+def _view(viewset, drf_request, action):
+    """A viewset instance set up like DRF's dispatch would, for its get_queryset / filter_queryset."""
+    view = viewset(request=drf_request, action=action, format_kwarg=None, args=(), kwargs={})
+    view.headers = {}
+    return view
+
+
+async def _conditional(drf_request, scopes, build):
+    """Conditional GET around an async `build()` that returns the response data."""
+    headers, not_modified, data = await sync_to_async(caching.lookup)(drf_request, drf_request.user.pk, scopes)
+    if not_modified:
+        return _render(None, status.HTTP_304_NOT_MODIFIED, headers)
+    if data is None:
+        data = await build()
+        await sync_to_async(caching.store)(headers, data)
+    return _render(data, headers=headers)
+
+
+@csrf_exempt
+async def post_list(request):
+    """Postauslista (async)."""
+    if request.method not in SAFE_METHODS:
+        return await _sync_post_list(request)
+    try:
+        drf_request = await _authenticate(request)
+        view = _view(PostViewSet, drf_request, "list")
+
+        async def build():
+            queryset = await sync_to_async(lambda: view.filter_queryset(view.get_queryset()))()
+            paginator = view.paginator
+            page_queryset = paginator.get_page_queryset(queryset, drf_request)
+            rows = paginator.build_page([post async for post in page_queryset])
+            # Query-free: relations are prefetched and liked_by_me is annotated
+            serializer = PostSerializer(rows, many=True, context=view.get_serializer_context())
+            return {"next": paginator.get_next_link(), "results": serializer.data}
+
+        return await _conditional(drf_request, _posts_scopes(view, drf_request), build)
+    except exceptions.APIException as exc:
+        return _error(exc)
+
+
+@csrf_exempt
+async def get_me(request):
+    """Kirjautuneen käyttäjän tietojen haku (async)."""
+    if request.method not in SAFE_METHODS:
+        return _error(exceptions.MethodNotAllowed(request.method))
+    try:
+        drf_request = await _authenticate(request)
+        view = _view(UserViewSet, drf_request, "get_me")
+
+        async def build():
+            user = await view.get_queryset().aget(pk=drf_request.user.pk)
+            # In a thread: the stats row of a new user is built lazily on first read
+            return await sync_to_async(lambda: UserSerializer(user, context=view.get_serializer_context()).data)()
+
+        return await _conditional(drf_request, _my_scopes(view, drf_request), build)
+    except exceptions.APIException as exc:
+        return _error(exc)
+
+
+@csrf_exempt
+async def search_hashtags(request):
+    """Hae hashtageja nimen perusteella (async); ?autocomplete=1 kuten synkronisessa versiossa."""
+    if request.method not in SAFE_METHODS:
+        return _error(exceptions.MethodNotAllowed(request.method))
+    try:
+        drf_request = await _authenticate(request)
+    except exceptions.APIException as exc:
+        return _error(exc)
+    query = drf_request.query_params.get("q", "")
+    if drf_request.query_params.get("autocomplete"):
+        try:
+            limit = min(int(drf_request.query_params.get("limit", 10)), 50)
+        except ValueError:
+            limit = 10
+        # In a thread: the index reloads itself from the database when stale
+        matches = await sync_to_async(hashtag_index.search)(query, limit)
+        return _render([{"id": hashtag_id, "name": name} for hashtag_id, name in matches])
+    hashtags = [hashtag async for hashtag in Hashtag.objects.filter(name__icontains=query)]
+    return _render(HashtagSerializer(hashtags, many=True).data)
+
+
+@csrf_exempt
+async def post_stream(request):
+    """Uudet postaukset omalta aikajanalta Server-Sent Events -virtana (korvaa /posts/-pollauksen)."""
+    if request.method not in SAFE_METHODS:
+        return _error(exceptions.MethodNotAllowed(request.method))
+    # EventSource cannot send headers: browsers pass the access token as ?access_token=
+    token = request.GET.get("access_token")
+    if token and "HTTP_AUTHORIZATION" not in request.META:
+        request.META["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+    try:
+        # Not thread sensitive: Django gives every ASGI request its own sync thread (and database
+        # connection) for thread-sensitive calls, which an open stream would hold until it closes
+        drf_request = await _authenticate(request, thread_sensitive=False)
+    except exceptions.APIException as exc:
+        return _error(exc)
+    last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    last_post_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    response = StreamingHttpResponse(
+        events.stream(drf_request.user.pk, last_post_id), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # Tell nginx not to buffer the stream
+    return response
@@ -0,0 +1,105 @@
+"""
+JWT authentication without a user query on every request.
+
+The access token's signature and expiry are verified as usual; the user row it
+names is then taken from a small in-process cache instead of being loaded from
+the database each time. Entries expire after JWT_USER_CACHE_SECONDS and are
+evicted at once in this process when the user is saved or deleted (password or
+is_active changes) or one of their refresh tokens is blacklisted (see
+signals.py). Other worker processes pick such changes up within the TTL, which
+bounds how long a deactivated user can keep using a still-valid access token.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .instrumentation import timed_auth
+
+CACHE_SECONDS = getattr(settings, "JWT_USER_CACHE_SECONDS", 30)
+CACHE_SIZE = getattr(settings, "JWT_USER_CACHE_SIZE", 10_000)
+
+
+class UserCache:
+    """User rows by id, least recently used first, each with an expiry time."""
+
+    def __init__(self, ttl=CACHE_SECONDS, size=CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        # Each request gets its own instance, so per-request state never leaks between requests
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (copy.copy(user), time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def evict_user(user):
+    """Drop a user from this process's cache, e.g. after their password or is_active changed."""
+    user_cache.evict(str(getattr(user, api_settings.USER_ID_FIELD)))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that serves the token's user from `user_cache`."""
+
+    def authenticate(self, request):
+        with timed_auth():
+            return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_cache.get(str(user_id))
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.set(str(user_id), user)
+
+        # The same checks as JWTAuthentication, against the cached row
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
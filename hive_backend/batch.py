@@ -0,0 +1,220 @@
+"""
+Bulk likes and follows for the batch endpoints.
+
+Each operation applies a whole list of ids with one bulk insert or delete and
+reports a per-id outcome. Bulk writes bypass the model signals, so the side
+effects that signals.py performs for single rows (counters, timelines, hashtag
+ranking, follow graph, response cache versions) are applied here once per batch instead.
+"""
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+
+from . import caching, timeline
+from .graph import follow_graph, FOLLOWS, LIKES, HASHTAGS
+from .hashtags import hashtag_index
+from .trending import trending_hashtags
+from .models import CustomUser, Post, Hashtag, LikedPosts, LikedUsers, FollowedUsers, FollowedHashtags, UserStats
+
+MAX_BATCH_SIZE = 500
+
+CREATED = "created"
+ALREADY_EXISTS = "already_exists"
+DELETED = "deleted"
+NOT_FOUND = "not_found"
+
+
+def parse_ids(raw):
+    """Validate the `ids` list of a batch request; returns the ids deduplicated, in order."""
+    if not isinstance(raw, list) or not raw:
+        raise ValidationError({"ids": "Expected a non-empty list of ids."})
+    if len(raw) > MAX_BATCH_SIZE:
+        raise ValidationError({"ids": f"At most {MAX_BATCH_SIZE} ids per request."})
+    ids = []
+    for value in raw:
+        if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).isdigit():
+            raise ValidationError({"ids": f"Invalid id: {value!r}."})
+        ids.append(int(value))
+    return list(dict.fromkeys(ids))
+
+
+def _outcomes(ids, statuses):
+    return [{"id": target_id, "status": statuses[target_id]} for target_id in ids]
+
+
+def _insert_new(relation_model, rows, target_field):
+    """
+    Insert the rows, skipping those that already exist (unique constraint). Returns the target ids
+    of the rows this call inserted: a concurrent request may have added some of them meanwhile.
+    """
+    using = router.db_for_write(relation_model)
+    connection = connections[using]
+    if connection.vendor in ("sqlite", "postgresql") and connection.features.can_return_columns_from_insert:
+        # One statement that reports the rows it actually inserted
+        opts = relation_model._meta
+        fields = [field for field in opts.concrete_fields if not field.primary_key]
+        quote = connection.ops.quote_name
+        values = ", ".join(["(%s)" % ", ".join(["%s"] * len(fields))] * len(rows))
+        sql = (
+            f"INSERT INTO {quote(opts.db_table)} ({', '.join(quote(field.column) for field in fields)}) "
+            f"VALUES {values} ON CONFLICT DO NOTHING RETURNING {quote(opts.get_field(target_field).column)}"
+        )
+        params = [field.get_db_prep_save(getattr(row, field.attname), connection) for row in rows for field in fields]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return {target_id for target_id, in cursor.fetchall()}
+    # Elsewhere one insert per row; a conflict only rolls back its own savepoint
+    inserted = set()
+    for row in rows:
+        try:
+            with transaction.atomic(using=using):
+                relation_model.objects.using(using).bulk_create([row])
+        except IntegrityError:
+            continue
+        inserted.add(getattr(row, target_field))
+    return inserted
+
+
+def _add(ids, target_model, relation_model, owner_filter, target_field, build):
+    """Insert the missing (owner, target) rows. Returns (outcomes, ids of created rows)."""
+    existing_targets = set(target_model.objects.filter(pk__in=ids).values_list("pk", flat=True))
+    present = set(
+        relation_model.objects.filter(**owner_filter, **{f"{target_field}__in": existing_targets})
+        .values_list(target_field, flat=True)
+    )
+    missing = [target_id for target_id in ids if target_id in existing_targets and target_id not in present]
+    inserted = set()
+    if missing:
+        inserted = _insert_new(relation_model, [build(target_id) for target_id in missing], target_field)
+    created = [target_id for target_id in missing if target_id in inserted]
+    statuses = {target_id: NOT_FOUND for target_id in ids}
+    statuses.update({target_id: ALREADY_EXISTS for target_id in [*present, *missing]})
+    statuses.update({target_id: CREATED for target_id in created})
+    return _outcomes(ids, statuses), created
+
+
+def _remove(ids, relation_model, owner_filter, target_field):
+    """Delete the (owner, target) rows that exist. Returns (outcomes, ids of deleted rows)."""
+    using = router.db_for_write(relation_model)
+    # Locked, so a concurrent unlike cannot delete (and count) the same rows
+    rows = list(
+        relation_model.objects.using(using).select_for_update()
+        .filter(**owner_filter, **{f"{target_field}__in": ids}).values_list("pk", target_field)
+    )
+    if rows:
+        # Deleted by primary key in SQL: QuerySet.delete() would send the per-row post_delete signals,
+        # whose effects the callers apply in bulk
+        connection = connections[using]
+        opts = relation_model._meta
+        quote = connection.ops.quote_name
+        placeholders = ", ".join(["%s"] * len(rows))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {quote(opts.db_table)} WHERE {quote(opts.pk.column)} IN ({placeholders})",
+                [pk for pk, _ in rows],
+            )
+    deleted = [target_id for _, target_id in rows]
+    statuses = {target_id: NOT_FOUND for target_id in ids}
+    statuses.update({target_id: DELETED for target_id in deleted})
+    return _outcomes(ids, statuses), deleted
+
+
+@transaction.atomic
+def like_posts(user, ids):
+    outcomes, created = _add(
+        ids, Post, LikedPosts, {"user": user}, "post_id",
+        lambda post_id: LikedPosts(user=user, post_id=post_id),
+    )
+    if created:
+        UserStats.objects.adjust([user.pk], liked_posts_count=len(created))
+        Post.objects.filter(pk__in=created).update(like_count=F("like_count") + 1)
+        caching.bump(caching.POSTS, caching.user_scope(user.pk))
+    return outcomes
+
+
+@transaction.atomic
+def unlike_posts(user, ids):
+    outcomes, deleted = _remove(ids, LikedPosts, {"user": user}, "post_id")
+    if deleted:
+        UserStats.objects.adjust([user.pk], liked_posts_count=-len(deleted))
+        Post.objects.filter(pk__in=deleted).update(like_count=F("like_count") - 1)
+        caching.bump(caching.POSTS, caching.user_scope(user.pk))
+    return outcomes
+
+
+@transaction.atomic
+def like_users(user, ids):
+    outcomes, created = _add(
+        ids, CustomUser, LikedUsers, {"liker": user}, "liked_user_id",
+        lambda user_id: LikedUsers(liker=user, liked_user_id=user_id),
+    )
+    if created:
+        UserStats.objects.adjust([user.pk], liked_users_count=len(created))
+        UserStats.objects.adjust(created, liked_by_count=1)
+        follow_graph.record(LIKES, user.pk, created)
+        caching.bump(*map(caching.user_scope, [user.pk, *created]))
+    return outcomes
+
+
+@transaction.atomic
+def unlike_users(user, ids):
+    outcomes, deleted = _remove(ids, LikedUsers, {"liker": user}, "liked_user_id")
+    if deleted:
+        UserStats.objects.adjust([user.pk], liked_users_count=-len(deleted))
+        UserStats.objects.adjust(deleted, liked_by_count=-1)
+        follow_graph.record(LIKES, user.pk, deleted, removed=True)
+        caching.bump(*map(caching.user_scope, [user.pk, *deleted]))
+    return outcomes
+
+
+@transaction.atomic
+def follow_users(user, ids):
+    outcomes, created = _add(
+        ids, CustomUser, FollowedUsers, {"follower": user}, "followed_user_id",
+        lambda user_id: FollowedUsers(follower=user, followed_user_id=user_id),
+    )
+    if created:
+        timeline.backfill_followed_users(user.pk, created)
+        follow_graph.record(FOLLOWS, user.pk, created)
+        caching.bump(caching.user_scope(user.pk))
+    return outcomes
+
+
+@transaction.atomic
+def unfollow_users(user, ids):
+    outcomes, deleted = _remove(ids, FollowedUsers, {"follower": user}, "followed_user_id")
+    if deleted:
+        timeline.remove_followed_users(user.pk, deleted)
+        follow_graph.record(FOLLOWS, user.pk, deleted, removed=True)
+        caching.bump(caching.user_scope(user.pk))
+    return outcomes
+
+
+@transaction.atomic
+def follow_hashtags(user, ids):
+    outcomes, created = _add(
+        ids, Hashtag, FollowedHashtags, {"user": user}, "hashtag_id",
+        lambda hashtag_id: FollowedHashtags(user=user, hashtag_id=hashtag_id),
+    )
+    if created:
+        UserStats.objects.adjust([user.pk], followed_hashtags_count=len(created))
+        timeline.backfill_followed_hashtags(user.pk, created)
+        for hashtag_id in created:
+            hashtag_index.bump(hashtag_id)
+        trending_hashtags.record_follows(created)
+        follow_graph.record(HASHTAGS, user.pk, created)
+        caching.bump(caching.user_scope(user.pk))
+    return outcomes
+
+
+@transaction.atomic
+def unfollow_hashtags(user, ids):
+    outcomes, deleted = _remove(ids, FollowedHashtags, {"user": user}, "hashtag_id")
+    if deleted:
+        UserStats.objects.adjust([user.pk], followed_hashtags_count=-len(deleted))
+        timeline.remove_followed_hashtags(user.pk, deleted)
+        follow_graph.record(HASHTAGS, user.pk, deleted, removed=True)
+        for hashtag_id in deleted:
+            hashtag_index.bump(hashtag_id, -1)
+        caching.bump(caching.user_scope(user.pk))
+    return outcomes
@@ -0,0 +1,126 @@
+"""
+Conditional GET and response caching for polled read endpoints.
+
+Every cached resource depends on a few version keys ("scopes") kept in the Django
+cache: one per user and one per collection. Writes bump the versions of the
+scopes they affect (see signals.py, batch.py and PostSerializer). A request's
+ETag is derived from the URL, the requesting user and the current versions, so:
+
+- a client that sends the current ETag (If-None-Match) or a fresh
+  If-Modified-Since gets 304 Not Modified without any database work;
+- otherwise a body cached under the same ETag is served from the cache;
+- otherwise the view runs and its response data is cached under the ETag.
+
+Versions must live in a cache shared by all worker processes (see CACHES in
+settings.py); with the per-process local-memory cache a write in one worker
+would not invalidate the other workers' cached bodies.
+"""
+import functools
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_PREFIX = "hive:version:"
+BODY_PREFIX = "hive:body:"
+BODY_TIMEOUT = 300
+
+POSTS = "collection:posts"
+HASHTAGS = "collection:hashtags"
+
+
+def user_scope(user_id):
+    return f"user:{user_id}"
+
+
+def _set_versions(scopes):
+    now = time.time_ns()
+    cache.set_many({VERSION_PREFIX + scope: now for scope in scopes}, timeout=None)
+
+
+def bump(*scopes):
+    """
+    Mark the given scopes as changed: cached bodies depending on them stop matching.
+
+    Inside a transaction the bump waits for the commit, so a concurrent read cannot
+    cache the old rows under the new version.
+    """
+    transaction.on_commit(functools.partial(_set_versions, scopes))
+
+
+def get_versions(scopes):
+    """Current version of each scope; unknown (or evicted) scopes start at the current time."""
+    keys = [VERSION_PREFIX + scope for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            cache.add(key, now, timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return etag in parse_etags(if_none_match) or if_none_match.strip() == "*"
+    if_modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since") or "")
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def lookup(request, user_pk, scopes):
+    """
+    Evaluate a conditional GET.
+
+    Returns (headers, not_modified, cached data or None); the headers carry the ETag and
+    Last-Modified of the current versions of `scopes`.
+    """
+    versions = get_versions(scopes)
+    fingerprint = "|".join([request.get_full_path(), str(user_pk), *map(str, versions)])
+    etag = '"%s"' % hashlib.sha1(fingerprint.encode()).hexdigest()
+    last_modified = max(versions) // 1_000_000_000
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": "private, no-cache",
+    }
+    if _not_modified(request, etag, last_modified):
+        return headers, True, None
+    return headers, False, cache.get(BODY_PREFIX + etag)
+
+
+def store(headers, data):
+    """Cache response data under the ETag returned by `lookup`."""
+    cache.set(BODY_PREFIX + headers["ETag"], data, timeout=BODY_TIMEOUT)
+
+
+def conditional_cache(get_scopes):
+    """
+    Decorator for GET viewset methods.
+
+    ``get_scopes(view, request)`` returns the scopes the response depends on.
+    Responses vary by URL and requesting user.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            headers, not_modified, data = lookup(request, request.user.pk, get_scopes(self, request))
+            if not_modified:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            if data is None:
+                response = method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                store(headers, response.data)
+            else:
+                response = Response(data)
+            for header, value in headers.items():
+                response[header] = value
+            return response
+        return wrapper
+    return decorator
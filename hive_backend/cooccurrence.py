@@ -0,0 +1,300 @@
+"""
+Related hashtags from a hashtag co-occurrence index.
+
+Two hashtags co-occur when a post carries both. The index holds, for every
+hashtag, the number of hashtagged posts carrying it and the number carrying it
+together with each other hashtag. Related hashtags are ranked by normalized
+pointwise mutual information,
+
+    npmi(a, b) = log(p(a, b) / (p(a) * p(b))) / -log(p(a, b))
+
+which is 1 for hashtags that only ever appear together and 0 for independent
+ones, so very common hashtags do not come out related to everything.
+
+The counts are built offline (``manage.py build_cooccurrence``) into a compact
+binary file (COOCCURRENCE_FILE): per-hashtag counts and a symmetric CSR matrix
+(row offsets indexed by hashtag id, then neighbour ids and pair counts, all
+little-endian int32/int64 arrays). Loading it is a few ``frombytes`` calls. The
+posts added after the build are counted on load from the database, and this
+process's post creates and hashtag edits are applied to an overlay of count
+deltas (``record``). A rebuilt file is picked up automatically; other
+processes' writes in between are only seen after the next build, so run the
+command periodically (e.g. nightly).
+
+The index is loaded when the server process starts (see wsgi.py / asgi.py).
+Requests never load it themselves: a missing or rebuilt index is loaded by one
+background thread while requests keep reading the current one (empty before
+the first load), and writes committed during a load are replayed on top of it.
+"""
+import math
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import defaultdict
+from functools import partial
+from itertools import combinations, groupby
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Max
+
+from .models import Post
+
+FILE = getattr(settings, "COOCCURRENCE_FILE", os.path.join(settings.BASE_DIR, "cooccurrence.bin"))
+# Pairs seen on fewer posts than this are too rare to call related
+MIN_COOCCURRENCE = getattr(settings, "COOCCURRENCE_MIN_COUNT", 2)
+# How long a computed related list is served before it is recomputed from the (changing) counts
+RELATED_SECONDS = getattr(settings, "COOCCURRENCE_RELATED_SECONDS", 60)
+# How often the file's modification time is checked for a rebuild
+CHECK_SECONDS = getattr(settings, "COOCCURRENCE_CHECK_SECONDS", 60)
+MAX_RELATED = 50
+
+MAGIC = b"HIVECO1\0"
+# Magic, build watermark (highest post id counted), hashtagged posts, hashtag id bound, stored pair entries
+HEADER = struct.Struct("<8sqqqq")
+
+
+def _symmetric(pairs):
+    for (a, b), count in pairs.items():
+        yield a, b, count
+        yield b, a, count
+
+
+def _hashtags_by_post(queryset):
+    """Yield (post id, [hashtag ids]) from a through-table queryset, one post at a time."""
+    rows = queryset.order_by("post_id").values_list("post_id", "hashtag_id").iterator(chunk_size=10_000)
+    for post_id, group in groupby(rows, key=lambda row: row[0]):
+        yield post_id, [hashtag_id for _, hashtag_id in group]
+
+
+class CooccurrenceMatrix:
+    """Immutable counts in CSR form, as loaded from the file or built from the database."""
+
+    def __init__(self, watermark=0, posts=0, counts=None, indptr=None, neighbours=None, pair_counts=None):
+        self.watermark = watermark
+        self.posts = posts
+        self.counts = counts if counts is not None else array("q")  # Posts per hashtag, indexed by hashtag id
+        self.indptr = indptr if indptr is not None else array("q", [0])
+        self.neighbours = neighbours if neighbours is not None else array("i")
+        self.pair_counts = pair_counts if pair_counts is not None else array("i")
+
+    @classmethod
+    def build(cls, counted=None):
+        """
+        Count every post's hashtags from the through table (streamed; pair counts are held in memory).
+        The ids of the counted posts are added to the `counted` set, if given.
+        """
+        watermark = Post.objects.aggregate(n=Max("id"))["n"] or 0
+        posts, counts, pairs = 0, defaultdict(int), defaultdict(int)
+        through = Post.hashtags.through.objects.filter(post_id__lte=watermark)
+        for post_id, hashtag_ids in _hashtags_by_post(through):
+            if counted is not None:
+                counted.add(post_id)
+            posts += 1
+            for hashtag_id in hashtag_ids:
+                counts[hashtag_id] += 1
+            for a, b in combinations(sorted(hashtag_ids), 2):
+                pairs[a, b] += 1
+
+        size = max(counts, default=-1) + 1
+        dense_counts = array("q", bytes(8 * size))
+        for hashtag_id, count in counts.items():
+            dense_counts[hashtag_id] = count
+        # Symmetric: every pair is stored in both rows, sorted by (row, neighbour)
+        entries = sorted(_symmetric(pairs))
+        row_lengths = array("q", bytes(8 * (size + 1)))
+        for a, _, _ in entries:
+            row_lengths[a + 1] += 1
+        for row in range(size):
+            row_lengths[row + 1] += row_lengths[row]
+        return cls(
+            watermark, posts, dense_counts, row_lengths,
+            array("i", (b for _, b, _ in entries)), array("i", (count for _, _, count in entries)),
+        )
+
+    def save(self, path):
+        """Write to `path` atomically (a temporary file renamed over it)."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as output:
+            output.write(HEADER.pack(MAGIC, self.watermark, self.posts, len(self.counts), len(self.neighbours)))
+            for values in (self.counts, self.indptr, self.neighbours, self.pair_counts):
+                if sys.byteorder == "big":
+                    values = array(values.typecode, values)
+                    values.byteswap()
+                values.tofile(output)
+        os.replace(tmp, path)
+
+    @classmethod
+    def read(cls, path):
+        with open(path, "rb") as source:
+            magic, watermark, posts, size, entries = HEADER.unpack(source.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a hashtag co-occurrence file.")
+            arrays = []
+            for typecode, length in (("q", size), ("q", size + 1), ("i", entries), ("i", entries)):
+                values = array(typecode)
+                values.frombytes(source.read(values.itemsize * length))
+                if len(values) != length:
+                    raise ValueError(f"{path} is truncated.")
+                if sys.byteorder == "big":
+                    values.byteswap()
+                arrays.append(values)
+        return cls(watermark, posts, *arrays)
+
+    def count(self, hashtag_id):
+        return self.counts[hashtag_id] if hashtag_id < len(self.counts) else 0
+
+    def row(self, hashtag_id):
+        """{neighbour id: posts with both} of one hashtag."""
+        if hashtag_id + 1 >= len(self.indptr):
+            return {}
+        start, end = self.indptr[hashtag_id], self.indptr[hashtag_id + 1]
+        return dict(zip(self.neighbours[start:end], self.pair_counts[start:end]))
+
+
+class HashtagCooccurrence:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._reset(CooccurrenceMatrix(), None)
+        self._journal = None  # (post id, old, new) changes committed while a load runs, replayed on top of it
+        self.loaded_at = None
+
+    def _reset(self, matrix, mtime):
+        self._matrix = matrix
+        self._mtime = mtime
+        self._checked_at = time.monotonic()
+        # Changes since the matrix was built
+        self._posts_delta = 0
+        self._count_deltas = defaultdict(int)
+        self._pair_deltas = defaultdict(lambda: defaultdict(int))
+        self._related = {}  # Hashtag id -> (computed at, ranked list)
+
+    def load(self, path=None):
+        """Load the built file (or, without one, count from the database) and add the posts made since."""
+        with self._load_lock:
+            self._load(path or FILE)
+
+    def _load(self, path):
+        with self._lock:
+            self._journal = []
+        try:
+            counted = set()  # Posts whose hashtags this load reads from the database
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                matrix, mtime = CooccurrenceMatrix.build(counted), None
+            else:
+                matrix = CooccurrenceMatrix.read(path)
+            newer = list(_hashtags_by_post(Post.hashtags.through.objects.filter(post_id__gt=matrix.watermark)))
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            self._reset(matrix, mtime)
+            for post_id, hashtag_ids in newer:
+                counted.add(post_id)
+                self._apply((), hashtag_ids)
+            for post_id, old, new in self._journal:
+                # A post the load read already has its current hashtags counted
+                if post_id not in counted:
+                    self._apply(old, new)
+            self._journal = None
+            self.loaded_at = time.monotonic()
+
+    def ensure_loaded(self):
+        """Start a background load when there is no index yet or the file was rebuilt; never waits for it."""
+        if self.loaded_at is not None:
+            if time.monotonic() - self._checked_at <= CHECK_SECONDS:
+                return
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(FILE).st_mtime
+            except FileNotFoundError:
+                return
+            if mtime == self._mtime:
+                return
+        if self._load_lock.acquire(blocking=False):
+            threading.Thread(target=self._reload, daemon=True).start()
+
+    def _reload(self):
+        try:
+            self._load(FILE)
+        finally:
+            self._load_lock.release()
+            connections.close_all()
+
+    def record(self, post_id, old_hashtag_ids, new_hashtag_ids):
+        """Count a post's hashtags changing from the old to the new set, once the transaction commits."""
+        old, new = sorted(set(old_hashtag_ids)), sorted(set(new_hashtag_ids))
+        if old != new:
+            transaction.on_commit(partial(self._record, post_id, old, new))
+
+    def _record(self, post_id, old, new):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((post_id, old, new))
+            if self.loaded_at is not None:
+                self._apply(old, new)
+
+    def _apply(self, old, new):
+        for hashtag_ids, sign in ((old, -1), (new, 1)):
+            if hashtag_ids:
+                self._posts_delta += sign
+            for hashtag_id in hashtag_ids:
+                self._count_deltas[hashtag_id] += sign
+                self._related.pop(hashtag_id, None)
+            for a, b in combinations(hashtag_ids, 2):
+                self._pair_deltas[a][b] += sign
+                self._pair_deltas[b][a] += sign
+
+    def _count(self, hashtag_id):
+        return self._matrix.count(hashtag_id) + self._count_deltas.get(hashtag_id, 0)
+
+    def _rank(self, hashtag_id):
+        posts = self._matrix.posts + self._posts_delta
+        count = self._count(hashtag_id)
+        if count <= 0:
+            return []
+        together = self._matrix.row(hashtag_id)
+        for other, delta in self._pair_deltas.get(hashtag_id, {}).items():
+            together[other] = together.get(other, 0) + delta
+        ranked = []
+        for other, both in together.items():
+            if both < MIN_COOCCURRENCE or both >= posts:
+                continue
+            p_both = both / posts
+            pmi = math.log(p_both * posts * posts / (count * self._count(other)))
+            score = pmi / -math.log(p_both)
+            if score > 0:
+                ranked.append((other, round(score, 4), both))
+        ranked.sort(key=lambda item: (-item[1], -item[2], item[0]))
+        return ranked[:MAX_RELATED]
+
+    def related(self, hashtag_id, limit=10):
+        """Return up to `limit` (hashtag id, npmi score, posts with both) tuples, most related first."""
+        self.ensure_loaded()
+        now = time.monotonic()
+        with self._lock:
+            cached = self._related.get(hashtag_id)
+            if cached is None or now - cached[0] > RELATED_SECONDS:
+                cached = self._related[hashtag_id] = (now, self._rank(hashtag_id))
+            return cached[1][:limit]
+
+
+hashtag_cooccurrence = HashtagCooccurrence()
+
+
+def warm():
+    """Load the co-occurrence index. Called when a server process starts."""
+    from django.db import DatabaseError
+
+    try:
+        hashtag_cooccurrence.load()
+    except DatabaseError:
+        # Database not migrated yet; the index loads lazily on first use
+        pass
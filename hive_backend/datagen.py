@@ -0,0 +1,252 @@
+"""
+Synthetic data for load and performance tests.
+
+Generates users, hashtags, posts, likes and follows with ``bulk_create`` in
+batches, so millions of rows take minutes instead of one request each. The same
+seed and ``end`` (the time of the newest post) give the same rows on an empty
+database, ids and password hashes included; without ``end`` post times are
+anchored to the current time.
+
+Activity follows power laws like real social data: a few users write most
+posts and collect most follows and likes, a few hashtags are on most posts.
+Every user shares one password hash computed up front (with a salt drawn from
+the seed), so no time goes into hashing.
+
+Bulk inserts skip the model signals and the search triggers are dropped during
+the load, so afterwards the counters and timelines are rebuilt (``finalize``) and
+the search index is recreated in one pass.
+"""
+import random
+from array import array
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.crypto import RANDOM_STRING_CHARS
+
+from . import search, timeline
+from .models import (
+    CustomUser, Hashtag, Post, PostReference, LikedPosts, LikedUsers, FollowedUsers, FollowedHashtags,
+)
+
+DEFAULT_PASSWORD = "hive-password"
+
+WORDS = (
+    "hello world today coffee sauna winter summer music game code python django react coding weekend "
+    "project team meeting lunch pizza running forest lake city helsinki tampere turku night morning "
+    "news update release bug fix feature test deploy server database cache fast slow happy tired "
+    "friends family holiday travel photo movie book study exam work home cat dog snow sun rain"
+).split()
+
+
+class PowerLawSampler:
+    """
+    Draws items 0..n-1 with P(rank r) proportional to 1 / (r + 1) ** alpha.
+
+    Ranks are assigned to items in a seeded random order, so the most popular
+    items are not simply the lowest ids.
+    """
+
+    def __init__(self, n, alpha, rng):
+        self.rng = rng
+        self.cumulative = array("d", accumulate(1.0 / (rank + 1) ** alpha for rank in range(n)))
+        self.items = array("q", range(n))
+        rng.shuffle(self.items)
+
+    def sample(self):
+        if not self.items:
+            raise ValueError("Nothing to sample from: generate at least one item first.")
+        rank = bisect(self.cumulative, self.rng.random() * self.cumulative[-1])
+        return self.items[min(rank, len(self.items) - 1)]
+
+
+@contextmanager
+def _explicit_post_times():
+    """Let bulk_create keep the generated Post.time values instead of stamping them with now()."""
+    field = Post._meta.get_field("time")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class DataGenerator:
+    def __init__(self, seed=42, batch_size=5000, alpha=1.1, log=None):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.alpha = alpha
+        self.log = log or (lambda message: None)
+        self.user_ids = array("q")
+        self.hashtag_ids = array("q")
+        self.post_ids = array("q")
+
+    def _insert(self, model, rows, ids=None, ignore_conflicts=False):
+        """
+        bulk_create an iterable of unsaved objects in batches; collects the new ids into `ids`.
+
+        Returns the number of rows inserted (with ignore_conflicts, duplicates are not counted).
+        """
+        if ignore_conflicts:
+            before = model.objects.count()
+            self._insert_batches(model, rows, ids, ignore_conflicts=True)
+            return model.objects.count() - before
+        return self._insert_batches(model, rows, ids)
+
+    def _insert_batches(self, model, rows, ids, ignore_conflicts=False):
+        created = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                created += self._flush(model, batch, ids, ignore_conflicts)
+                batch = []
+        if batch:
+            created += self._flush(model, batch, ids, ignore_conflicts)
+        return created
+
+    def _flush(self, model, batch, ids, ignore_conflicts):
+        with transaction.atomic():
+            objs = model.objects.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+        if ids is not None:
+            ids.extend(obj.pk for obj in objs)
+        return len(objs)
+
+    def users(self, count, password=DEFAULT_PASSWORD, joined=None):
+        # 22 characters of 62: the 128 bits of salt entropy Django expects, so logins do not rehash
+        salt = "".join(self.rng.choice(RANDOM_STRING_CHARS) for _ in range(22))
+        password_hash = make_password(password, salt)
+        joined = joined or timezone.now()
+        offset = CustomUser.objects.count()
+        rows = (
+            CustomUser(
+                username=f"user{offset + i}", email=f"user{offset + i}@example.com", password=password_hash,
+                date_joined=joined,
+            )
+            for i in range(count)
+        )
+        created = self._insert(CustomUser, rows, self.user_ids)
+        self.log(f"{created} users")
+
+    def hashtags(self, count):
+        offset = Hashtag.objects.count()
+        # Names are generated normalized (bulk_create skips Hashtag.save)
+        created = self._insert(Hashtag, (Hashtag(name=f"tag{offset + i}") for i in range(count)), self.hashtag_ids)
+        self.log(f"{created} hashtags")
+
+    def posts(self, count, days=30, end=None, max_hashtags=3, max_references=2):
+        """Posts spread evenly over `days` days up to `end` (default: now), in id order, with hashtags and mentions."""
+        if not self.user_ids:
+            raise ValueError("Posts need users: generate at least one user.")
+        authors = PowerLawSampler(len(self.user_ids), self.alpha, self.rng)
+        hashtags = PowerLawSampler(len(self.hashtag_ids), self.alpha, self.rng) if self.hashtag_ids else None
+        end = end or timezone.now()
+        step = timedelta(days=days) / max(count, 1)
+        start = end - timedelta(days=days)
+        rng = self.rng
+        hashtag_through = Post.hashtags.through
+
+        created = 0
+        for batch_start in range(0, count, self.batch_size):
+            batch = []
+            for i in range(batch_start, min(batch_start + self.batch_size, count)):
+                text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 15)))[:144]
+                batch.append(Post(user_id=self.user_ids[authors.sample()], text=text, time=start + step * i))
+            with transaction.atomic(), _explicit_post_times():
+                posts = Post.objects.bulk_create(batch)
+                links, references = set(), set()
+                for post in posts:
+                    if hashtags is not None:
+                        for _ in range(rng.randint(0, max_hashtags)):
+                            links.add((post.pk, self.hashtag_ids[hashtags.sample()]))
+                    for _ in range(rng.randint(0, max_references) if rng.random() < 0.2 else 0):
+                        references.add((post.pk, self.user_ids[rng.randrange(len(self.user_ids))]))
+                hashtag_through.objects.bulk_create(
+                    [hashtag_through(post_id=post_id, hashtag_id=hashtag_id) for post_id, hashtag_id in links]
+                )
+                times = {post.pk: post.time for post in posts}
+                PostReference.objects.bulk_create([
+                    PostReference(post_id=post_id, user_id=user_id, time=times[post_id])
+                    for post_id, user_id in references
+                ])
+            self.post_ids.extend(post.pk for post in posts)
+            created += len(posts)
+        self.log(f"{created} posts")
+
+    def _pairs(self, count, owners, targets, target_ids, build):
+        """`count` (owner, target) rows; duplicates and self-pairs are dropped, so a few less may be created."""
+        def rows():
+            for _ in range(count):
+                owner_id = self.user_ids[owners.sample()]
+                target_id = target_ids[targets.sample()]
+                if owner_id != target_id or target_ids is not self.user_ids:
+                    yield build(owner_id, target_id)
+        return rows()
+
+    def liked_posts(self, count):
+        # Likers: moderately skewed activity; posts: strongly skewed popularity
+        rows = self._pairs(
+            count, PowerLawSampler(len(self.user_ids), self.alpha / 2, self.rng),
+            PowerLawSampler(len(self.post_ids), self.alpha, self.rng), self.post_ids,
+            lambda user_id, post_id: LikedPosts(user_id=user_id, post_id=post_id),
+        )
+        self.log(f"{self._insert(LikedPosts, rows, ignore_conflicts=True)} post likes")
+
+    def liked_users(self, count):
+        rows = self._pairs(
+            count, PowerLawSampler(len(self.user_ids), self.alpha / 2, self.rng),
+            PowerLawSampler(len(self.user_ids), self.alpha, self.rng), self.user_ids,
+            lambda liker_id, user_id: LikedUsers(liker_id=liker_id, liked_user_id=user_id),
+        )
+        self.log(f"{self._insert(LikedUsers, rows, ignore_conflicts=True)} user likes")
+
+    def followed_users(self, count):
+        rows = self._pairs(
+            count, PowerLawSampler(len(self.user_ids), self.alpha / 2, self.rng),
+            PowerLawSampler(len(self.user_ids), self.alpha, self.rng), self.user_ids,
+            lambda follower_id, user_id: FollowedUsers(follower_id=follower_id, followed_user_id=user_id),
+        )
+        self.log(f"{self._insert(FollowedUsers, rows, ignore_conflicts=True)} user follows")
+
+    def followed_hashtags(self, count):
+        rows = self._pairs(
+            count, PowerLawSampler(len(self.user_ids), self.alpha / 2, self.rng),
+            PowerLawSampler(len(self.hashtag_ids), self.alpha, self.rng), self.hashtag_ids,
+            lambda user_id, hashtag_id: FollowedHashtags(user_id=user_id, hashtag_id=hashtag_id),
+        )
+        self.log(f"{self._insert(FollowedHashtags, rows, ignore_conflicts=True)} hashtag follows")
+
+    def finalize(self):
+        """Rebuild the counters and timelines that bulk inserts bypass."""
+        call_command("reconcile_counters", batch_size=self.batch_size)
+        self.log(f"{timeline.rebuild()} timelines")
+
+
+def generate(users, hashtags, posts, liked_posts, liked_users, followed_users, followed_hashtags,
+             seed=42, batch_size=5000, alpha=1.1, days=30, end=None, password=DEFAULT_PASSWORD, log=None):
+    generator = DataGenerator(seed=seed, batch_size=batch_size, alpha=alpha, log=log)
+    # The search triggers would update the FTS index once per inserted row; it is rebuilt in one pass instead
+    rebuild_search = search.fts_available()
+    if rebuild_search:
+        search.drop_index(connection)
+    try:
+        end = end or timezone.now()
+        # Everyone has joined by the time of the first post
+        generator.users(users, password, joined=end - timedelta(days=days))
+        generator.hashtags(hashtags)
+        generator.posts(posts, days=days, end=end)
+        generator.liked_posts(liked_posts)
+        generator.liked_users(liked_users)
+        generator.followed_users(followed_users)
+        generator.followed_hashtags(followed_hashtags)
+    finally:
+        if rebuild_search:
+            search.create_index(connection)
+            generator.log("search index")
+    generator.finalize()
+    return generator
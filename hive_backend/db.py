@@ -0,0 +1,116 @@
+"""
+Database connection tuning and read-replica routing.
+
+SQLite connections are tuned as they open (connection_created): WAL journal so
+readers never block the writer, a busy timeout so concurrent writers wait for the
+lock instead of failing with "database is locked", synchronous=NORMAL (safe with
+WAL, far fewer fsyncs) and memory-mapped reads. Settings: SQLITE_TUNING,
+SQLITE_BUSY_TIMEOUT_MS, SQLITE_SYNCHRONOUS, SQLITE_MMAP_SIZE.
+
+When a replica database is configured (DATABASE_REPLICA_URL), ReadReplicaRouter
+sends the reads of GET/HEAD requests to it (which covers the read-only viewsets,
+UserViewSet and LikedPostsViewSet, entirely); writes, and every read of other
+requests, go to the primary. The request method is carried in a context variable
+set by read_replica_middleware, so management commands and signals always use
+the primary. A SQLite replica connection is opened with query_only set.
+
+Reads follow writes: the response to a write request sets a cookie that sends
+the client's reads to the primary for DATABASE_REPLICA_LAG_SECONDS, so it sees
+its own write even while the replica lags behind.
+
+Sync code that async views run in the shared thread pool (``worker_thread``)
+closes its connections per CONN_MAX_AGE itself: request_finished, which does that
+for request threads, never runs in the pool's threads.
+"""
+import contextvars
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.decorators import sync_and_async_middleware
+
+PRIMARY = "default"
+REPLICA = "replica"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+# Set on the responses of writes; while present, the client's reads go to the primary
+PRIMARY_COOKIE = "hive_read_primary"
+REPLICA_LAG_SECONDS = getattr(settings, "DATABASE_REPLICA_LAG_SECONDS", 5)
+
+_use_replica = contextvars.ContextVar("hive_use_replica", default=False)
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite" or not getattr(settings, "SQLITE_TUNING", True):
+        return
+    with connection.cursor() as cursor:
+        # journal_mode is stored in the database file; the others are per connection
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute(f"PRAGMA busy_timeout = {int(getattr(settings, 'SQLITE_BUSY_TIMEOUT_MS', 5000))}")
+        cursor.execute(f"PRAGMA synchronous = {getattr(settings, 'SQLITE_SYNCHRONOUS', 'NORMAL')}")
+        cursor.execute(f"PRAGMA mmap_size = {int(getattr(settings, 'SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}")
+        if connection.alias == REPLICA:
+            cursor.execute("PRAGMA query_only = ON")
+
+
+class ReadReplicaRouter:
+    """Reads of safe requests go to the replica, everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return REPLICA if _use_replica.get() else PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+def worker_thread(func):
+    """sync_to_async(func, thread_sensitive=False) that closes the thread's expired connections after each call."""
+    def call(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)
+
+
+def _reads_from_replica(request):
+    return request.method in SAFE_METHODS and PRIMARY_COOKIE not in request.COOKIES
+
+
+def _after_write(request, response):
+    if request.method not in SAFE_METHODS:
+        response.set_cookie(PRIMARY_COOKIE, "1", max_age=REPLICA_LAG_SECONDS, httponly=True, samesite="Lax")
+    return response
+
+
+@sync_and_async_middleware
+def read_replica_middleware(get_response):
+    """
+    Route the reads of GET/HEAD/OPTIONS requests to the replica (see ReadReplicaRouter), except for
+    clients that wrote within the last DATABASE_REPLICA_LAG_SECONDS.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = _use_replica.set(_reads_from_replica(request))
+            try:
+                return _after_write(request, await get_response(request))
+            finally:
+                _use_replica.reset(token)
+    else:
+        def middleware(request):
+            token = _use_replica.set(_reads_from_replica(request))
+            try:
+                return _after_write(request, get_response(request))
+            finally:
+                _use_replica.reset(token)
+    return middleware
@@ -0,0 +1,268 @@
+"""
+Live new-post events for connected clients (Server-Sent Events).
+
+Instead of polling /posts/, a client keeps one /posts/stream/ connection open
+(async_views.post_stream, ASGI only) and receives every new post that lands in
+its timeline: posts of the users and hashtags it follows. Each connection is a
+coroutine waiting on a small queue, so thousands of idle connections cost one
+event loop and no threads; a comment line is sent every EVENTS_HEARTBEAT_SECONDS
+to keep proxies from closing them.
+
+Posts reach the connections through a broker (EVENTS_BROKER setting):
+
+- "memory": PostSerializer.create publishes the post to the recipients that
+  timeline.fan_out computed, after commit, to the subscribers of this process.
+  Enough for a single worker process.
+- "database": one poller per process reads the timeline rows written since its
+  last poll (a primary key range scan, every EVENTS_POLL_SECONDS) and delivers
+  the ones addressed to its subscribers. The timeline table is the message
+  log, so posts made in any worker reach subscribers in every worker without
+  an external broker. Primary keys are not committed in order: a fan-out can
+  commit after a later-numbered one. So the scan starts from the highest key
+  seen EVENTS_SETTLE_SECONDS ago rather than the newest one, and rows already
+  delivered are skipped. Only a fan-out slower to commit than that is missed;
+  clients refetch the timeline on reconnect.
+
+Event ids are post ids: a reconnecting client's Last-Event-ID header fetches
+the newer posts of its timeline before live events resume. A client that falls
+more than EVENTS_QUEUE_SIZE events behind loses the oldest ones.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from functools import partial
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, transaction
+
+from .db import worker_thread
+from .models import Post, TimelineEntry
+
+QUEUE_SIZE = getattr(settings, "EVENTS_QUEUE_SIZE", 100)
+POLL_SECONDS = getattr(settings, "EVENTS_POLL_SECONDS", 1.0)
+HEARTBEAT_SECONDS = getattr(settings, "EVENTS_HEARTBEAT_SECONDS", 15)
+# How long after a later-numbered timeline row a fan-out may still commit and be delivered
+SETTLE_SECONDS = getattr(settings, "EVENTS_SETTLE_SECONDS", 10 * POLL_SECONDS)
+# Timeline rows read per poll, and missed posts sent to a reconnecting client
+POLL_BATCH = 10_000
+CATCH_UP_LIMIT = 100
+# Post ids remembered per connection, so a post is not sent twice (catch-up and live, or two deliveries)
+SENT_LIMIT = 1000
+RETRY_MILLISECONDS = 5000
+
+
+def post_event(post_id, user_id, username, text, time, hashtag_ids):
+    """The data of a "post" event: a summary, the full post is at /posts/{id}/."""
+    return {
+        "id": post_id, "user": {"id": user_id, "username": username},
+        "text": text, "time": time, "hashtags": sorted(hashtag_ids),
+    }
+
+
+def post_events(post_ids):
+    """{post id: event} for the given posts: two queries."""
+    hashtags = defaultdict(list)
+    for post_id, hashtag_id in Post.hashtags.through.objects.filter(post_id__in=post_ids).values_list(
+        "post_id", "hashtag_id"
+    ):
+        hashtags[post_id].append(hashtag_id)
+    return {
+        post_id: post_event(post_id, user_id, username, text, time, hashtags[post_id])
+        for post_id, user_id, username, text, time in Post.objects.filter(pk__in=post_ids).values_list(
+            "id", "user_id", "user__username", "text", "time"
+        )
+    }
+
+
+def missed_events(user_id, last_post_id):
+    """Events of the user's timeline posts newer than `last_post_id`, oldest first."""
+    post_ids = list(
+        TimelineEntry.objects.filter(user_id=user_id, post_id__gt=last_post_id)
+        .order_by("post_id").values_list("post_id", flat=True)[:CATCH_UP_LIMIT]
+    )
+    events = post_events(post_ids)
+    return [events[post_id] for post_id in post_ids if post_id in events]
+
+
+class Subscription:
+    """One connected client: a bounded queue owned by the event loop serving it."""
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def deliver(self, event):
+        """Queue an event; safe to call from any thread."""
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # The loop has closed; the connection is gone
+
+    def _put(self, event):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(event)
+
+    async def get(self, timeout):
+        """The next event, or None when none arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class MemoryBroker:
+    """Delivers the posts created in this process to the subscribers of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)  # User id -> subscriptions (a user may have several tabs open)
+
+    def subscribe(self, user_id):
+        """Register a subscription on the running event loop."""
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def connected(self):
+        with self._lock:
+            return set(self._subscriptions)
+
+    def deliver(self, event, user_ids):
+        with self._lock:
+            targets = [
+                subscription for user_id in user_ids for subscription in self._subscriptions.get(user_id, ())
+            ]
+        for subscription in targets:
+            subscription.deliver(event)
+
+    def publish(self, event, recipient_ids):
+        self.deliver(event, recipient_ids)
+
+
+class DatabaseBroker(MemoryBroker):
+    """Finds new posts for this process's subscribers by polling the timeline table (see module docstring)."""
+
+    def __init__(self):
+        super().__init__()
+        self._cursor = None  # Rows up to this pk are settled: seen by a poll at least SETTLE_SECONDS ago
+        self._high = 0  # Highest pk read so far
+        self._marks = deque()  # (monotonic poll time, highest pk read by then), oldest first
+        self._delivered = set()  # Pks above the cursor that have been handled
+        self._poller = None
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+        return subscription
+
+    def publish(self, event, recipient_ids):
+        # The timeline rows written by the fan-out are the message log
+        pass
+
+    def _read(self, user_ids):
+        """Read the timeline rows not handled yet; returns [(event, recipient ids)] for `user_ids`."""
+        now = time.monotonic()
+        if self._cursor is None:
+            self._cursor = self._high = (
+                TimelineEntry.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+            )
+            return []
+        # Everything past the settled cursor: rows that committed late into a gap below _high are found here
+        rows, position = [], self._cursor
+        while True:
+            batch = list(
+                TimelineEntry.objects.filter(pk__gt=position).order_by("pk")
+                .values_list("pk", "user_id", "post_id")[:POLL_BATCH]
+            )
+            rows += batch
+            if len(batch) < POLL_BATCH:
+                break
+            position = batch[-1][0]
+        fresh = [row for row in rows if row[0] not in self._delivered]
+        recipients = defaultdict(list)
+        for _, user_id, post_id in fresh:
+            if user_id in user_ids:
+                recipients[post_id].append(user_id)
+        events = post_events(list(recipients))
+
+        # Every query succeeded: mark the rows handled and move the cursor
+        self._delivered.update(pk for pk, _, _ in fresh)
+        if rows:
+            self._high = max(self._high, rows[-1][0])
+        self._marks.append((now, self._high))
+        while self._marks[0][0] <= now - SETTLE_SECONDS:
+            self._cursor = self._marks.popleft()[1]
+        self._delivered = {pk for pk in self._delivered if pk > self._cursor}
+        return [(events[post_id], readers) for post_id, readers in recipients.items() if post_id in events]
+
+    async def _poll(self):
+        # The shared executor: a thread-sensitive call would run in the thread of the request that started the poller
+        read = worker_thread(self._read)
+        while True:
+            try:
+                deliveries = await read(self.connected())
+            except DatabaseError:
+                deliveries = []  # E.g. the database is locked; the cursor has not moved, so retry next time
+            for event, user_ids in deliveries:
+                self.deliver(event, user_ids)
+            await asyncio.sleep(POLL_SECONDS)
+
+
+BROKERS = {"memory": MemoryBroker, "database": DatabaseBroker}
+broker = BROKERS[getattr(settings, "EVENTS_BROKER", "memory")]()
+
+
+def publish_post(post, hashtag_ids, recipient_ids):
+    """Send a new post to its timeline recipients once the transaction commits."""
+    event = post_event(post.pk, post.user_id, post.user.username, post.text, post.time, hashtag_ids)
+    transaction.on_commit(partial(broker.publish, event, list(recipient_ids)))
+
+
+def _format(event):
+    return f"id: {event['id']}\nevent: post\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n"
+
+
+def _first_send(sent, post_id):
+    """Record a post as sent on a connection; False when it already was (live after catch-up, or redelivered)."""
+    if post_id in sent:
+        return False
+    sent[post_id] = None
+    if len(sent) > SENT_LIMIT:
+        del sent[next(iter(sent))]
+    return True
+
+
+async def stream(user_id, last_post_id=None):
+    """Async iterator of the SSE lines for one client; unsubscribes when the client disconnects."""
+    subscription = broker.subscribe(user_id)
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        sent = {}  # Post ids sent on this connection, oldest first
+        if last_post_id is not None:
+            # Subscribed first, so nothing falls between the catch-up and the live events
+            for event in await worker_thread(missed_events)(user_id, last_post_id):
+                if _first_send(sent, event["id"]):
+                    yield _format(event)
+        while True:
+            event = await subscription.get(HEARTBEAT_SECONDS)
+            if event is None:
+                yield ": keep-alive\n\n"
+            elif _first_send(sent, event["id"]):
+                yield _format(event)
+    finally:
+        broker.unsubscribe(subscription)
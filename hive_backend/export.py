@@ -0,0 +1,180 @@
+"""
+Streaming NDJSON export of posts and the social graph, for analytics.
+
+Every table is read in keyset chunks in primary-key (posts: time, id) order and
+written one JSON object per line, so memory stays constant however large the
+tables are. Each chunk is a separate short query, so a slow client does not
+hold a cursor or transaction open; under ASGI the export view streams from an
+async iterator instead of a sync one that Django would buffer in a thread.
+
+The last line of an export is a watermark record. Passing its ``since`` value to
+the next export ships only the rows added after it: posts after the last
+exported (time, id), and relation rows after the last exported id.
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+from django.db.models import Q
+
+from .db import worker_thread
+from .models import Post, LikedPosts, LikedUsers, FollowedUsers, FollowedHashtags
+
+CHUNK_SIZE = 2000
+
+# Export name -> (model, exported fields); posts additionally carry their hashtag and reference ids
+TABLES = OrderedDict([
+    ("posts", (Post, ["id", "user_id", "time", "text", "like_count"])),
+    ("liked_posts", (LikedPosts, ["id", "user_id", "post_id"])),
+    ("liked_users", (LikedUsers, ["id", "liker_id", "liked_user_id"])),
+    ("followed_users", (FollowedUsers, ["id", "follower_id", "followed_user_id"])),
+    ("followed_hashtags", (FollowedHashtags, ["id", "user_id", "hashtag_id"])),
+])
+
+
+class InvalidWatermark(ValueError):
+    pass
+
+
+def parse_tables(raw):
+    """Comma separated export names (all tables when empty); raises ValueError for unknown names."""
+    if not raw:
+        return list(TABLES)
+    names = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = [name for name in names if name not in TABLES]
+    if unknown:
+        raise ValueError(f"Unknown tables: {', '.join(unknown)}. Choose from: {', '.join(TABLES)}.")
+    return names
+
+
+def encode_watermark(marks):
+    # Full microsecond precision (DjangoJSONEncoder would round post times to milliseconds)
+    marks = {name: [mark[0].isoformat(), mark[1]] if name == "posts" else mark for name, mark in marks.items()}
+    return base64.urlsafe_b64encode(json.dumps(marks).encode()).decode()
+
+
+def decode_watermark(token):
+    """{table: last exported key} from a watermark token; posts keys are [time, id]."""
+    if not token:
+        return {}
+    try:
+        marks = json.loads(base64.urlsafe_b64decode(token.encode()))
+        if not isinstance(marks, dict):
+            raise ValueError
+        if "posts" in marks:
+            time, post_id = marks["posts"]
+            marks["posts"] = [datetime.fromisoformat(time.replace("Z", "+00:00")), int(post_id)]
+        for name in TABLES:
+            if name != "posts" and name in marks:
+                marks[name] = int(marks[name])
+    except (TypeError, ValueError, binascii.Error):
+        raise InvalidWatermark("Invalid since watermark.")
+    return marks
+
+
+def _fetch(name, mark, chunk_size, using):
+    """The next chunk of one table after its watermark, as dicts in export order: one query (posts: three)."""
+    model, fields = TABLES[name]
+    if name == "posts":
+        queryset = Post.objects.using(using).order_by("time", "id")
+        if mark is not None:
+            time, post_id = mark
+            queryset = queryset.filter(Q(time__gt=time) | Q(time=time, id__gt=post_id))
+    else:
+        queryset = model.objects.using(using).order_by("id")
+        if mark is not None:
+            queryset = queryset.filter(id__gt=mark)
+    rows = list(queryset.values(*fields)[:chunk_size])
+    if name == "posts" and rows:
+        _attach_relations(rows, using)
+    return rows
+
+
+def _attach_relations(posts, using):
+    """Add the hashtag and reference ids of a chunk of posts."""
+    post_ids = [post["id"] for post in posts]
+    hashtags, references = {}, {}
+    for post_id, hashtag_id in Post.hashtags.through.objects.using(using).filter(post_id__in=post_ids).values_list(
+        "post_id", "hashtag_id"
+    ):
+        hashtags.setdefault(post_id, []).append(hashtag_id)
+    for post_id, user_id in Post.references.through.objects.using(using).filter(post_id__in=post_ids).values_list(
+        "post_id", "user_id"
+    ):
+        references.setdefault(post_id, []).append(user_id)
+    for post in posts:
+        post["hashtag_ids"] = hashtags.get(post["id"], [])
+        post["reference_ids"] = references.get(post["id"], [])
+
+
+def iter_ndjson(tables=None, since=None, chunk_size=CHUNK_SIZE, asynchronous=False):
+    """
+    Return an iterator of the export as NDJSON text, one chunk of lines (newline terminated) at a time.
+
+    Each record is ``{"table": name, ...row fields}``; the final line is
+    ``{"table": "watermark", "since": token, "rows": {name: count}}``. The
+    watermark is validated (InvalidWatermark) and the database chosen here, before
+    the first line is produced. With ``asynchronous`` it is an async iterator whose
+    queries run in worker threads, for StreamingHttpResponse under ASGI.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, got {chunk_size}.")
+    marks = decode_watermark(since)
+    using = router.db_for_read(Post)
+    export = _Export(tables or list(TABLES), marks, chunk_size, using)
+    return export.astream() if asynchronous else export.stream()
+
+
+class _Export:
+    """
+    Reads each table in keyset chunks, every chunk its own short query: nothing (no cursor or transaction)
+    stays open while a chunk is written to a slow client. The export is not a snapshot: rows committed
+    meanwhile past a table's position are included, the others ship with the next export.
+    """
+
+    def __init__(self, tables, marks, chunk_size, using):
+        self.tables = tables
+        self.marks = marks
+        self.chunk_size = chunk_size
+        self.using = using
+        self.counts = {}
+        self.encoder = DjangoJSONEncoder(separators=(",", ":"))
+
+    def _lines(self, name, rows):
+        """Encode a chunk and advance the table's watermark past it."""
+        self.counts[name] = self.counts.get(name, 0) + len(rows)
+        last = rows[-1]
+        self.marks[name] = [last["time"], last["id"]] if name == "posts" else last["id"]
+        return "".join(self.encoder.encode({"table": name, **row}) + "\n" for row in rows)
+
+    def _watermark(self):
+        return self.encoder.encode(
+            {"table": "watermark", "since": encode_watermark(self.marks), "rows": self.counts}
+        ) + "\n"
+
+    def stream(self):
+        for name in self.tables:
+            self.counts[name] = 0
+            while True:
+                rows = _fetch(name, self.marks.get(name), self.chunk_size, self.using)
+                if rows:
+                    yield self._lines(name, rows)
+                if len(rows) < self.chunk_size:
+                    break
+        yield self._watermark()
+
+    async def astream(self):
+        fetch = worker_thread(_fetch)
+        for name in self.tables:
+            self.counts[name] = 0
+            while True:
+                rows = await fetch(name, self.marks.get(name), self.chunk_size, self.using)
+                if rows:
+                    yield self._lines(name, rows)
+                if len(rows) < self.chunk_size:
+                    break
+        yield self._watermark()
@@ -0,0 +1,139 @@
+"""
+Fast serialization for the hot read-only lists (/posts/ and /liked-posts/).
+
+A ModelSerializer builds every object field by field: a bound field object per
+field and row, to_representation dispatch, nested serializers for the
+relations. Once the queries are batched that is most of the CPU time of a big
+page. Viewsets that mix in FastListMixin instead page over ``.values()`` rows
+of just the selected columns and build the response dicts directly; a post's
+hashtags and references come as tuples from the through tables, one query
+each per page, like the prefetches they replace.
+
+The output is the same as the mirrored serializer's, including the field order
+and ?fields= / ?omit=. Writes and single objects keep the serializers. The
+FAST_LIST_SERIALIZATION setting turns the fast path off.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .instrumentation import TimedSerializerMixin
+from .models import Post, PostReference
+from .serializers import LikedPostsSerializer, PostSerializer
+
+# Formats like the serializers' DateTimeField (ISO 8601, UTC as "Z")
+_datetime = serializers.DateTimeField()
+
+
+class ValuesSerializer:
+    """Serializes `.values()` rows as `serializer_class` would serialize the model instances."""
+
+    serializer_class = None
+    # Value columns each field reads; the pagination ordering columns must be among them
+    columns = {}
+    key_columns = ("id",)
+    # Columns that only exist when the viewset's get_queryset annotated them
+    annotation_columns = ()
+
+    def __init__(self, request=None):
+        selected_fields = getattr(self.serializer_class, "selected_fields", None)
+        selected = selected_fields(request) if selected_fields else set(self.serializer_class.Meta.fields)
+        self.fields = [name for name in self.serializer_class.Meta.fields if name in selected]
+        self.relations = {}
+
+    def values(self, queryset):
+        """The queryset as rows of the columns the selected fields read."""
+        names = dict.fromkeys(self.key_columns)
+        for field in self.fields:
+            names.update(dict.fromkeys(self.columns.get(field, ())))
+        for name in self.annotation_columns:
+            if name in names and name not in queryset.query.annotations:
+                del names[name]
+        # values() drops the select_related joins, but not the prefetches
+        return queryset.prefetch_related(None).values(*names)
+
+    def load(self, rows):
+        """Fetch the relations of a page of rows (the values() queryset cannot prefetch)."""
+        self.relations = {}
+
+    def to_representation(self, rows):
+        """One dict per row, each selected field holding its first column; override for nested fields."""
+        columns = [(name, self.columns.get(name, (name,))[0]) for name in self.fields]
+        return [{name: row[column] for name, column in columns} for row in rows]
+
+    def serialize(self, rows):
+        self.load(rows)
+        return self.to_representation(rows)
+
+
+class PostValuesSerializer(TimedSerializerMixin, ValuesSerializer):
+    serializer_class = PostSerializer
+    columns = {
+        "text": ("text",),
+        "user": ("user_id", "user__username"),
+        "like_count": ("like_count",),
+        "liked_by_me": ("liked_by_me",),
+    }
+    key_columns = ("id", "time")
+    annotation_columns = ("liked_by_me",)
+
+    def load(self, rows):
+        post_ids = [row["id"] for row in rows]
+        # Ordered by related id, as the serializers' prefetches come back (the unique indexes' order)
+        self.relations = {"hashtags": defaultdict(list), "references": defaultdict(list)}
+        if "hashtags" in self.fields:
+            through = Post.hashtags.through.objects.filter(post_id__in=post_ids).order_by("post_id", "hashtag_id")
+            for post_id, hashtag_id, name in through.values_list("post_id", "hashtag_id", "hashtag__name"):
+                self.relations["hashtags"][post_id].append({"id": hashtag_id, "name": name})
+        if "references" in self.fields or "reference_count" in self.fields:
+            mentions = PostReference.objects.filter(post_id__in=post_ids).order_by("post_id", "user_id")
+            for post_id, user_id, username in mentions.values_list("post_id", "user_id", "user__username"):
+                self.relations["references"][post_id].append({"id": user_id, "username": username})
+
+    def to_representation(self, rows):
+        fields = self.fields
+        complete = len(fields) == len(PostSerializer.Meta.fields)
+        hashtags = self.relations.get("hashtags", {})
+        references = self.relations.get("references", {})
+        to_time = _datetime.to_representation
+        results = []
+        for row in rows:
+            post_id = row["id"]
+            post_references = references.get(post_id, [])
+            data = {
+                "id": post_id,
+                "text": row.get("text"),
+                "time": to_time(row["time"]),
+                "user": {"id": row["user_id"], "username": row["user__username"]} if "user_id" in row else None,
+                "hashtags": hashtags.get(post_id, []),
+                "references": post_references,
+                "like_count": row.get("like_count"),
+                # Not annotated for anonymous requests, where PostSerializer answers False as well
+                "liked_by_me": bool(row.get("liked_by_me")),
+                "reference_count": len(post_references),
+            }
+            results.append(data if complete else {name: data[name] for name in fields})
+        return results
+
+
+class LikedPostValuesSerializer(TimedSerializerMixin, ValuesSerializer):
+    serializer_class = LikedPostsSerializer
+    columns = {"user": ("user_id",), "post": ("post_id",)}
+
+
+class FastListMixin:
+    """Serve a viewset's list action from `values_serializer_class` (see module docstring)."""
+
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, "FAST_LIST_SERIALIZATION", True):
+            return super().list(request, *args, **kwargs)
+        values_serializer = self.values_serializer_class(request)
+        queryset = values_serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(values_serializer.serialize(list(queryset)))
+        return self.get_paginated_response(values_serializer.serialize(page))
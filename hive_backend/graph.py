@@ -0,0 +1,289 @@
+"""
+"Who to follow" suggestions from an in-memory social graph.
+
+Each process holds the follow graph as adjacency lists in CSR form (compressed
+sparse rows): an ``indptr`` array indexed by id holding row offsets, and one
+flat ``indices`` array with every row's neighbour ids, sorted. There are four:
+
+- follows: user -> users they follow (FollowedUsers)
+- likes: user -> users they liked (LikedUsers)
+- hashtags: user -> hashtags they follow, and hashtag_followers: the reverse (FollowedHashtags)
+
+With NumPy installed the arrays are NumPy arrays and scoring is vectorized
+(gathers and ``bincount``); without it they are ``array.array`` and scoring runs
+in plain Python loops.
+
+Writes do not rebuild the arrays. This process's follows and likes are applied,
+after commit, to a small per-row overlay of added and removed ids that reads
+merge with the base rows. The graph is rebuilt from the database every
+GRAPH_RELOAD_SECONDS (picking up other processes' writes) or once the overlay
+holds GRAPH_MAX_PENDING changes; changes made while a rebuild runs are replayed
+on top of it.
+
+Score of a candidate c for user u (u and the users u follows are excluded):
+    number of u's follows who follow c
+    + LIKE_WEIGHT * number of users u liked who follow c
+    + sum over hashtags both follow of 1 / log2(2 + followers of the hashtag)
+"""
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from functools import partial
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .models import CustomUser, LikedUsers, FollowedUsers, FollowedHashtags
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RELOAD_SECONDS = getattr(settings, "GRAPH_RELOAD_SECONDS", 600)
+MAX_PENDING = getattr(settings, "GRAPH_MAX_PENDING", 50_000)
+LIKE_WEIGHT = getattr(settings, "GRAPH_LIKE_WEIGHT", 0.5)
+
+FOLLOWS = "follows"
+LIKES = "likes"
+HASHTAGS = "hashtags"
+
+
+def _pairs(queryset, *fields):
+    """Two parallel id arrays (owner ids, target ids) from one streamed query."""
+    flat = chain.from_iterable(queryset.values_list(*fields).iterator(chunk_size=10_000))
+    if np is not None:
+        pairs = np.fromiter(flat, dtype=np.int64).reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1]
+    pairs = array("q", flat)
+    return pairs[0::2], pairs[1::2]
+
+
+class Adjacency:
+    """Sorted neighbour ids per row id in CSR form, plus an overlay of changes made since it was built."""
+
+    def __init__(self, rows, cols):
+        if not len(rows):
+            size = 0
+        else:
+            size = int(rows.max() if np is not None else max(rows)) + 1
+        if np is not None:
+            order = np.lexsort((cols, rows))
+            self.indptr = np.zeros(size + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=size), out=self.indptr[1:])
+            self.indices = cols[order]
+        else:
+            counts = [0] * (size + 1)
+            for row in rows:
+                counts[row + 1] += 1
+            self.indptr = array("q", counts)
+            for row in range(size):
+                self.indptr[row + 1] += self.indptr[row]
+            self.indices = array("q", (col for _, col in sorted(zip(rows, cols))))
+        self.added = defaultdict(set)
+        self.removed = defaultdict(set)
+        self.pending = 0
+
+    def _base(self, row):
+        if row + 1 >= len(self.indptr):
+            return self.indices[:0]
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
+
+    def _in_base(self, row, col):
+        base = self._base(row)
+        index = int(np.searchsorted(base, col)) if np is not None else bisect_left(base, col)
+        return index < len(base) and base[index] == col
+
+    def row(self, row):
+        """Current neighbour ids of a row, sorted."""
+        base = self._base(row)
+        if row not in self.added and row not in self.removed:
+            return base
+        merged = sorted((set(base.tolist() if np is not None else base) - self.removed[row]) | self.added[row])
+        return np.array(merged, dtype=np.int64) if np is not None else array("q", merged)
+
+    def add(self, row, col):
+        self.removed[row].discard(col)
+        if not self._in_base(row, col):
+            self.added[row].add(col)
+        self.pending += 1
+
+    def remove(self, row, col):
+        self.added[row].discard(col)
+        if self._in_base(row, col):
+            self.removed[row].add(col)
+        self.pending += 1
+
+    def gather(self, rows):
+        """(row lengths, concatenated neighbour ids) of the given rows, in the given order."""
+        if np is None:
+            lengths, values = [], []
+            for row in rows:
+                neighbours = self.row(row)
+                lengths.append(len(neighbours))
+                values.extend(neighbours)
+            return lengths, values
+        rows = np.asarray(rows, dtype=np.int64)
+        changed = np.fromiter(chain(self.added, self.removed), dtype=np.int64)
+        plain = rows[(rows + 1 < len(self.indptr)) & ~np.isin(rows, changed)]
+        # Vectorized slice gather: offsets of every element of every plain row at once
+        starts = self.indptr[plain]
+        lengths = self.indptr[plain + 1] - starts
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+        parts, part_lengths = [self.indices[offsets]], [lengths]
+        for row in np.setdiff1d(rows, plain):
+            neighbours = self.row(int(row))
+            parts.append(neighbours)
+            part_lengths.append(np.array([len(neighbours)], dtype=np.int64))
+        return np.concatenate(part_lengths), np.concatenate(parts)
+
+
+class FollowGraph:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._graphs = None
+        self._max_user_id = 0
+        self._journal = None  # Changes recorded while a rebuild runs, replayed on top of it
+        self.loaded_at = None
+
+    def load(self):
+        """(Re)build the adjacency arrays from the database: one streamed query per table."""
+        with self._lock:
+            self._journal = []
+        try:
+            hashtag_users, hashtag_ids = _pairs(FollowedHashtags.objects.all(), "user_id", "hashtag_id")
+            graphs = {
+                FOLLOWS: Adjacency(*_pairs(FollowedUsers.objects.all(), "follower_id", "followed_user_id")),
+                LIKES: Adjacency(*_pairs(LikedUsers.objects.all(), "liker_id", "liked_user_id")),
+                HASHTAGS: Adjacency(hashtag_users, hashtag_ids),
+                "hashtag_followers": Adjacency(hashtag_ids, hashtag_users),
+            }
+            max_user_id = CustomUser.objects.aggregate(n=Max("id"))["n"] or 0
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            self._graphs = graphs
+            self._max_user_id = max(max_user_id, self._max_user_id)
+            for change in self._journal:
+                self._apply(*change)
+            self._journal = None
+            self.loaded_at = time.monotonic()
+
+    def _needs_load(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > RELOAD_SECONDS:
+            return True
+        return sum(graph.pending for graph in self._graphs.values()) > MAX_PENDING
+
+    def ensure_loaded(self):
+        if self._needs_load():
+            # One rebuild at a time; requests arriving meanwhile wait for it instead of starting another
+            with self._load_lock:
+                if self._needs_load():
+                    self.load()
+
+    def record(self, kind, owner_id, target_ids, removed=False):
+        """Apply added (or removed) FOLLOWS / LIKES / HASHTAGS rows once the current transaction commits."""
+        transaction.on_commit(partial(self._record, kind, owner_id, list(target_ids), removed))
+
+    def _record(self, kind, owner_id, target_ids, removed):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((kind, owner_id, target_ids, removed))
+            if self._graphs is not None:
+                self._apply(kind, owner_id, target_ids, removed)
+
+    def _apply(self, kind, owner_id, target_ids, removed):
+        edges = [(self._graphs[kind], owner_id, target_id) for target_id in target_ids]
+        if kind == HASHTAGS:
+            edges += [(self._graphs["hashtag_followers"], target_id, owner_id) for target_id in target_ids]
+        for graph, row, col in edges:
+            if removed:
+                graph.remove(row, col)
+            else:
+                graph.add(row, col)
+        user_ids = [owner_id] if kind == HASHTAGS else [owner_id, *target_ids]
+        self._max_user_id = max(self._max_user_id, *user_ids)
+
+    def suggest(self, user_id, limit=10):
+        """
+        Return up to `limit` suggestions for the user, best first, as dicts with the candidate's
+        "id", "score", "followed_by" (followed users who follow them) and "shared_hashtags".
+        """
+        self.ensure_loaded()
+        with self._lock:
+            if np is not None:
+                return self._suggest_vectorized(user_id, limit)
+            return self._suggest_loops(user_id, limit)
+
+    def _suggest_vectorized(self, user_id, limit):
+        graphs = self._graphs
+        # A user who registered after the last load has no id in the graph yet
+        size = max(self._max_user_id, user_id) + 1
+        follows = graphs[FOLLOWS].row(user_id)
+        followed_by = np.bincount(graphs[FOLLOWS].gather(follows)[1], minlength=size)
+        liked_by = np.bincount(graphs[FOLLOWS].gather(graphs[LIKES].row(user_id))[1], minlength=size)
+        lengths, hashtag_users = graphs["hashtag_followers"].gather(graphs[HASHTAGS].row(user_id))
+        shared = np.bincount(hashtag_users, minlength=size)
+        weights = np.repeat(1 / np.log2(2 + lengths), lengths)
+        scores = followed_by + LIKE_WEIGHT * liked_by + np.bincount(hashtag_users, weights=weights, minlength=size)
+        scores[user_id] = 0
+        scores[follows] = 0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            # Keep everything tied with the limit-th best score, so ties are cut by id below
+            cutoff = np.partition(scores[candidates], len(candidates) - limit)[len(candidates) - limit]
+            candidates = candidates[scores[candidates] >= cutoff]
+        # Best score first, ties by id
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))][:limit]
+        return [
+            {"id": int(candidate), "score": round(float(scores[candidate]), 3),
+             "followed_by": int(followed_by[candidate]), "shared_hashtags": int(shared[candidate])}
+            for candidate in candidates
+        ]
+
+    def _suggest_loops(self, user_id, limit):
+        graphs = self._graphs
+        follows = set(graphs[FOLLOWS].row(user_id))
+        followed_by, shared = defaultdict(int), defaultdict(int)
+        scores = defaultdict(float)
+        for candidate in graphs[FOLLOWS].gather(follows)[1]:
+            followed_by[candidate] += 1
+            scores[candidate] += 1
+        for candidate in graphs[FOLLOWS].gather(graphs[LIKES].row(user_id))[1]:
+            scores[candidate] += LIKE_WEIGHT
+        for hashtag_id in graphs[HASHTAGS].row(user_id):
+            users = graphs["hashtag_followers"].row(hashtag_id)
+            weight = 1 / math.log2(2 + len(users))
+            for candidate in users:
+                shared[candidate] += 1
+                scores[candidate] += weight
+        candidates = [candidate for candidate in scores if candidate != user_id and candidate not in follows]
+        candidates.sort(key=lambda candidate: (-scores[candidate], candidate))
+        return [
+            {"id": candidate, "score": round(scores[candidate], 3),
+             "followed_by": followed_by[candidate], "shared_hashtags": shared[candidate]}
+            for candidate in candidates[:limit]
+        ]
+
+
+follow_graph = FollowGraph()
+
+
+def warm():
+    """Build the in-memory follow graph. Called when a server process starts."""
+    from django.db import DatabaseError
+
+    try:
+        follow_graph.load()
+    except DatabaseError:
+        # Database not migrated yet; the graph loads lazily on first use
+        pass
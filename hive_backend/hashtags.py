@@ -0,0 +1,309 @@
+"""
+Hashtag resolution and autocomplete.
+
+Hashtag names are stored normalized (see ``Hashtag.normalize_name``) under a
+unique index; ``resolve_hashtags`` maps free-form names to ids in bulk.
+
+Each process keeps a sorted array of normalized hashtag names with their usage
+score (posts + followers). A prefix lookup is two bisections plus a top-k
+selection over the matching range; short, very common prefixes have their
+top-k memoized. The index is warmed at startup (see wsgi.py / asgi.py), updated
+incrementally by this process's committed writes, and reloaded every
+HASHTAG_AUTOCOMPLETE_RELOAD_SECONDS to pick up changes made by other processes.
+A reload runs in a background thread while requests keep reading the current
+index; writes committed during it are replayed on top of the new one.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Hashtag, Post, FollowedHashtags
+
+# Prefix ranges larger than this get their top results memoized
+RANGE_SCAN_LIMIT = 256
+# How many results are memoized per prefix (the largest `limit` served from the memo)
+MEMO_SIZE = 50
+RELOAD_SECONDS = getattr(settings, "HASHTAG_AUTOCOMPLETE_RELOAD_SECONDS", 300)
+
+
+class HashtagPrefixIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._reset([], {}, {})
+        self._journal = None  # Changes committed while a reload runs, replayed on top of it
+        self.loaded_at = None
+
+    def _reset(self, entries, names, scores):
+        self._entries = entries  # Sorted (normalized name, hashtag id) pairs
+        self._names = names  # Hashtag id -> display name
+        self._scores = scores  # Hashtag id -> posts + followers
+        self._memo = {}  # Prefix -> best hashtag ids, for large prefix ranges
+
+    def load(self):
+        """(Re)build the index from the database: one query per table."""
+        with self._load_lock:
+            self._load()
+
+    def _load(self):
+        with self._lock:
+            self._journal = []
+        try:
+            names, scores, entries = self._read()
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            self._reset(entries, names, scores)
+            # A score change committed before the count queries ran is counted twice: scores only rank
+            for change, args in self._journal:
+                change(*args)
+            self._journal = None
+            self.loaded_at = time.monotonic()
+
+    def _read(self):
+        post_counts = dict(
+            Post.hashtags.through.objects.values("hashtag_id").annotate(n=Count("pk")).values_list("hashtag_id", "n")
+        )
+        follower_counts = dict(
+            FollowedHashtags.objects.values("hashtag_id").annotate(n=Count("pk")).values_list("hashtag_id", "n")
+        )
+        names, scores, entries = {}, {}, []
+        for hashtag_id, name in Hashtag.objects.values_list("id", "name").iterator(chunk_size=10_000):
+            names[hashtag_id] = name
+            scores[hashtag_id] = post_counts.get(hashtag_id, 0) + follower_counts.get(hashtag_id, 0)
+            entries.append((Hashtag.normalize_name(name), hashtag_id))
+        entries.sort()
+        return names, scores, entries
+
+    def ensure_loaded(self):
+        if self.loaded_at is None:
+            # Not warmed at startup: load now, once; requests arriving meanwhile wait for it
+            with self._load_lock:
+                if self.loaded_at is None:
+                    self._load()
+        elif time.monotonic() - self.loaded_at > RELOAD_SECONDS and self._load_lock.acquire(blocking=False):
+            # Stale: keep serving the current index while a single background thread reloads it
+            threading.Thread(target=self._reload, daemon=True).start()
+
+    def _reload(self):
+        try:
+            self._load()
+        finally:
+            self._load_lock.release()
+            connections.close_all()
+
+    def _apply(self, change, *args):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((change, args))
+            change(*args)
+
+    def _forget_prefixes(self, key):
+        for end in range(len(key) + 1):
+            self._memo.pop(key[:end], None)
+
+    def add(self, hashtag_id, name):
+        """Insert a hashtag, or re-key it after a rename, once the current transaction commits."""
+        transaction.on_commit(partial(self._add, hashtag_id, name))
+
+    def _add(self, hashtag_id, name):
+        self._apply(self._insert, hashtag_id, name)
+
+    def _insert(self, hashtag_id, name):
+        self._discard(hashtag_id)
+        key = Hashtag.normalize_name(name)
+        insort(self._entries, (key, hashtag_id))
+        self._names[hashtag_id] = name
+        self._scores.setdefault(hashtag_id, 0)
+        self._forget_prefixes(key)
+
+    def _discard(self, hashtag_id):
+        name = self._names.pop(hashtag_id, None)
+        if name is None:
+            return
+        key = Hashtag.normalize_name(name)
+        index = bisect_left(self._entries, (key, hashtag_id))
+        if index < len(self._entries) and self._entries[index] == (key, hashtag_id):
+            del self._entries[index]
+        self._scores.pop(hashtag_id, None)
+        self._forget_prefixes(key)
+
+    def remove(self, hashtag_id):
+        transaction.on_commit(partial(self._remove, hashtag_id))
+
+    def _remove(self, hashtag_id):
+        self._apply(self._discard, hashtag_id)
+
+    def bump(self, hashtag_id, delta=1):
+        """
+        Change the usage score of a hashtag (a post or follower was added or removed) once the
+        current transaction commits, so a rolled-back write leaves the index as it was.
+        """
+        transaction.on_commit(partial(self._bump, hashtag_id, delta))
+
+    def _bump(self, hashtag_id, delta):
+        self._apply(self._rescore, hashtag_id, delta)
+
+    def _rescore(self, hashtag_id, delta):
+        if hashtag_id not in self._scores:
+            return
+        self._scores[hashtag_id] += delta
+        key = Hashtag.normalize_name(self._names[hashtag_id])
+        for end in range(len(key) + 1):
+            memo = self._memo.get(key[:end])
+            if memo is not None:
+                self._rerank(key[:end], memo, hashtag_id, delta)
+
+    def _rerank(self, prefix, memo, hashtag_id, delta):
+        """Keep a memoized top list valid after a score change instead of recomputing the whole range."""
+        if hashtag_id in memo:
+            if delta < 0:
+                # Something outside the memo may now rank higher
+                del self._memo[prefix]
+                return
+            candidates = memo
+        elif len(memo) < MEMO_SIZE or self._scores[hashtag_id] >= self._scores.get(memo[-1], 0):
+            candidates = memo + [hashtag_id]
+        else:
+            return
+        self._memo[prefix] = self._best(candidates, MEMO_SIZE)
+
+    def name(self, hashtag_id):
+        return self._names.get(hashtag_id)
+
+    def _best(self, ids, limit):
+        scores = self._scores
+        return heapq.nlargest(limit, ids, key=lambda hashtag_id: (scores.get(hashtag_id, 0), -hashtag_id))
+
+    def search(self, prefix, limit=10):
+        """Return up to `limit` (id, name) pairs whose normalized name starts with the prefix, most used first."""
+        self.ensure_loaded()
+        key = Hashtag.normalize_name(prefix)
+        entries = self._entries
+        start = bisect_left(entries, (key,))
+        end = bisect_left(entries, (key + "\U0010ffff",), start)
+        if end - start <= RANGE_SCAN_LIMIT or limit > MEMO_SIZE:
+            best = self._best((hashtag_id for _, hashtag_id in entries[start:end]), limit)
+        else:
+            best = self._memo.get(key)
+            if best is None:
+                best = self._memo[key] = self._best((hashtag_id for _, hashtag_id in entries[start:end]), MEMO_SIZE)
+            best = best[:limit]
+        return [(hashtag_id, self._names.get(hashtag_id)) for hashtag_id in best]
+
+
+hashtag_index = HashtagPrefixIndex()
+
+
+def warm():
+    """Load the in-memory hashtag index. Called when a server process starts."""
+    from django.db import DatabaseError
+
+    try:
+        hashtag_index.load()
+    except DatabaseError:
+        # Database not migrated yet; the index loads lazily on first use
+        pass
+
+
+def resolve_hashtags(names):
+    """
+    Return the ids of the hashtags with the given names, creating the missing ones.
+
+    Names are normalized and deduplicated, order is kept. Costs one query when
+    every hashtag exists, and one bulk insert plus one select for the new ones;
+    concurrent creators of the same name are absorbed by the unique index.
+    """
+    normalized = list(dict.fromkeys(name for name in map(Hashtag.normalize_name, names) if name))
+    if not normalized:
+        return []
+    ids = dict(Hashtag.objects.filter(name__in=normalized).values_list("name", "id"))
+    missing = [name for name in normalized if name not in ids]
+    if missing:
+        Hashtag.objects.bulk_create([Hashtag(name=name) for name in missing], ignore_conflicts=True)
+        created = dict(Hashtag.objects.filter(name__in=missing).values_list("name", "id"))
+        for name, hashtag_id in created.items():
+            hashtag_index.add(hashtag_id, name)
+        ids.update(created)
+    return [ids[name] for name in normalized]
+
+
+def set_post_hashtags(post, hashtag_ids, old_hashtag_ids=()):
+    """Replace the hashtags of a post with bulk deletes/inserts on the through table."""
+    through = Post.hashtags.through
+    hashtag_ids, old_hashtag_ids = set(hashtag_ids), set(old_hashtag_ids)
+    removed = old_hashtag_ids - hashtag_ids
+    added = hashtag_ids - old_hashtag_ids
+    if removed:
+        through.objects.filter(post_id=post.pk, hashtag_id__in=removed).delete()
+    if added:
+        through.objects.bulk_create(
+            [through(post_id=post.pk, hashtag_id=hashtag_id) for hashtag_id in added], ignore_conflicts=True,
+        )
+    for hashtag_id in added:
+        hashtag_index.bump(hashtag_id)
+    for hashtag_id in removed:
+        hashtag_index.bump(hashtag_id, -1)
+
+
+def merge_duplicate_hashtags(hashtag_model, post_model, followed_hashtags_model, user_stats_model):
+    """
+    Merge hashtags whose names normalize to the same value into the oldest one.
+
+    Posts and followers of the duplicates are repointed to the kept hashtag, which
+    is renamed to the normalized name, and the followed-hashtag counters of the
+    affected users are recounted. Takes the model classes as arguments so that
+    migrations can pass their historical models. Returns the number of merged
+    (deleted) hashtags.
+    """
+    groups = {}
+    for hashtag_id, name in hashtag_model.objects.order_by("id").values_list("id", "name").iterator():
+        groups.setdefault(Hashtag.normalize_name(name), []).append((hashtag_id, name))
+
+    through = post_model.hashtags.through
+    merged = 0
+    affected_users = set()
+    for name, members in groups.items():
+        keep_id = members[0][0]
+        duplicate_ids = [hashtag_id for hashtag_id, _ in members[1:]]
+        if duplicate_ids:
+            post_ids = set(through.objects.filter(hashtag_id__in=duplicate_ids).values_list("post_id", flat=True))
+            through.objects.bulk_create(
+                [through(post_id=post_id, hashtag_id=keep_id) for post_id in post_ids], ignore_conflicts=True,
+            )
+            through.objects.filter(hashtag_id__in=duplicate_ids).delete()
+
+            user_ids = set(
+                followed_hashtags_model.objects.filter(hashtag_id__in=duplicate_ids)
+                .values_list("user_id", flat=True)
+            )
+            followed_hashtags_model.objects.bulk_create(
+                [followed_hashtags_model(user_id=user_id, hashtag_id=keep_id) for user_id in user_ids],
+                ignore_conflicts=True,
+            )
+            followed_hashtags_model.objects.filter(hashtag_id__in=duplicate_ids).delete()
+            affected_users |= user_ids
+
+            hashtag_model.objects.filter(id__in=duplicate_ids).delete()
+            merged += len(duplicate_ids)
+        if members[0][1] != name:
+            hashtag_model.objects.filter(id=keep_id).update(name=name)
+
+    if affected_users:
+        follow_count = (
+            followed_hashtags_model.objects.filter(user_id=OuterRef("user_id"))
+            .values("user_id").annotate(n=Count("pk")).values("n")
+        )
+        user_stats_model.objects.filter(user_id__in=affected_users).update(
+            followed_hashtags_count=Coalesce(Subquery(follow_count), 0)
+        )
+    return merged
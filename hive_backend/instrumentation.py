@@ -0,0 +1,253 @@
+"""
+Request-level performance instrumentation.
+
+performance_middleware records for every request its wall time, the number and
+time of database queries, the time spent authenticating (CachedJWTAuthentication)
+and serializing (TimedSerializerMixin) and the response size. The timings are
+returned in a Server-Timing header, which browser dev tools show per request:
+
+    Server-Timing: db;dur=4.1;desc="3 queries", auth;dur=0.2, serialize;dur=1.9, total;dur=9.7
+
+The spans overlap: a lazy query made while serializing counts into both db and
+serialize. Per route (URL name) and method the values are aggregated into
+histograms and counters of this process, exposed in the Prometheus text format
+on /metrics (metrics_view).
+
+Queries are timed by an execute wrapper installed on every database connection
+as it opens; the per-request state lives in a context variable, so requests
+without the middleware (management commands, signals) pay one lookup per query.
+"""
+import contextvars
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_current = contextvars.ContextVar("hive_request_timings", default=None)
+
+
+class Timings:
+    """Accumulated spans (seconds) of one request."""
+
+    __slots__ = ("db", "queries", "auth", "serialize", "serializing")
+
+    def __init__(self):
+        self.db = 0.0
+        self.queries = 0
+        self.auth = 0.0
+        self.serialize = 0.0
+        self.serializing = False
+
+    def server_timing(self, total):
+        return (
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries", auth;dur={self.auth * 1000:.1f}, '
+            f'serialize;dur={self.serialize * 1000:.1f}, total;dur={total * 1000:.1f}'
+        )
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += perf_counter() - start
+        timings.queries += 1
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # connection_created fires again when a closed connection reconnects
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+@contextmanager
+def timed_auth():
+    """Add the time spent in the block to the current request's auth span."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings.auth += perf_counter() - start
+
+
+class TimedSerializerMixin:
+    """Add the serializer's to_representation time to the current request (outermost serializer only)."""
+
+    def to_representation(self, instance):
+        timings = _current.get()
+        if timings is None or timings.serializing:
+            return super().to_representation(instance)
+        timings.serializing = True
+        start = perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            timings.serializing = False
+            timings.serialize += perf_counter() - start
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            label_text = _labels(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{{{_labels(labels)}}} {_number(value)}")
+        return lines
+
+
+def _number(value):
+    return int(value) if float(value).is_integer() else round(value, 6)
+
+
+def _labels(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+
+class Metrics:
+    """Per-route aggregates of this process. Labels are (("route", ...), ("method", ...)) tuples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter("hive_requests_total", "Requests by route, method and status code.")
+        self.duration = Histogram("hive_request_duration_seconds", "Request wall time.", DURATION_BUCKETS)
+        self.queries = Histogram("hive_request_db_queries", "Database queries per request.", QUERY_BUCKETS)
+        self.size = Histogram("hive_response_size_bytes", "Response body size (streaming responses excluded).",
+                              SIZE_BUCKETS)
+        self.db = Counter("hive_request_db_seconds_total", "Time spent in database queries.")
+        self.auth = Counter("hive_request_auth_seconds_total", "Time spent authenticating.")
+        self.serialize = Counter("hive_request_serialize_seconds_total", "Time spent in serializers.")
+
+    def observe(self, route, method, status, timings, total, size):
+        labels = (("route", route), ("method", method))
+        with self._lock:
+            self.requests.inc(labels + (("status", str(status)),))
+            self.duration.observe(labels, total)
+            self.queries.observe(labels, timings.queries)
+            if size is not None:
+                self.size.observe(labels, size)
+            self.db.inc(labels, timings.db)
+            self.auth.inc(labels, timings.auth)
+            self.serialize.inc(labels, timings.serialize)
+
+    def _metrics(self):
+        return (self.requests, self.duration, self.queries, self.size, self.db, self.auth, self.serialize)
+
+    def render(self):
+        with self._lock:
+            lines = [line for metric in self._metrics() for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            for metric in self._metrics():
+                metric.series.clear()
+
+
+metrics = Metrics()
+
+
+def _route(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        # Unresolved paths share one series, so scanning for URLs cannot grow the metrics without bound
+        return "unmatched"
+    return match.view_name or match.route
+
+
+def _finish(request, response, timings, start):
+    total = perf_counter() - start
+    size = None if response.streaming else len(response.content)
+    if getattr(settings, "SERVER_TIMING_HEADER", True):
+        response["Server-Timing"] = timings.server_timing(total)
+    metrics.observe(_route(request), request.method, response.status_code, timings, total, size)
+
+
+@sync_and_async_middleware
+def performance_middleware(get_response):
+    """Time the request (see module docstring); place it first in MIDDLEWARE so the total covers everything."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            timings = Timings()
+            token = _current.set(timings)
+            start = perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            _finish(request, response, timings, start)
+            return response
+    else:
+        def middleware(request):
+            timings = Timings()
+            token = _current.set(timings)
+            start = perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            _finish(request, response, timings, start)
+            return response
+    return middleware
+
+
+def metrics_view(request):
+    """Prometheus text format metrics of this process, for staff sessions and METRICS_ALLOWED_IPS."""
+    allowed = getattr(settings, "METRICS_ALLOWED_IPS", [])
+    user = getattr(request, "user", None)
+    if request.META.get("REMOTE_ADDR") not in allowed and not (user is not None and user.is_staff):
+        raise PermissionDenied
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
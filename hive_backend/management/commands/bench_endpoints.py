@@ -0,0 +1,226 @@
+import gc
+import json
+import subprocess
+import time
+from itertools import count
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from hive_backend import datagen
+from hive_backend.benchmark import scratch_database, summarize
+from hive_backend.cooccurrence import hashtag_cooccurrence
+from hive_backend.models import CustomUser, FollowedUsers
+from hive_backend.urls import router
+
+# Dataset sizes: arguments of datagen.generate
+SIZES = {
+    "small": dict(users=200, hashtags=100, posts=2_000, liked_posts=5_000, liked_users=1_000,
+                  followed_users=2_000, followed_hashtags=500),
+    "medium": dict(users=2_000, hashtags=500, posts=20_000, liked_posts=50_000, liked_users=10_000,
+                   followed_users=20_000, followed_hashtags=5_000),
+    "large": dict(users=10_000, hashtags=2_000, posts=100_000, liked_posts=300_000, liked_users=50_000,
+                  followed_users=100_000, followed_hashtags=30_000),
+}
+
+# Query strings for routes that need one
+PARAMS = {
+    "post-search-posts": "?q=sauna",
+    "hashtag-search-hashtags": "?q=tag1&autocomplete=1",
+}
+
+# Most queries an endpoint may run, whatever the dataset size (authentication included)
+QUERY_BUDGETS = {
+    "user-list": 3,
+    "user-detail": 3,
+    "user-get-me": 3,
+    "user-mentions": 4,
+    "user-unread-mentions": 1,
+    "user-suggestions": 1,
+    "post-list": 3,
+    "post-detail": 4,
+    "post-search-posts": 4,
+    "hashtag-list": 1,
+    "hashtag-detail": 1,
+    "hashtag-search-hashtags": 0,
+    "hashtag-related": 2,
+    "hashtag-trending": 1,
+    "liked-user-list": 1,
+    "liked-user-detail": 1,
+    "followed-hashtag-list": 1,
+    "followed-hashtag-detail": 1,
+    "followed-hashtag-get-my-followed": 1,
+    "liked-post-list": 1,
+    "liked-post-detail": 1,
+    "liked-post-get-my-likes": 1,
+    "followed-user-list": 1,
+    "followed-user-detail": 1,
+    "followed-user-get-my-followed-users": 1,
+    "timeline-list": 4,
+    "token-obtain": 2,
+    "registration": 5,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every GET route of the API router plus token obtain and registration on seeded scratch "
+        "datasets. Records p50/p95 latency, query count and response size as JSON, and fails when an "
+        "endpoint exceeds its query budget or its p95 regresses past --threshold against --baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="small,medium", help=f"Comma separated: {', '.join(SIZES)}")
+        parser.add_argument("--repeat", type=int, default=30, help="Timed requests per endpoint")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", default="bench_endpoints.json", help="Where to write the results")
+        parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+        parser.add_argument("--threshold", type=float, default=0.25, help="Allowed p95 regression (0.25 = +25%%)")
+        parser.add_argument(
+            "--min-regression-ms", type=float, default=2.0,
+            help="Ignore p95 regressions smaller than this many milliseconds (timer noise)",
+        )
+
+    def handle(self, *args, **options):
+        sizes = [size.strip() for size in options["sizes"].split(",") if size.strip()]
+        unknown = [size for size in sizes if size not in SIZES]
+        if unknown:
+            raise CommandError(f"Unknown sizes: {', '.join(unknown)}")
+        results = {"created_at": timezone.now().isoformat(), "commit": self.git_commit(), "sizes": {}}
+        for size in sizes:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Dataset {size}"))
+            with scratch_database():
+                datagen.generate(seed=options["seed"], **SIZES[size])
+                # Requests only start a background load; time /related/ on the full index
+                hashtag_cooccurrence.load()
+                results["sizes"][size] = self.run_size(options["repeat"])
+
+        failures = self.check_budgets(results)
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as baseline:
+                failures += self.compare(
+                    json.load(baseline), results, options["threshold"], options["min_regression_ms"]
+                )
+        results["failures"] = failures
+        with open(options["output"], "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+        if failures:
+            for failure in failures:
+                self.stderr.write(failure)
+            raise CommandError(f"{len(failures)} benchmark check(s) failed.")
+        self.stdout.write(self.style.SUCCESS("All endpoints within budget."))
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def endpoints(self):
+        """(name, method, path, body) for every GET route of the router, token obtain and registration."""
+        for prefix, viewset, basename in router.registry:
+            if hasattr(viewset, "list"):
+                yield f"{basename}-list", "get", reverse(f"{basename}-list"), None
+            # Detail routes (retrieve and detail actions) run on the first seeded row
+            first = None
+            if viewset.queryset is not None:
+                first = viewset.queryset.model.objects.order_by("pk").values_list("pk", flat=True).first()
+            if hasattr(viewset, "retrieve") and first is not None:
+                yield f"{basename}-detail", "get", reverse(f"{basename}-detail", args=[first]), None
+            for action in viewset.get_extra_actions():
+                if "get" not in action.mapping:
+                    continue
+                name = f"{basename}-{action.url_name}"
+                if not action.detail:
+                    yield name, "get", reverse(name) + PARAMS.get(name, ""), None
+                elif first is not None:
+                    yield name, "get", reverse(name, args=[first]) + PARAMS.get(name, ""), None
+                else:
+                    raise CommandError(f"{name}: no seeded row to request the detail route with")
+        yield "token-obtain", "post", reverse("token_obtain_pair"), lambda n: {
+            "username": self.user.username, "password": datagen.DEFAULT_PASSWORD,
+        }
+        yield "registration", "post", reverse("user-registration"), lambda n: {
+            "username": f"bench{n}", "email": f"bench{n}@example.com", "password": "bench-password-1",
+        }
+
+    def run_size(self, repeat):
+        # The most active follower: a non-trivial timeline and follow lists
+        follower = (
+            FollowedUsers.objects.values("follower_id").annotate(n=Count("pk")).order_by("-n").first()
+        )
+        self.user = CustomUser.objects.get(pk=follower["follower_id"])
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        serial = count()
+        results = {}
+        for name, method, path, body in self.endpoints():
+            def request():
+                # Measure the full response, not the conditional GET cache (see caching.py)
+                cache.clear()
+                data = body(next(serial)) if body else None
+                if method == "get":
+                    return client.get(path)
+                return client.post(path, data, content_type="application/json")
+
+            request()  # Warm-up: in-memory indexes, authentication cache
+            # Counted with an execute wrapper: the test client's request_started resets connection.queries
+            queries = []
+            with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+                response = request()
+            if response.status_code >= 400:
+                raise CommandError(f"{name} {path}: HTTP {response.status_code} {response.content[:200]!r}")
+            samples = []
+            # Collector pauses would land in random samples and make p95 comparisons flaky
+            gc.collect()
+            gc.disable()
+            try:
+                for _ in range(repeat):
+                    cache.clear()
+                    start = time.perf_counter()
+                    request()
+                    samples.append((time.perf_counter() - start) * 1000)
+            finally:
+                gc.enable()
+            results[name] = {
+                "method": method.upper(), "path": path, "queries": len(queries),
+                "budget": QUERY_BUDGETS.get(name), "bytes": len(response.content), **summarize(samples),
+            }
+            self.stdout.write(
+                f"{name:<40} {results[name]['p50_ms']:>8.2f} ms p50 {results[name]['p95_ms']:>8.2f} ms p95 "
+                f"{len(queries):>3} queries {len(response.content):>8} B"
+            )
+        return results
+
+    def check_budgets(self, results):
+        failures = []
+        for size, endpoints in results["sizes"].items():
+            for name, result in endpoints.items():
+                if result["budget"] is None:
+                    failures.append(f"[{size}] {name}: no query budget declared (ran {result['queries']})")
+                elif result["queries"] > result["budget"]:
+                    failures.append(f"[{size}] {name}: {result['queries']} queries, budget {result['budget']}")
+        return failures
+
+    def compare(self, baseline, results, threshold, min_regression_ms):
+        failures = []
+        for size, endpoints in results["sizes"].items():
+            for name, result in endpoints.items():
+                previous = baseline.get("sizes", {}).get(size, {}).get(name)
+                if previous is None:
+                    continue
+                limit = previous["p95_ms"] * (1 + threshold)
+                if result["p95_ms"] > limit and result["p95_ms"] - previous["p95_ms"] >= min_regression_ms:
+                    failures.append(
+                        f"[{size}] {name}: p95 {result['p95_ms']:.2f} ms, baseline {previous['p95_ms']:.2f} ms "
+                        f"(limit +{threshold:.0%})"
+                    )
+        return failures
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, OperationalError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from hive_backend.benchmark import scratch_database, summarize
+from hive_backend.models import Post
+from hive_backend.views import PostViewSet
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test: concurrent likes on one hot post versus likes spread over many posts, "
+        "through PostViewSet.like_post on a scratch SQLite database in WAL mode."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--likes-per-thread", type=int, default=50)
+
+    def handle(self, *args, **options):
+        threads, per_thread = options["threads"], options["likes_per_thread"]
+        with scratch_database():
+            if connection.vendor == "sqlite":
+                with connection.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode=WAL")
+            author = User.objects.create_user("author")
+            users = User.objects.bulk_create([User(username=f"liker{i}") for i in range(threads * per_thread)])
+            posts = Post.objects.bulk_create([Post(user=author, text=f"post {i}") for i in range(len(users) + 1)])
+            connection.close()
+
+            hot = self.run_burst(users, [posts[0]] * len(users), threads)
+            spread = self.run_burst(users, posts[1:], threads)
+            self.report("hot post", hot)
+            self.report("spread", spread)
+            like_count = Post.objects.get(pk=posts[0].pk).like_count
+            self.stdout.write(f"Hot post like_count={like_count}, expected {len(users) - hot['errors']}")
+
+    def run_burst(self, users, posts, threads):
+        """Each thread likes its share of (user, post) pairs as fast as it can; all threads start together."""
+        view = PostViewSet.as_view({"post": "like_post"})
+        factory = APIRequestFactory()
+        barrier = threading.Barrier(threads)
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def worker(pairs):
+            local_latencies, local_errors = [], 0
+            barrier.wait()
+            for user, post in pairs:
+                request = factory.post(f"/posts/{post.pk}/like/")
+                force_authenticate(request, user=user)
+                start = time.perf_counter()
+                try:
+                    response = view(request, pk=post.pk)
+                    if response.status_code != 201:
+                        local_errors += 1
+                except OperationalError:  # "database is locked"
+                    local_errors += 1
+                local_latencies.append((time.perf_counter() - start) * 1000)
+            connections.close_all()
+            with lock:
+                latencies.extend(local_latencies)
+                errors.append(local_errors)
+
+        pairs = list(zip(users, posts))
+        workers = [threading.Thread(target=worker, args=(pairs[i::threads],)) for i in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return {"likes": len(pairs), "seconds": elapsed, "errors": sum(errors), "latency": summarize(latencies)}
+
+    def report(self, label, result):
+        self.stdout.write(
+            f"{label:>8}: {result['likes']} likes in {result['seconds']:.2f}s "
+            f"({result['likes'] / result['seconds']:.0f}/s), errors={result['errors']}, latency {result['latency']}"
+        )
@@ -0,0 +1,57 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from hive_backend import search
+from hive_backend.benchmark import scratch_database, measure, summarize
+from hive_backend.models import Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Compare post search latency of the FTS5 index against a LIKE scan on a scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1_000_000, help="Number of synthetic posts.")
+        parser.add_argument("--queries", type=int, default=20, help="Repetitions per search term.")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        # Zipf-like vocabulary so there are both very common and very rare terms
+        vocabulary = [f"word{i}" for i in range(50_000)]
+        weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+        with scratch_database() as connection:
+            if not search.fts_available():
+                raise CommandError("The database has no FTS5 index (SQLite with FTS5 is required).")
+
+            user = User.objects.create_user("bench", password="benchmark")
+            self.stdout.write(f"Inserting {options['posts']} posts...")
+            batch = []
+            for i in range(options["posts"]):
+                words = rng.choices(vocabulary, weights=weights, k=12)
+                batch.append(Post(user=user, text=" ".join(words)[:144]))
+                if len(batch) == 10_000:
+                    Post.objects.bulk_create(batch)
+                    batch = []
+            Post.objects.bulk_create(batch)
+
+            # The query each method runs for the first page of /posts/?search=
+            page = Post.objects.order_by("-time", "-id")
+            terms = {"common": vocabulary[0], "medium": vocabulary[500], "rare": vocabulary[-1]}
+            for label, term in terms.items():
+                like = summarize(measure(
+                    lambda: list(page.filter(text__icontains=term).values_list("id", flat=True)[:21]),
+                    options["queries"],
+                ))
+                fts = summarize(measure(
+                    lambda: list(search.filter_posts(page, term).values_list("id", flat=True)[:21]),
+                    options["queries"],
+                ))
+                ranked = summarize(measure(lambda: search.ranked_post_ids(term, 20), options["queries"]))
+                self.stdout.write(
+                    f"{label:>6} term '{term}': LIKE {like}, FTS5 {fts}, FTS5 ranked {ranked}"
+                )
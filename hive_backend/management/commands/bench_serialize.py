@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from rest_framework.renderers import JSONRenderer
+
+from hive_backend import datagen, renderers
+from hive_backend.benchmark import scratch_database, measure, summarize
+from hive_backend.fastpath import PostValuesSerializer
+from hive_backend.models import LikedPosts, Post
+from hive_backend.serializers import PostSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare serialize and render time of a /posts/ list page per 1000 posts: PostSerializer against "
+        "the .values() fast path, with JSONRenderer and FastJSONRenderer. The queries are not timed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1000, help="Posts on the serialized page.")
+        parser.add_argument("--repeat", type=int, default=20, help="Timed runs per variant.")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        count = options["posts"]
+        per_1000 = 1000 / count
+        with scratch_database():
+            datagen.generate(
+                users=max(count // 10, 10), hashtags=200, posts=count, liked_posts=count * 2,
+                liked_users=0, followed_users=0, followed_hashtags=0, seed=options["seed"],
+            )
+            reader_id = LikedPosts.objects.values_list("user_id", flat=True).first()
+            # The page PostViewSet.list serves to a signed-in user, fetched once up front
+            page = Post.objects.order_by("-time", "-id").annotate(liked_by_me=Exists(
+                LikedPosts.objects.filter(user_id=reader_id, post=OuterRef("pk"))
+            ))
+            posts = list(page.select_related("user").prefetch_related("hashtags", "references")[:count])
+            fast = PostValuesSerializer()
+            rows = list(fast.values(page)[:count])
+            fast.load(rows)
+
+            serializers = {
+                "PostSerializer": lambda: PostSerializer(posts, many=True).data,
+                "fast path": lambda: fast.to_representation(rows),
+            }
+            json_renderers = {"JSONRenderer": JSONRenderer()}
+            if renderers.orjson is not None:
+                json_renderers["FastJSONRenderer"] = renderers.FastJSONRenderer()
+            else:
+                self.stdout.write("orjson is not installed, so FastJSONRenderer would render like JSONRenderer.")
+
+            self.stdout.write(f"Milliseconds per 1000 posts (p50), from {count} posts x {options['repeat']} runs:")
+            baseline = None
+            for serializer_name, serialize in serializers.items():
+                data = serialize()
+                serialize_ms = summarize(measure(serialize, options["repeat"]))["p50_ms"] * per_1000
+                for renderer_name, renderer in json_renderers.items():
+                    render_ms = summarize(measure(lambda: renderer.render(data), options["repeat"]))["p50_ms"] * per_1000
+                    total = serialize_ms + render_ms
+                    baseline = baseline or total
+                    self.stdout.write(
+                        f"{serializer_name:>14} + {renderer_name:<16} serialize {serialize_ms:8.2f}, "
+                        f"render {render_ms:7.2f}, total {total:8.2f} ({baseline / total:.1f}x)"
+                    )
@@ -0,0 +1,65 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory
+
+from hive_backend.benchmark import measure, scratch_database, summarize
+from hive_backend.models import Hashtag, LikedUsers, FollowedHashtags, UserStats
+from hive_backend.views import CustomTokenObtainPairView
+
+User = get_user_model()
+
+PASSWORD = "bench-password-1"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark /api/token/ for a power user: the compact login response versus the legacy "
+        "?expand=full one (latency, throughput, queries and response size) on a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=200)
+        parser.add_argument("--liked-users", type=int, default=2000, help="Users the power user has liked")
+        parser.add_argument("--followed-hashtags", type=int, default=200)
+        parser.add_argument(
+            "--fast-hasher", action="store_true",
+            help="Hash passwords with MD5 so the numbers show the response cost rather than password hashing",
+        )
+
+    def handle(self, *args, **options):
+        hashers = ["django.contrib.auth.hashers.MD5PasswordHasher"] if options["fast_hasher"] else None
+        with override_settings(**({"PASSWORD_HASHERS": hashers} if hashers else {})), scratch_database():
+            self.populate(options["liked_users"], options["followed_hashtags"])
+            for label, path in (("compact", "/api/token/"), ("expand=full", "/api/token/?expand=full")):
+                self.report(label, path, options["logins"])
+
+    def populate(self, liked_users, followed_hashtags):
+        self.power_user = User.objects.create_user("power", email="power@example.com", password=PASSWORD)
+        others = User.objects.bulk_create([User(username=f"user{i}") for i in range(liked_users)])
+        hashtags = Hashtag.objects.bulk_create([Hashtag(name=f"tag{i}") for i in range(followed_hashtags)])
+        LikedUsers.objects.bulk_create([LikedUsers(liker=self.power_user, liked_user=user) for user in others])
+        FollowedHashtags.objects.bulk_create([FollowedHashtags(user=self.power_user, hashtag=tag) for tag in hashtags])
+        UserStats.objects.rebuild()
+
+    def report(self, label, path, logins):
+        view = CustomTokenObtainPairView.as_view()
+        factory = APIRequestFactory()
+        body = {"username": "power", "password": PASSWORD}
+
+        def login():
+            response = view(factory.post(path, body, format="json"))
+            assert response.status_code == 200, response.data
+            return response
+
+        with CaptureQueriesContext(connection) as queries:
+            response = login()
+        size = len(json.dumps(response.data))
+        samples = measure(login, logins)
+        self.stdout.write(
+            f"{label:>12}: {len(queries)} queries, {size} bytes, "
+            f"{1000 * len(samples) / sum(samples):.0f} logins/s, latency {summarize(samples)}"
+        )
@@ -0,0 +1,26 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from hive_backend.cooccurrence import CooccurrenceMatrix, FILE
+
+
+class Command(BaseCommand):
+    help = (
+        "Count which hashtags appear on the same posts and write the co-occurrence index file served by "
+        "/hashtags/{id}/related/. Running server processes pick the new file up within a minute."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=FILE, help=f"File to write (default: {FILE})")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        matrix = CooccurrenceMatrix.build()
+        built = time.perf_counter() - start
+        matrix.save(options["output"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Counted {matrix.posts} hashtagged posts and {len(matrix.neighbours) // 2} hashtag pairs "
+            f"in {built:.1f} s; wrote {os.path.getsize(options['output'])} bytes to {options['output']}."
+        ))
@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hive_backend import export
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream posts and the social graph (likes, follows) as newline-delimited JSON. The last line is "
+        "a watermark; pass its `since` value with --since to export only newer rows next time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tables", default="", help=f"Comma separated subset of: {', '.join(export.TABLES)}")
+        parser.add_argument("--since", default="", help="Watermark from the previous export")
+        parser.add_argument("--output", default="-", help="File to write (default: stdout)")
+        parser.add_argument("--chunk-size", type=int, default=export.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        try:
+            tables = export.parse_tables(options["tables"])
+            lines = export.iter_ndjson(tables, options["since"], options["chunk_size"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        output = sys.stdout if options["output"] == "-" else open(options["output"], "w", encoding="utf-8")
+        try:
+            for line in lines:
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
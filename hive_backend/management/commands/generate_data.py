@@ -0,0 +1,78 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from hive_backend import datagen
+from hive_backend.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the configured database with a reproducible synthetic dataset (users, hashtags, posts, likes, "
+        "follows) using bulk inserts and power-law activity. The same --seed and --end on an empty database "
+        "give the same rows. Counters, timelines and the search index are rebuilt at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--hashtags", type=int, default=2_000)
+        parser.add_argument("--posts", type=int, default=100_000)
+        parser.add_argument("--liked-posts", type=int, default=300_000)
+        parser.add_argument("--liked-users", type=int, default=50_000)
+        parser.add_argument("--followed-users", type=int, default=100_000)
+        parser.add_argument("--followed-hashtags", type=int, default=30_000)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--alpha", type=float, default=1.1, help="Power-law exponent of popularity")
+        parser.add_argument("--days", type=int, default=30, help="Posts are spread over this many past days")
+        parser.add_argument(
+            "--end",
+            help="Time of the newest post, ISO 8601 (default: now). Fix it for a reproducible dataset.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--password", default=datagen.DEFAULT_PASSWORD, help="Password of every generated user")
+
+    def handle(self, *args, **options):
+        if options["users"] < 1:
+            raise CommandError("--users must be at least 1.")
+        for name in ("hashtags", "posts", "liked_posts", "liked_users", "followed_users", "followed_hashtags", "days"):
+            if options[name] < 0:
+                raise CommandError(f"--{name.replace('_', '-')} cannot be negative.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        # Likes and follows are drawn from the generated posts and hashtags
+        if options["liked_posts"] > 0 and options["posts"] < 1:
+            raise CommandError("--liked-posts needs posts: set --posts to at least 1, or --liked-posts 0.")
+        if options["followed_hashtags"] > 0 and options["hashtags"] < 1:
+            raise CommandError(
+                "--followed-hashtags needs hashtags: set --hashtags to at least 1, or --followed-hashtags 0."
+            )
+        end = None
+        if options["end"]:
+            try:
+                end = parse_datetime(options["end"])
+            except ValueError:
+                end = None
+            if end is None:
+                raise CommandError(f"--end is not an ISO 8601 datetime: {options['end']!r}")
+            if timezone.is_naive(end):
+                end = timezone.make_aware(end)
+        if Post.objects.exists():
+            self.stdout.write(self.style.WARNING(
+                "The database already has posts: the new rows are added to them, and ids will differ from "
+                "a run on an empty database."
+            ))
+        started = time.perf_counter()
+
+        def log(message):
+            self.stdout.write(f"[{time.perf_counter() - started:7.1f}s] {message}")
+
+        datagen.generate(
+            users=options["users"], hashtags=options["hashtags"], posts=options["posts"],
+            liked_posts=options["liked_posts"], liked_users=options["liked_users"],
+            followed_users=options["followed_users"], followed_hashtags=options["followed_hashtags"],
+            seed=options["seed"], batch_size=options["batch_size"], alpha=options["alpha"],
+            days=options["days"], end=end, password=options["password"], log=log,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s."))
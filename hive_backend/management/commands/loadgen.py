@@ -0,0 +1,99 @@
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from hive_backend.benchmark import summarize
+
+User = get_user_model()
+
+DEFAULT_PATHS = "/posts/,/users/me/,/hashtags/search/?q=a"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load generator for a running server: fires GET requests at increasing concurrency levels and "
+        "reports throughput and latency, e.g. to compare the WSGI server with the ASGI one "
+        "(HIVE_ASYNC_VIEWS=1 uvicorn hive_backend.asgi:application). See ReadMe.txt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the server")
+        parser.add_argument("--paths", default=DEFAULT_PATHS, help="Comma separated paths, requested in turn")
+        parser.add_argument("--concurrency", default="1,8,32,64", help="Comma separated numbers of clients")
+        parser.add_argument("--duration", type=float, default=10, help="Seconds per concurrency level")
+        parser.add_argument(
+            "--username",
+            help="Send a bearer token for this user of the configured database (the server must share "
+                 "its SECRET_KEY). Defaults to the first active user.",
+        )
+
+    def handle(self, *args, **options):
+        base = urlsplit(options["url"])
+        if base.scheme != "http" or not base.hostname:
+            raise CommandError("--url must be an http:// URL")
+        paths = [path.strip() for path in options["paths"].split(",") if path.strip()]
+        users = User.objects.filter(is_active=True).order_by("id")
+        if options["username"]:
+            users = users.filter(username=options["username"])
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to authenticate as; create one or pass --username.")
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+
+        self.stdout.write(f"{base.geturl()} as {user.username}: {', '.join(paths)}")
+        for clients in [int(value) for value in options["concurrency"].split(",")]:
+            result = self.run_level(base, paths, headers, clients, options["duration"])
+            self.stdout.write(
+                f"{clients:>4} clients: {result['requests'] / result['seconds']:8.1f} req/s, "
+                f"errors={result['errors']}, latency {result['latency']}"
+            )
+
+    def run_level(self, base, paths, headers, clients, duration):
+        """Each client loops over the paths on its own keep-alive connection until the time is up."""
+        latencies, errors = [], []
+        lock = threading.Lock()
+        barrier = threading.Barrier(clients + 1)
+        deadline = []
+
+        def client(offset):
+            connection = http.client.HTTPConnection(base.hostname, base.port or 80, timeout=60)
+            local_latencies, local_errors, index = [], 0, offset
+            barrier.wait()
+            while time.perf_counter() < deadline[0]:
+                start = time.perf_counter()
+                try:
+                    connection.request("GET", paths[index % len(paths)], headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        local_errors += 1
+                except (OSError, http.client.HTTPException):
+                    local_errors += 1
+                    connection.close()
+                local_latencies.append((time.perf_counter() - start) * 1000)
+                index += 1
+            connection.close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors.append(local_errors)
+
+        workers = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        for thread in workers:
+            thread.start()
+        deadline.append(time.perf_counter() + duration)
+        start = time.perf_counter()
+        barrier.wait()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return {
+            "requests": len(latencies),
+            "seconds": elapsed,
+            "errors": sum(errors),
+            "latency": summarize(latencies) if latencies else {},
+        }
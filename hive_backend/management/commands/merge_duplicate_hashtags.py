@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from hive_backend.hashtags import hashtag_index, merge_duplicate_hashtags
+from hive_backend.models import Hashtag, Post, FollowedHashtags, UserStats
+
+
+class Command(BaseCommand):
+    help = "Merge hashtags whose names differ only by case or a leading '#', and normalize their names."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            merged = merge_duplicate_hashtags(Hashtag, Post, FollowedHashtags, UserStats)
+        hashtag_index.load()
+        self.stdout.write(self.style.SUCCESS(f"Merged {merged} duplicate hashtags."))
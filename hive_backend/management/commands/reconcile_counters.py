@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from hive_backend.models import Post, LikedPosts, UserStats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized counters (UserStats, Post.like_count) from the source tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows recounted per batch.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        rebuilt = UserStats.objects.rebuild(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {rebuilt} users."))
+
+        likes = LikedPosts.objects.filter(post_id=OuterRef("pk")).values("post_id").annotate(n=Count("pk")).values("n")
+        last_id = Post.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        for start in range(0, last_id, batch_size):
+            Post.objects.filter(pk__gt=start, pk__lte=start + batch_size).update(
+                like_count=Coalesce(Subquery(likes), 0)
+            )
+        self.stdout.write(self.style.SUCCESS("Rebuilt post like counts."))
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_stats(apps, schema_editor):
+    # Existing users get their rows here, instead of a lazy per-user rebuild on their first request
+    User = apps.get_model('hive_backend', 'CustomUser')
+    UserStats = apps.get_model('hive_backend', 'UserStats')
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id) for user_id in User.objects.values_list('pk', flat=True)], batch_size=1000,
+    )
+    counters = {
+        'posts_count': ('Post', 'user'),
+        'liked_users_count': ('LikedUsers', 'liker'),
+        'liked_by_count': ('LikedUsers', 'liked_user'),
+        'liked_posts_count': ('LikedPosts', 'user'),
+        'followed_hashtags_count': ('FollowedHashtags', 'user'),
+    }
+    for field, (model_name, owner) in counters.items():
+        rows = apps.get_model('hive_backend', model_name).objects.filter(**{owner: OuterRef('user_id')})
+        counts = rows.values(owner).annotate(n=Count('pk')).values('n')
+        UserStats.objects.update(**{field: Coalesce(Subquery(counts), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hive_backend', '0002_followedusers_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('liked_users_count', models.PositiveIntegerField(default=0)),
+                ('liked_by_count', models.PositiveIntegerField(default=0)),
+                ('liked_posts_count', models.PositiveIntegerField(default=0)),
+                ('followed_hashtags_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hive_backend', '0003_userstats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-time', '-id'], name='post_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', '-time', '-id'], name='post_user_time_id_idx'),
+        ),
+    ]
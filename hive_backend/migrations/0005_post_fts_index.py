@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from hive_backend import search
+
+
+def create_fts_index(apps, schema_editor):
+    search.create_index(schema_editor.connection)
+
+
+def drop_fts_index(apps, schema_editor):
+    search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hive_backend', '0004_post_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
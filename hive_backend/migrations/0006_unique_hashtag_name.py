@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:16
+
+from django.db import migrations, models
+
+from hive_backend import search
+from hive_backend.hashtags import merge_duplicate_hashtags
+
+
+def merge_duplicates(apps, schema_editor):
+    merge_duplicate_hashtags(
+        apps.get_model('hive_backend', 'Hashtag'),
+        apps.get_model('hive_backend', 'Post'),
+        apps.get_model('hive_backend', 'FollowedHashtags'),
+        apps.get_model('hive_backend', 'UserStats'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hive_backend', '0005_post_fts_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.RunPython(search.suspend_triggers, search.restore_triggers),
+        migrations.AlterField(
+            model_name='hashtag',
+            name='name',
+            field=models.CharField(max_length=20, unique=True),
+        ),
+        migrations.RunPython(search.restore_triggers, search.suspend_triggers),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:18
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from hive_backend import search
+
+
+def count_likes(apps, schema_editor):
+    Post = apps.get_model('hive_backend', 'Post')
+    LikedPosts = apps.get_model('hive_backend', 'LikedPosts')
+    likes = LikedPosts.objects.filter(post_id=OuterRef('pk')).values('post_id').annotate(n=Count('pk')).values('n')
+    Post.objects.update(like_count=Coalesce(Subquery(likes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hive_backend', '0006_unique_hashtag_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(search.suspend_triggers, search.restore_triggers),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(search.restore_triggers, search.suspend_triggers),
+        migrations.RunPython(count_likes, migrations.RunPython.noop),
+    ]
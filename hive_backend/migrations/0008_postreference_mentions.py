@@ -0,0 +1,101 @@
+# Generated by Django 5.1.3 on 2026-10-18 05:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def copy_post_times(apps, schema_editor):
+    Post = apps.get_model('hive_backend', 'Post')
+    PostReference = apps.get_model('hive_backend', 'PostReference')
+    PostReference.objects.update(time=Subquery(Post.objects.filter(pk=OuterRef('post_id')).values('time')[:1]))
+
+
+# Counters of a stats row created here, as 0003_userstats counts them
+STATS_COUNTERS = {
+    'posts_count': ('Post', 'user'),
+    'liked_users_count': ('LikedUsers', 'liker'),
+    'liked_by_count': ('LikedUsers', 'liked_user'),
+    'liked_posts_count': ('LikedPosts', 'user'),
+    'followed_hashtags_count': ('FollowedHashtags', 'user'),
+}
+
+
+def mark_existing_mentions_read(apps, schema_editor):
+    # Start every badge at zero instead of counting all past mentions as unread
+    User = apps.get_model('hive_backend', 'CustomUser')
+    PostReference = apps.get_model('hive_backend', 'PostReference')
+    UserStats = apps.get_model('hive_backend', 'UserStats')
+    # Users without a stats row (e.g. bulk-created ones) would otherwise have every mention counted as unread
+    # by UserStats.objects.rebuild, so they get a counted row holding the watermark too
+    missing = list(User.objects.filter(stats__isnull=True).values_list('pk', flat=True))
+    for start in range(0, len(missing), 1000):
+        user_ids = missing[start:start + 1000]
+        UserStats.objects.bulk_create([UserStats(user_id=user_id) for user_id in user_ids])
+        for field, (model_name, owner) in STATS_COUNTERS.items():
+            rows = apps.get_model('hive_backend', model_name).objects.filter(**{owner: OuterRef('user_id')})
+            counts = rows.values(owner).annotate(n=Count('pk')).values('n')
+            UserStats.objects.filter(user_id__in=user_ids).update(**{field: Coalesce(Subquery(counts), 0)})
+    latest = PostReference.objects.aggregate(n=Max('pk'))['n'] or 0
+    UserStats.objects.update(mentions_watermark=latest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hive_backend', '0007_post_like_count'),
+    ]
+
+    operations = [
+        # The implicit through table of Post.references becomes the PostReference model: same table,
+        # columns and unique constraint, so only the migration state changes here
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PostReference',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='hive_backend.post')),
+                        ('user', models.ForeignKey(db_column='customuser_id', on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'hive_backend_post_references',
+                        'unique_together': {('post', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='post',
+                    name='references',
+                    field=models.ManyToManyField(blank=True, related_name='referenced_posts', through='hive_backend.PostReference', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='postreference',
+            name='time',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(copy_post_times, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='postreference',
+            name='time',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='postreference',
+            index=models.Index(fields=['user', '-time', '-post'], name='mention_user_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='mentions_watermark',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='unread_mentions_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(mark_existing_mentions_read, migrations.RunPython.noop),
+    ]
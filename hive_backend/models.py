@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, router
+from django.db.models import Count, F, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 
 class CustomUser(AbstractUser):
@@ -13,21 +15,56 @@ class CustomUser(AbstractUser):
 CustomUser = get_user_model()  # This retrieves the custom user model
 
 class Hashtag(models.Model):
-    name = models.CharField(max_length=20, unique=False)
+    name = models.CharField(max_length=20, unique=True)  # Always stored normalized, see normalize_name
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.name = self.normalize_name(self.name)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def normalize_name(name):
+        """Canonical form of a hashtag name: no leading '#', surrounding whitespace or upper case."""
+        return name.strip().lstrip("#").strip().lower()
+
 class Post(models.Model):
     text = models.CharField(max_length=144)
     time = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="posts")
     hashtags = models.ManyToManyField(Hashtag, related_name="posts")
-    references = models.ManyToManyField(CustomUser, related_name="referenced_posts", blank=True)
+    references = models.ManyToManyField(
+        CustomUser, through="PostReference", related_name="referenced_posts", blank=True
+    )
+    like_count = models.PositiveIntegerField(default=0)  # Denormalized count of LikedPosts rows
+
+    class Meta:
+        indexes = [
+            # Keyset pagination on (time, id), globally and filtered by user
+            models.Index(fields=["-time", "-id"], name="post_time_id_idx"),
+            models.Index(fields=["user", "-time", "-id"], name="post_user_time_id_idx"),
+        ]
 
     def __str__(self):
         return f"{self.text[:20]}... by {self.user.username}"
 
+class PostReference(models.Model):
+    # A mention: one row per (post, referenced user), the through table of Post.references
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="mentions")
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="mentions", db_column="customuser_id")
+    time = models.DateTimeField()  # Copy of post.time so a page of a user's mentions is a single index range scan
+
+    class Meta:
+        db_table = "hive_backend_post_references"  # The table of the former implicit through model
+        unique_together = ("post", "user")
+        indexes = [
+            models.Index(fields=["user", "-time", "-post"], name="mention_user_time_idx"),
+        ]
+
+    def __str__(self):
+        return f"User {self.user_id} mentioned in post {self.post_id}"
+
 class LikedUsers(models.Model):
     liker = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="liked_users")
     liked_user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="users_liked_by")
@@ -67,3 +104,112 @@ class FollowedUsers(models.Model):
 
     def __str__(self):
         return f"{self.follower.username} follows {self.followed_user.username}"
+
+class TimelineEntry(models.Model):
+    # Materialized home feed: one row per (reader, post), written on post creation
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="timeline_entries")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    time = models.DateTimeField()  # Copy of post.time so a page is a single index range scan
+
+    class Meta:
+        unique_together = ("user", "post")
+        indexes = [
+            models.Index(fields=["user", "-time", "-post"], name="timeline_user_time_idx"),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in timeline of user {self.user_id}"
+
+
+class UserStatsManager(models.Manager):
+    def adjust(self, user_ids, **deltas):
+        """Atomically add the given deltas to the counters of the given users."""
+        self.filter(user_id__in=user_ids).update(
+            **{field: models.F(field) + delta for field, delta in deltas.items()}
+        )
+
+    def rebuild(self, user_ids=None, batch_size=1000):
+        """Recount the stats of the given users (or of everyone) in bulk. Returns the number of rows."""
+        users = CustomUser.objects.order_by("pk").values_list("pk", flat=True)
+        if user_ids is not None:
+            users = users.filter(pk__in=user_ids)
+
+        def grouped(model, field, ids):
+            rows = model.objects.filter(**{f"{field}__in": ids}).values(field).annotate(n=Count("pk"))
+            return {row[field]: row["n"] for row in rows}
+
+        rebuilt = 0
+        last_id = 0
+        while True:
+            ids = list(users.filter(pk__gt=last_id)[:batch_size])
+            if not ids:
+                break
+            posts = grouped(Post, "user", ids)
+            liked_users = grouped(LikedUsers, "liker", ids)
+            liked_by = grouped(LikedUsers, "liked_user", ids)
+            liked_posts = grouped(LikedPosts, "user", ids)
+            followed_hashtags = grouped(FollowedHashtags, "user", ids)
+            # Mentions past the user's read watermark (all of them for users without a stats row yet)
+            unread_mentions = {
+                row["user"]: row["n"]
+                for row in PostReference.objects.filter(user__in=ids)
+                .filter(Q(user__stats__isnull=True) | Q(pk__gt=F("user__stats__mentions_watermark")))
+                .values("user").annotate(n=Count("pk"))
+            }
+            rows = [
+                UserStats(
+                    user_id=user_id,
+                    posts_count=posts.get(user_id, 0),
+                    liked_users_count=liked_users.get(user_id, 0),
+                    liked_by_count=liked_by.get(user_id, 0),
+                    liked_posts_count=liked_posts.get(user_id, 0),
+                    followed_hashtags_count=followed_hashtags.get(user_id, 0),
+                    unread_mentions_count=unread_mentions.get(user_id, 0),
+                )
+                for user_id in ids
+            ]
+            self.bulk_create(
+                rows, update_conflicts=True, unique_fields=["user"], update_fields=UserStats.COUNTER_FIELDS,
+            )
+            rebuilt += len(rows)
+            last_id = ids[-1]
+        return rebuilt
+
+    def for_user(self, user):
+        """Return the stats row of a user, building it first if it does not exist yet."""
+        try:
+            return user.stats
+        except UserStats.DoesNotExist:
+            self.rebuild([user.pk])
+            # Read the new row back from the database it was written to (not a read replica)
+            user.stats = self.db_manager(router.db_for_write(UserStats)).get(user=user)
+            return user.stats
+
+    def read_mentions(self, user_id):
+        """Move the user's unread watermark past their newest mention: the unread count drops to zero."""
+        latest = PostReference.objects.filter(user_id=user_id).order_by("-pk").values("pk")[:1]
+        # One statement, so a mention inserted meanwhile is either under the watermark or counted as unread
+        self.filter(user_id=user_id).update(
+            mentions_watermark=Coalesce(Subquery(latest), F("mentions_watermark")), unread_mentions_count=0,
+        )
+
+class UserStats(models.Model):
+    # Denormalized per-user counters, kept up to date by signals (see signals.py)
+    COUNTER_FIELDS = [
+        "posts_count", "liked_users_count", "liked_by_count", "liked_posts_count", "followed_hashtags_count",
+        "unread_mentions_count",
+    ]
+
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    posts_count = models.PositiveIntegerField(default=0)  # Posts created by the user
+    liked_users_count = models.PositiveIntegerField(default=0)  # Users this user has liked
+    liked_by_count = models.PositiveIntegerField(default=0)  # Users who have liked this user
+    liked_posts_count = models.PositiveIntegerField(default=0)  # Posts liked by the user
+    followed_hashtags_count = models.PositiveIntegerField(default=0)  # Hashtags followed by the user
+    unread_mentions_count = models.PositiveIntegerField(default=0)  # Mentions newer than mentions_watermark
+    mentions_watermark = models.BigIntegerField(default=0)  # Id of the newest PostReference the user has read
+
+    objects = UserStatsManager()
+
+    def __str__(self):
+        return f"Stats of user {self.user_id}"
@@ -0,0 +1,148 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a composite ordering.
+
+    The cursor holds the ordering values of the last row of the previous page,
+    and the next page is fetched with a range condition on those values, so every
+    page costs the same index range scan no matter how deep it is (unlike
+    OFFSET/LIMIT). The last ordering field must be unique, e.g. the primary key.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def _fields(self, model):
+        return [model._meta.get_field(name.lstrip('-')) for name in self.ordering]
+
+    def encode_cursor(self, values):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            fields = self._fields(model)
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError
+            values = [field.to_python(value) for field, value in zip(fields, values)]
+            # to_python passes None through, and a None bound cannot be seeked on
+            if any(value is None for value in values):
+                raise ValueError
+            return values
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _seek(self, values, position=0):
+        """
+        Build the "after this row" condition for the ordering fields from `position` on.
+
+        Written as ``a <= x AND (a < x OR (a = x AND ...))`` rather than a plain OR,
+        so the leading field still bounds an index range scan.
+        """
+        name = self.ordering[position]
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        value = values[position]
+        strict = Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+        if position == len(self.ordering) - 1:
+            return strict
+        inclusive = Q(**{f'{name}__{"lte" if descending else "gte"}': value})
+        return inclusive & (strict | (Q(**{name: value}) & self._seek(values, position + 1)))
+
+    def get_page_queryset(self, queryset, request):
+        """Return the ordered, bounded queryset for the requested page (fetches one extra row)."""
+        self.request = request
+        self.page_size_for_request = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        self.model = queryset.model
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            queryset = queryset.filter(self._seek(cursor))
+        return queryset[:self.page_size_for_request + 1]
+
+    def build_page(self, rows):
+        """Trim the extra row fetched by get_page_queryset and remember the next cursor."""
+        rows = list(rows)
+        self.next_cursor = None
+        if len(rows) > self.page_size_for_request:
+            rows = rows[:self.page_size_for_request]
+            last = rows[-1]
+            if isinstance(last, dict):
+                # .values() rows (fastpath.py)
+                values = [last[field.attname] for field in self._fields(self.model)]
+            else:
+                values = [getattr(last, field.attname) for field in self._fields(type(last))]
+            self.next_cursor = self.encode_cursor(values)
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.build_page(self.get_page_queryset(queryset, request))
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+# Posts: newest first, backed by the (time, id) and (user, time, id) indexes
+class PostPagination(KeysetPagination):
+    ordering = ('-time', '-id')
+
+
+# Timeline pagination: seek on the (user, time, post) index
+class TimelinePagination(KeysetPagination):
+    ordering = ('-time', '-post_id')
+
+
+# Mentions of a user: seek on the (user, time, post) mention index
+class MentionPagination(KeysetPagination):
+    ordering = ('-time', '-post_id')
+
+
+# Likes, follows and hashtags: newest first by primary key
+class IdPagination(KeysetPagination):
+    ordering = ('-id',)
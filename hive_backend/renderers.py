@@ -0,0 +1,38 @@
+"""
+JSON renderer for the API.
+
+FastJSONRenderer writes the same bytes as DRF's JSONRenderer (compact, UTF-8,
+U+2028/U+2029 escaped, dates and decimals through DRF's encoder) but encodes
+with orjson when it is installed, which is several times faster on big list
+responses. Without orjson, and for the cases orjson handles differently
+(indented output, integers past 64 bits), it falls back to the stdlib encoder.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Datetimes go to DRF's encoder too: it trims microseconds to milliseconds and writes UTC as "Z"
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson is not None else 0
+
+_encoder = JSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or not self.compact or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like JSONRenderer: the line separators are valid JSON but not valid JavaScript
+        if b"\xe2\x80\xa8" in content or b"\xe2\x80\xa9" in content:
+            content = content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return content
@@ -0,0 +1,219 @@
+"""
+Full-text search over posts.
+
+On SQLite the post text and hashtag names are mirrored into an FTS5 virtual table,
+kept in sync by triggers on the post, post-hashtag and hashtag tables (so bulk
+inserts and raw SQL stay indexed too). Other database backends fall back to a
+case-insensitive LIKE match.
+
+A time-ordered ?search= page is served by one of two plans. When few posts
+match, the index returns all of them and only those are sorted by time. When
+many posts match (at least SEARCH_SCAN_THRESHOLD contain every word), the
+index would read all of them first: FTS5 materializes the full match list of a
+prefix query, which takes seconds for a short prefix on a million posts. So
+the posts are walked newest first instead, with a per-row LIKE test, and the
+scan stops as soon as the page is full. That test matches substrings without
+diacritic folding, so it can differ slightly from the index on such terms.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections, router, OperationalError
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "hive_backend_post_fts"
+# Posts matching every query word (as whole words) from which ?search= scans posts instead of the index
+SCAN_THRESHOLD = getattr(settings, "SEARCH_SCAN_THRESHOLD", 5000)
+
+# Hashtag names of a post, space separated, for the post whose id is given by the `{post_id}` expression
+_HASHTAGS_OF_POST = (
+    "COALESCE((SELECT group_concat(h.name, ' ') FROM hive_backend_post_hashtags ph "
+    "JOIN hive_backend_hashtag h ON h.id = ph.hashtag_id WHERE ph.post_id = {post_id}), '')"
+)
+
+CREATE_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"text, hashtags, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+TRIGGER_SQL = {
+    "post_insert": (
+        "AFTER INSERT ON hive_backend_post BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, text, hashtags) VALUES (new.id, new.text, ''); END"
+    ),
+    "post_update": (
+        "AFTER UPDATE OF text ON hive_backend_post BEGIN "
+        f"UPDATE {FTS_TABLE} SET text = new.text WHERE rowid = new.id; END"
+    ),
+    "post_delete": (
+        "AFTER DELETE ON hive_backend_post BEGIN "
+        f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END"
+    ),
+    "hashtag_add": (
+        "AFTER INSERT ON hive_backend_post_hashtags BEGIN "
+        f"UPDATE {FTS_TABLE} SET hashtags = {_HASHTAGS_OF_POST.format(post_id='new.post_id')} "
+        "WHERE rowid = new.post_id; END"
+    ),
+    "hashtag_remove": (
+        "AFTER DELETE ON hive_backend_post_hashtags BEGIN "
+        f"UPDATE {FTS_TABLE} SET hashtags = {_HASHTAGS_OF_POST.format(post_id='old.post_id')} "
+        "WHERE rowid = old.post_id; END"
+    ),
+    "hashtag_rename": (
+        "AFTER UPDATE OF name ON hive_backend_hashtag BEGIN "
+        f"UPDATE {FTS_TABLE} SET hashtags = {_HASHTAGS_OF_POST.format(post_id=FTS_TABLE + '.rowid')} "
+        "WHERE rowid IN (SELECT post_id FROM hive_backend_post_hashtags WHERE hashtag_id = new.id); END"
+    ),
+}
+
+# Index the posts that already exist
+POPULATE_SQL = (
+    f"INSERT INTO {FTS_TABLE}(rowid, text, hashtags) "
+    f"SELECT p.id, p.text, {_HASHTAGS_OF_POST.format(post_id='p.id')} FROM hive_backend_post p"
+)
+
+# Weights of the text and hashtags columns in bm25 ranking
+RANK_SQL = f"bm25({FTS_TABLE}, 1.0, 2.0)"
+
+_available = {}
+
+
+def _has_index(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def create_triggers(conn):
+    """(Re)create the sync triggers, if the FTS5 table exists."""
+    if conn.vendor != "sqlite" or not _has_index(conn):
+        return
+    with conn.cursor() as cursor:
+        for name, body in TRIGGER_SQL.items():
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{name} {body}")
+
+
+def drop_triggers(conn):
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cursor:
+        for name in TRIGGER_SQL:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{name}")
+
+
+def create_index(conn):
+    """Create and fill the FTS5 table and its triggers. Returns False when the backend cannot host it."""
+    if conn.vendor != "sqlite":
+        return False
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_TABLE_SQL)
+        except OperationalError:
+            # SQLite compiled without FTS5
+            return False
+        cursor.execute(POPULATE_SQL)
+    create_triggers(conn)
+    return True
+
+
+def drop_index(conn):
+    if conn.vendor != "sqlite":
+        return
+    drop_triggers(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+# RunPython operations for migrations that rebuild the post, hashtag or post-hashtag tables:
+# SQLite refuses to rename a rebuilt table while triggers reference the one being replaced.
+def suspend_triggers(apps, schema_editor):
+    drop_triggers(schema_editor.connection)
+
+
+def restore_triggers(apps, schema_editor):
+    create_triggers(schema_editor.connection)
+
+
+def fts_available(using="default"):
+    """Whether the FTS5 index exists on the given database (checked once per process)."""
+    if using not in _available:
+        connection = connections[using]
+        _available[using] = connection.vendor == "sqlite" and FTS_TABLE in connection.introspection.table_names()
+    return _available[using]
+
+
+def build_match_expression(query):
+    """
+    Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Quoting each term keeps FTS5 operators and punctuation in user input from
+    being interpreted. Returns None when the query has no searchable words.
+    """
+    terms = _terms(query)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())
+
+
+def _is_common(terms, using):
+    """
+    Whether at least SCAN_THRESHOLD posts contain every term as a whole word. Whole-word matches
+    stream from the index and stop at the threshold, unlike the prefix matches they are a subset of.
+    """
+    expression = " ".join(f'"{term}"' for term in terms)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT count(*) FROM (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s)",
+            [expression, SCAN_THRESHOLD],
+        )
+        return cursor.fetchone()[0] >= SCAN_THRESHOLD
+
+
+def _contains(term):
+    """The post's text or one of its hashtags contains the term: a per-row test, no join to deduplicate."""
+    from .models import Post
+
+    hashtags = Post.hashtags.through.objects.filter(post_id=OuterRef("pk"), hashtag__name__icontains=term)
+    return Q(text__icontains=term) | Q(Exists(hashtags))
+
+
+def filter_posts(queryset, query):
+    """Restrict a Post queryset to the posts matching the query, keeping its ordering."""
+    using = queryset.db
+    if not fts_available(using):
+        return queryset.filter(Q(text__icontains=query) | Q(hashtags__name__icontains=query)).distinct()
+    terms = _terms(query)
+    if not terms:
+        return queryset.none()
+    if _is_common(terms, using):
+        # Many matches: a page is found after scanning about page size * posts / matches rows
+        return queryset.filter(*[_contains(term) for term in terms])
+    return queryset.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [build_match_expression(query)])
+    )
+
+
+def ranked_post_ids(query, limit):
+    """Return the ids of the best matching posts, best first."""
+    from .models import Post
+
+    using = router.db_for_read(Post)
+    if not fts_available(using):
+        return list(
+            filter_posts(Post.objects.using(using), query).order_by("-time", "-id")
+            .values_list("id", flat=True)[:limit]
+        )
+    expression = build_match_expression(query)
+    if expression is None:
+        return []
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY {RANK_SQL} LIMIT %s",
+            [expression, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
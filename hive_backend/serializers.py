@@ -1,21 +1,64 @@
 from django.contrib.auth import get_user_model
-from rest_framework import serializers
-from django.db.models import Count
+from rest_framework import permissions, serializers
+from django.db.models import Count, Prefetch
 from django.contrib.auth.hashers import make_password
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from .models import Post, Hashtag, LikedUsers, FollowedHashtags, LikedPosts, FollowedUsers
+from .models import Post, Hashtag, LikedUsers, FollowedHashtags, LikedPosts, FollowedUsers, UserStats
+from . import caching, events, timeline
+from .cooccurrence import hashtag_cooccurrence
+from .instrumentation import TimedSerializerMixin
+from .hashtags import resolve_hashtags, set_post_hashtags
+from .trending import trending_hashtags
 
 User = get_user_model()
 
 
+# Sparse fieldsets: ?fields=a,b returns only the listed fields, ?omit=a,b drops them
+class SparseFieldsMixin:
+    """
+    Removes unrequested fields from the serializer, so their SerializerMethodFields
+    (and the queries behind them) never run. Applies to read requests only; writes
+    keep every field. Viewsets use `selected_fields` to prefetch only what is needed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = self.selected_fields(self.context.get('request'))
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+
+    @classmethod
+    def selected_fields(cls, request):
+        """Names of the fields a request asks for (all of Meta.fields by default)."""
+        fields = set(cls.Meta.fields)
+        if request is None or request.method not in permissions.SAFE_METHODS:
+            return fields
+        requested = request.query_params.get('fields')
+        if requested:
+            fields &= {name.strip() for name in requested.split(',')}
+        omitted = request.query_params.get('omit')
+        if omitted:
+            fields -= {name.strip() for name in omitted.split(',')}
+        return fields
+
+
 # Custom Token Serializer to include user data in token response
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
         # Call the parent method to get the token data
         data = super().validate(attrs)
 
-        # Serialize the user object
-        user_data = UserSerializer(self.user).data
+        # Compact profile (one stats query); liked users and followed hashtags come from /users/me/.
+        # ?expand=full returns the full UserSerializer output for older clients.
+        request = self.context.get("request")
+        if request is not None and request.query_params.get("expand") == "full":
+            user = User.objects.select_related('stats').prefetch_related(
+                'liked_users', Prefetch('followed_hashtags', queryset=FollowedHashtags.objects.select_related('hashtag')),
+            ).get(pk=self.user.pk)
+            user_data = UserSerializer(user).data
+        else:
+            user_data = LoginUserSerializer(self.user).data
 
         # Add the serialized user data to the token response
         data["user"] = user_data
@@ -24,7 +67,7 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
 
 # User Registration Serializer
-class UserRegistrationSerializer(serializers.ModelSerializer):
+class UserRegistrationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'email', 'username', 'password', 'bio']
@@ -39,14 +82,34 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
 
 # Hashtag Serializer
-class HashtagSerializer(serializers.ModelSerializer):
+class HashtagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Hashtag
         fields = ['id', 'name']
+        extra_kwargs = {
+            'name': {'validators': []},  # Uniqueness is checked on the normalized name below
+        }
+
+    def validate_name(self, value):
+        name = Hashtag.normalize_name(value)
+        if not name:
+            raise serializers.ValidationError("Hashtag name cannot be empty.")
+        existing = Hashtag.objects.filter(name=name)
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError("A hashtag with this name already exists.")
+        return name
+
+
+# Hashtag inside a post: existing names are reused instead of rejected
+class PostHashtagSerializer(HashtagSerializer):
+    def validate_name(self, value):
+        return Hashtag.normalize_name(value)
 
 
 # User Serializer
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     amount_of_liked_users = serializers.SerializerMethodField()  # Number of users this user has liked
     liked_user_id = serializers.SerializerMethodField()  # IDs of users this user has liked
     amount_of_me_liked_users = serializers.SerializerMethodField()  # Number of users who have liked this user
@@ -55,6 +118,12 @@ class UserSerializer(serializers.ModelSerializer):
     posts_count = serializers.SerializerMethodField()  # Count of posts created by the user
     liked_posts_count = serializers.SerializerMethodField()  # Count of liked posts by the user
 
+    # Fields served from the stats row; the lists come from the liked_users / followed_hashtags relations
+    STATS_FIELDS = {
+        'amount_of_liked_users', 'amount_of_me_liked_users', 'amount_of_followed_hashtags',
+        'posts_count', 'liked_posts_count',
+    }
+
     class Meta:
         model = User
         fields = [
@@ -65,49 +134,85 @@ class UserSerializer(serializers.ModelSerializer):
         ]
 
     def get_amount_of_liked_users(self, obj):
-        return LikedUsers.objects.filter(liker=obj).count()
+        return UserStats.objects.for_user(obj).liked_users_count
 
     def get_liked_user_id(self, obj):
-        liked_users = LikedUsers.objects.filter(liker=obj).values_list('liked_user__id', flat=True)
-        return [{"id": user_id} for user_id in liked_users]
+        # Served from the liked_users prefetch when the queryset provides one
+        return [{"id": liked.liked_user_id} for liked in obj.liked_users.all()]
 
     def get_amount_of_me_liked_users(self, obj):
-        return LikedUsers.objects.filter(liked_user=obj).count()
+        return UserStats.objects.for_user(obj).liked_by_count
 
     def get_amount_of_followed_hashtags(self, obj):
-        return FollowedHashtags.objects.filter(user=obj).values('hashtag').distinct().count()
+        return UserStats.objects.for_user(obj).followed_hashtags_count
 
     def get_id_and_name_of_followed_hashtags(self, obj):
-        followed_hashtags = FollowedHashtags.objects.filter(user=obj).select_related('hashtag')
-        return [{"id": hashtag.hashtag.id, "name": hashtag.hashtag.name} for hashtag in followed_hashtags]
+        # Served from the followed_hashtags prefetch when the queryset provides one
+        return [
+            {"id": followed.hashtag.id, "name": followed.hashtag.name}
+            for followed in obj.followed_hashtags.all()
+        ]
 
     def get_posts_count(self, obj):
-        return Post.objects.filter(user=obj).count()
+        return UserStats.objects.for_user(obj).posts_count
 
     def get_liked_posts_count(self, obj):
-        return LikedPosts.objects.filter(user=obj).count()
+        return UserStats.objects.for_user(obj).liked_posts_count
+
+
+# Login response user: profile and counters only, no per-relation lists
+class LoginUserSerializer(UserSerializer):
+    class Meta(UserSerializer.Meta):
+        fields = [
+            'id', 'email', 'username', 'bio',
+            'amount_of_liked_users', 'amount_of_me_liked_users', 'amount_of_followed_hashtags',
+            'posts_count', 'liked_posts_count',
+        ]
 
 
 # Post Serializer
-class PostSerializer(serializers.ModelSerializer):
-    hashtags = HashtagSerializer(many=True)  # Nested Hashtag serializer
+class PostSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    hashtags = PostHashtagSerializer(many=True)  # Nested Hashtag serializer
     references = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), many=True, required=False)
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False)
+    liked_by_me = serializers.SerializerMethodField()  # Whether the requesting user has liked the post
+    reference_count = serializers.SerializerMethodField()  # Number of users referenced in the post
 
     class Meta:
         model = Post
-        fields = ['id', 'text', 'time', 'user', 'hashtags', 'references']
+        fields = ['id', 'text', 'time', 'user', 'hashtags', 'references', 'like_count', 'liked_by_me', 'reference_count']
+        read_only_fields = ['like_count']
 
     def to_representation(self, instance):
-        """Convert data to a more readable format in the response."""
+        """
+        Convert data to a more readable format in the response.
+
+        Reads only the user, hashtags and references relations, so it stays query-free
+        when the queryset uses select_related('user') and prefetch_related('hashtags', 'references').
+        """
         representation = super().to_representation(instance)
-        representation['references'] = [
-            {"id": user.id, "username": user.username}
-            for user in instance.references.all()
-        ]
-        representation['user'] = {"id": instance.user.id, "username": instance.user.username}
+        if 'references' in representation:
+            representation['references'] = [
+                {"id": user.id, "username": user.username}
+                for user in instance.references.all()
+            ]
+        if 'user' in representation:
+            representation['user'] = {"id": instance.user.id, "username": instance.user.username}
         return representation
 
+    def get_liked_by_me(self, obj):
+        # PostViewSet annotates this with an EXISTS subquery; the fallback only runs for single posts
+        annotated = getattr(obj, 'liked_by_me', None)
+        if annotated is not None:
+            return annotated
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated or not obj.like_count:
+            return False
+        return LikedPosts.objects.filter(user=request.user, post=obj).exists()
+
+    def get_reference_count(self, obj):
+        return len(obj.references.all())  # Uses the references prefetch
+
     def create(self, validated_data):
         hashtags_data = validated_data.pop('hashtags', [])
         references_data = validated_data.pop('references', [])
@@ -118,15 +223,21 @@ class PostSerializer(serializers.ModelSerializer):
         # Create the post
         post = Post.objects.create(user=user, **validated_data)
 
-        # Add hashtags
-        for hashtag_data in hashtags_data:
-            hashtag_name = hashtag_data.get('name')
-            if hashtag_name:
-                hashtag, _ = Hashtag.objects.get_or_create(name=hashtag_name)
-                post.hashtags.add(hashtag)
+        # Add hashtags: one bulk lookup/insert of the hashtags and one bulk insert into the through table
+        hashtag_ids = resolve_hashtags(hashtag_data.get('name', '') for hashtag_data in hashtags_data)
+        set_post_hashtags(post, hashtag_ids)
+        trending_hashtags.record_post(post.pk, hashtag_ids, post.time)
+        hashtag_cooccurrence.record(post.pk, (), hashtag_ids)
+
+        # Add references (mentions carry the post's time for the /users/me/mentions/ index)
+        post.references.set(references_data, through_defaults={'time': post.time})
 
-        # Add references
-        post.references.set(references_data)
+        # Deliver the post to the timelines of the author's and hashtags' followers, and to their open streams
+        recipients = timeline.fan_out(post, hashtag_ids)
+        events.publish_post(post, hashtag_ids, recipients)
+
+        # Bump again now that the hashtags and references are in place (the post_save bump came before them)
+        caching.bump(caching.POSTS, caching.user_scope(post.user_id))
 
         return post
 
@@ -139,42 +250,43 @@ class PostSerializer(serializers.ModelSerializer):
         instance.save()
 
         if hashtags_data is not None:
-            instance.hashtags.clear()
-            for hashtag_data in hashtags_data:
-                hashtag_name = hashtag_data.get('name')
-                if hashtag_name:
-                    hashtag, _ = Hashtag.objects.get_or_create(name=hashtag_name)
-                    instance.hashtags.add(hashtag)
+            old_hashtag_ids = list(instance.hashtags.values_list('id', flat=True))
+            hashtag_ids = resolve_hashtags(hashtag_data.get('name', '') for hashtag_data in hashtags_data)
+            set_post_hashtags(instance, hashtag_ids, old_hashtag_ids)
+            hashtag_cooccurrence.record(instance.pk, old_hashtag_ids, hashtag_ids)
+            timeline.refresh_post(instance)
 
         if references_data is not None:
-            instance.references.set(references_data)
+            instance.references.set(references_data, through_defaults={'time': instance.time})
+
+        caching.bump(caching.POSTS, caching.user_scope(instance.user_id))
 
         return instance
 
 
 # Liked Users Serializer
-class LikedUsersSerializer(serializers.ModelSerializer):
+class LikedUsersSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = LikedUsers
         fields = ['liker', 'liked_user']
 
 
 # Followed Hashtags Serializer
-class FollowedHashtagsSerializer(serializers.ModelSerializer):
+class FollowedHashtagsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = FollowedHashtags
         fields = ['user', 'hashtag']
 
 
 # Liked Posts Serializer
-class LikedPostsSerializer(serializers.ModelSerializer):
+class LikedPostsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = LikedPosts
         fields = ['user', 'post']
 
 
 # Followed Users Serializer
-class FollowedUsersSerializer(serializers.ModelSerializer):
+class FollowedUsersSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     follower = serializers.StringRelatedField()
     followed_user = serializers.StringRelatedField()
 
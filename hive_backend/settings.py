@@ -12,9 +12,15 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 
+import environ
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Environment overrides, optionally from a .env file next to manage.py
+env = environ.Env()
+environ.Env.read_env(BASE_DIR / '.env')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -48,10 +54,23 @@ from datetime import timedelta
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication with an in-process user cache instead of a user query per request
+        'hive_backend.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        # JSONRenderer's output, encoded with orjson when it is installed
+        'hive_backend.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
 }
 
+# /posts/ and /liked-posts/ list pages from .values() rows instead of the serializers (see fastpath.py)
+FAST_LIST_SERIALIZATION = env.bool('HIVE_FAST_LIST_SERIALIZATION', default=True)
+
+# Seconds a cached user row may serve requests before it is reloaded (bounds how long a
+# deactivation in another worker process takes to apply)
+JWT_USER_CACHE_SECONDS = 30
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -85,6 +104,16 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request query/auth/serializer timings in a Server-Timing header and per-route histograms on
+# /metrics (hive_backend/instrumentation.py). First, so the total covers the other middleware.
+PERFORMANCE_METRICS = env.bool('HIVE_PERFORMANCE_METRICS', default=True)
+SERVER_TIMING_HEADER = env.bool('HIVE_SERVER_TIMING', default=True)
+# /metrics is for staff sessions, plus the client addresses listed here. The check reads REMOTE_ADDR, which
+# behind a reverse proxy is the proxy's own address: only list addresses when scrapers reach the app directly.
+METRICS_ALLOWED_IPS = env.list('HIVE_METRICS_ALLOWED_IPS', default=[])
+if PERFORMANCE_METRICS:
+    MIDDLEWARE.insert(0, 'hive_backend.instrumentation.performance_middleware')
+
 ROOT_URLCONF = 'hive_backend.urls'
 
 TEMPLATES = [
@@ -105,14 +134,65 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'hive_backend.wsgi.application'
 
+# Serve /posts/, /users/me/ and /hashtags/search/ with async views (see async_views.py).
+# Meant for ASGI deployments: uvicorn hive_backend.asgi:application, with HIVE_ASYNC_VIEWS=1
+ASYNC_VIEWS = env.bool('HIVE_ASYNC_VIEWS', default=False)
+
+# New-post stream /posts/stream/ (ASGI, see events.py): 'memory' serves a single worker process,
+# 'database' polls the timeline table so every worker sees every post
+EVENTS_BROKER = env.str('HIVE_EVENTS_BROKER', default='memory')
+EVENTS_POLL_SECONDS = env.float('HIVE_EVENTS_POLL_SECONDS', default=1.0)
+# How long a timeline fan-out may take to commit after a later-numbered one and still be delivered
+EVENTS_SETTLE_SECONDS = env.float('HIVE_EVENTS_SETTLE_SECONDS', default=10 * EVENTS_POLL_SECONDS)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# DATABASE_URL (default: db.sqlite3 next to manage.py). Connections are kept open for
+# DB_CONN_MAX_AGE seconds instead of being reopened (and re-tuned) on every request. With
+# HIVE_ASYNC_VIEWS the default is 0: Django advises against persistent connections under ASGI,
+# where every request runs its sync code in a new thread with its own connection.
+
 DATABASES = {
+    'default': env.db('DATABASE_URL', default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}"),
+}
+DATABASES['default']['CONN_MAX_AGE'] = env.int('DB_CONN_MAX_AGE', default=0 if ASYNC_VIEWS else 600)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Optional read replica: reads of GET/HEAD requests go there, writes to 'default' (hive_backend/db.py).
+# For SQLite this can be the same file, e.g. sqlite:////path/to/db.sqlite3 (opened with query_only).
+# A client that writes reads from 'default' for the next DATABASE_REPLICA_LAG_SECONDS (a cookie).
+if env.str('DATABASE_REPLICA_URL', default=''):
+    DATABASES['replica'] = env.db('DATABASE_REPLICA_URL')
+    DATABASES['replica']['CONN_MAX_AGE'] = DATABASES['default']['CONN_MAX_AGE']
+    DATABASES['replica']['CONN_HEALTH_CHECKS'] = True
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICA_LAG_SECONDS = env.int('DATABASE_REPLICA_LAG_SECONDS', default=5)
+    DATABASE_ROUTERS = ['hive_backend.db.ReadReplicaRouter']
+    MIDDLEWARE.append('hive_backend.db.read_replica_middleware')
+
+# Hashtag co-occurrence index for /hashtags/{id}/related/, built by `manage.py build_cooccurrence`
+COOCCURRENCE_FILE = env.str('HIVE_COOCCURRENCE_FILE', default=str(BASE_DIR / 'cooccurrence.bin'))
+
+# SQLite tuning applied to every new connection (hive_backend/db.py): WAL journal, busy timeout,
+# synchronous=NORMAL and memory-mapped I/O
+SQLITE_TUNING = env.bool('SQLITE_TUNING', default=True)
+SQLITE_BUSY_TIMEOUT_MS = env.int('SQLITE_BUSY_TIMEOUT_MS', default=5000)
+SQLITE_SYNCHRONOUS = env.str('SQLITE_SYNCHRONOUS', default='NORMAL')
+SQLITE_MMAP_SIZE = env.int('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Holds the ETag versions and cached bodies of hive_backend/caching.py. The local-memory cache is
+# per process: with several worker processes use a shared backend (Redis, Memcached) instead.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'hive',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
 
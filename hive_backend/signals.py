@@ -0,0 +1,225 @@
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from . import caching, timeline
+from .authentication import evict_user
+from .cooccurrence import hashtag_cooccurrence
+from .graph import follow_graph, FOLLOWS, LIKES, HASHTAGS
+from .hashtags import hashtag_index
+from .trending import trending_hashtags
+from .models import Post, PostReference, Hashtag, LikedUsers, LikedPosts, FollowedUsers, FollowedHashtags, UserStats
+
+User = get_user_model()
+
+
+# User stats counters
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.adjust([instance.user_id], posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    UserStats.objects.adjust([instance.user_id], posts_count=-1)
+
+
+@receiver(post_save, sender=LikedUsers)
+def liked_user_created(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.adjust([instance.liker_id], liked_users_count=1)
+        UserStats.objects.adjust([instance.liked_user_id], liked_by_count=1)
+
+
+@receiver(post_delete, sender=LikedUsers)
+def liked_user_deleted(sender, instance, **kwargs):
+    UserStats.objects.adjust([instance.liker_id], liked_users_count=-1)
+    UserStats.objects.adjust([instance.liked_user_id], liked_by_count=-1)
+
+
+@receiver(post_save, sender=LikedPosts)
+def liked_post_created(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.adjust([instance.user_id], liked_posts_count=1)
+        Post.objects.filter(pk=instance.post_id).update(like_count=F("like_count") + 1)
+
+
+@receiver(post_delete, sender=LikedPosts)
+def liked_post_deleted(sender, instance, **kwargs):
+    UserStats.objects.adjust([instance.user_id], liked_posts_count=-1)
+    Post.objects.filter(pk=instance.post_id).update(like_count=F("like_count") - 1)
+
+
+# Unread mention counters: a new mention is always past its user's watermark, a removed one only maybe
+def _forget_unread_mentions(references):
+    unread = references.filter(pk__gt=F("user__stats__mentions_watermark")).values("user").annotate(n=Count("pk"))
+    for row in unread:
+        UserStats.objects.adjust([row["user"]], unread_mentions_count=-row["n"])
+
+
+@receiver(m2m_changed, sender=PostReference)
+def references_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse: changed through user.referenced_posts, so pk_set holds post ids
+    if action == "post_add" and pk_set:
+        if reverse:
+            UserStats.objects.adjust([instance.pk], unread_mentions_count=len(pk_set))
+        else:
+            UserStats.objects.adjust(pk_set, unread_mentions_count=1)
+    elif action in ("pre_remove", "pre_clear"):
+        references = PostReference.objects.filter(**{"user" if reverse else "post": instance})
+        if pk_set is not None:
+            references = references.filter(**{"post_id__in" if reverse else "user_id__in": pk_set})
+        _forget_unread_mentions(references)
+
+
+@receiver(pre_delete, sender=Post)
+def post_mentions_removed(sender, instance, **kwargs):
+    _forget_unread_mentions(PostReference.objects.filter(post=instance))
+
+
+# Hashtag autocomplete index
+@receiver(post_save, sender=Hashtag)
+def hashtag_saved(sender, instance, **kwargs):
+    hashtag_index.add(instance.id, instance.name)
+
+
+@receiver(post_delete, sender=Hashtag)
+def hashtag_deleted(sender, instance, **kwargs):
+    hashtag_index.remove(instance.id)
+
+
+# Hashtag co-occurrence: a deleted post's hashtags no longer count together (read before the cascade)
+@receiver(pre_delete, sender=Post)
+def post_cooccurrence_removed(sender, instance, **kwargs):
+    hashtag_cooccurrence.record(instance.pk, instance.hashtags.values_list("id", flat=True), ())
+
+
+# Timeline backfill / cleanup, stats and hashtag ranking when follows change
+@receiver(post_save, sender=FollowedUsers)
+def followed_user_created(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill_followed_users(instance.follower_id, [instance.followed_user_id])
+
+
+@receiver(post_delete, sender=FollowedUsers)
+def followed_user_deleted(sender, instance, **kwargs):
+    timeline.remove_followed_users(instance.follower_id, [instance.followed_user_id])
+
+
+@receiver(post_save, sender=FollowedHashtags)
+def followed_hashtag_created(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.adjust([instance.user_id], followed_hashtags_count=1)
+        hashtag_index.bump(instance.hashtag_id)
+        trending_hashtags.record_follows([instance.hashtag_id])
+        timeline.backfill_followed_hashtags(instance.user_id, [instance.hashtag_id])
+
+
+@receiver(post_delete, sender=FollowedHashtags)
+def followed_hashtag_deleted(sender, instance, **kwargs):
+    UserStats.objects.adjust([instance.user_id], followed_hashtags_count=-1)
+    hashtag_index.bump(instance.hashtag_id, -1)
+    timeline.remove_followed_hashtags(instance.user_id, [instance.hashtag_id])
+
+
+# Follow graph for "who to follow" suggestions
+@receiver(post_save, sender=FollowedUsers)
+def follow_graph_user_followed(sender, instance, created, **kwargs):
+    if created:
+        follow_graph.record(FOLLOWS, instance.follower_id, [instance.followed_user_id])
+
+
+@receiver(post_delete, sender=FollowedUsers)
+def follow_graph_user_unfollowed(sender, instance, **kwargs):
+    follow_graph.record(FOLLOWS, instance.follower_id, [instance.followed_user_id], removed=True)
+
+
+@receiver(post_save, sender=LikedUsers)
+def follow_graph_user_liked(sender, instance, created, **kwargs):
+    if created:
+        follow_graph.record(LIKES, instance.liker_id, [instance.liked_user_id])
+
+
+@receiver(post_delete, sender=LikedUsers)
+def follow_graph_user_unliked(sender, instance, **kwargs):
+    follow_graph.record(LIKES, instance.liker_id, [instance.liked_user_id], removed=True)
+
+
+@receiver(post_save, sender=FollowedHashtags)
+def follow_graph_hashtag_followed(sender, instance, created, **kwargs):
+    if created:
+        follow_graph.record(HASHTAGS, instance.user_id, [instance.hashtag_id])
+
+
+@receiver(post_delete, sender=FollowedHashtags)
+def follow_graph_hashtag_unfollowed(sender, instance, **kwargs):
+    follow_graph.record(HASHTAGS, instance.user_id, [instance.hashtag_id], removed=True)
+
+
+# Conditional GET: invalidate the cached responses that depend on the changed rows
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    caching.bump(caching.user_scope(instance.pk))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    caching.bump(caching.POSTS, caching.user_scope(instance.user_id))
+
+
+@receiver(post_save, sender=Hashtag)
+@receiver(post_delete, sender=Hashtag)
+def hashtag_changed(sender, instance, **kwargs):
+    caching.bump(caching.POSTS, caching.HASHTAGS)
+
+
+@receiver(post_save, sender=LikedPosts)
+@receiver(post_delete, sender=LikedPosts)
+def liked_post_changed(sender, instance, **kwargs):
+    caching.bump(caching.POSTS, caching.user_scope(instance.user_id))
+
+
+@receiver(post_save, sender=LikedUsers)
+@receiver(post_delete, sender=LikedUsers)
+def liked_user_changed(sender, instance, **kwargs):
+    caching.bump(caching.user_scope(instance.liker_id), caching.user_scope(instance.liked_user_id))
+
+
+@receiver(post_save, sender=FollowedUsers)
+@receiver(post_delete, sender=FollowedUsers)
+def followed_user_changed(sender, instance, **kwargs):
+    caching.bump(caching.user_scope(instance.follower_id))
+
+
+@receiver(post_save, sender=FollowedHashtags)
+@receiver(post_delete, sender=FollowedHashtags)
+def followed_hashtag_changed(sender, instance, **kwargs):
+    caching.bump(caching.user_scope(instance.user_id))
+
+
+# Authentication user cache: password / is_active changes and logouts take effect at once in this process
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_cache_evicted(sender, instance, **kwargs):
+    evict_user(instance)
+
+
+if apps.is_installed("rest_framework_simplejwt.token_blacklist"):
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+    @receiver(post_save, sender=BlacklistedToken)
+    def token_blacklisted(sender, instance, created, **kwargs):
+        user = instance.token.user
+        if created and user is not None:
+            evict_user(user)
@@ -0,0 +1,176 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from hive_backend.models import CustomUser, FollowedHashtags, FollowedUsers, Hashtag, LikedUsers, Post
+
+ME = "/users/me/"
+POSTS = "/posts/"
+MY_HASHTAGS = "/followed-hashtags/my-followed/"
+
+
+class ConditionalGetInvalidationTests(TestCase):
+    """Every write path turns the 304 of the responses it changes into a 200 with the new data."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol = (
+            CustomUser.objects.create_user(name, password="password123") for name in ("alice", "bob", "carol")
+        )
+        cls.hashtag = Hashtag.objects.create(name="django")
+        cls.post = Post.objects.create(user=cls.bob, text="Hello")
+
+    def setUp(self):
+        cache.clear()
+        self.client = self.client_for(self.alice)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        return response["ETag"]
+
+    def assert_not_modified(self, url, etag):
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def assert_modified(self, url, etag):
+        """The new response data (cached version bumps run on commit, see write())."""
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        return response.json()
+
+    def write(self, method, url, data=None, client=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(client or self.client, method)(url, data, format="json")
+        self.assertLess(response.status_code, 400, response.content)
+        return response
+
+    def post_data(self, data):
+        return next(post for post in data["results"] if post["id"] == self.post.pk)
+
+    def test_like_and_unlike_post(self):
+        posts, me = self.etag(POSTS), self.etag(ME)
+        self.write("post", f"/posts/{self.post.pk}/like/")
+        self.assertEqual(self.post_data(self.assert_modified(POSTS, posts))["like_count"], 1)
+        self.assertEqual(self.assert_modified(ME, me)["liked_posts_count"], 1)
+
+        posts, me = self.etag(POSTS), self.etag(ME)
+        self.write("post", f"/posts/{self.post.pk}/unlike/")
+        self.assertEqual(self.post_data(self.assert_modified(POSTS, posts))["like_count"], 0)
+        self.assertEqual(self.assert_modified(ME, me)["liked_posts_count"], 0)
+
+    def test_batch_like_and_unlike_posts(self):
+        posts, me = self.etag(POSTS), self.etag(ME)
+        self.write("post", "/posts/batch-like/", {"ids": [self.post.pk]})
+        self.assertTrue(self.post_data(self.assert_modified(POSTS, posts))["liked_by_me"])
+        self.assertEqual(self.assert_modified(ME, me)["liked_posts_count"], 1)
+
+        posts, me = self.etag(POSTS), self.etag(ME)
+        self.write("post", "/posts/batch-unlike/", {"ids": [self.post.pk]})
+        self.assertFalse(self.post_data(self.assert_modified(POSTS, posts))["liked_by_me"])
+        self.assertEqual(self.assert_modified(ME, me)["liked_posts_count"], 0)
+
+    def test_like_and_unlike_user(self):
+        me = self.etag(ME)
+        self.write("post", "/liked-users/", {"liker": self.alice.pk, "liked_user": self.bob.pk})
+        self.assertEqual(self.assert_modified(ME, me)["liked_user_id"], [{"id": self.bob.pk}])
+
+        me = self.etag(ME)
+        like = LikedUsers.objects.get(liker=self.alice, liked_user=self.bob)
+        self.write("delete", f"/liked-users/{like.pk}/")
+        self.assertEqual(self.assert_modified(ME, me)["liked_user_id"], [])
+
+    def test_liked_user_sees_new_like(self):
+        bob = self.client_for(self.bob)
+        response = bob.get(ME)
+        self.write("post", "/liked-users/batch-like/", {"ids": [self.bob.pk]})
+        response = bob.get(ME, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["amount_of_me_liked_users"], 1)
+
+    def test_batch_like_and_unlike_users(self):
+        me = self.etag(ME)
+        self.write("post", "/liked-users/batch-like/", {"ids": [self.bob.pk, self.carol.pk]})
+        self.assertEqual(self.assert_modified(ME, me)["amount_of_liked_users"], 2)
+
+        me = self.etag(ME)
+        self.write("post", "/liked-users/batch-unlike/", {"ids": [self.bob.pk]})
+        self.assertEqual(self.assert_modified(ME, me)["amount_of_liked_users"], 1)
+
+    def test_follow_and_unfollow_hashtag(self):
+        me, hashtags = self.etag(ME), self.etag(MY_HASHTAGS)
+        self.write("post", "/followed-hashtags/", {"user": self.alice.pk, "hashtag": self.hashtag.pk})
+        self.assertEqual(self.assert_modified(ME, me)["amount_of_followed_hashtags"], 1)
+        self.assertEqual(len(self.assert_modified(MY_HASHTAGS, hashtags)), 1)
+
+        me, hashtags = self.etag(ME), self.etag(MY_HASHTAGS)
+        follow = FollowedHashtags.objects.get(user=self.alice, hashtag=self.hashtag)
+        self.write("delete", f"/followed-hashtags/{follow.pk}/")
+        self.assertEqual(self.assert_modified(ME, me)["amount_of_followed_hashtags"], 0)
+        self.assertEqual(self.assert_modified(MY_HASHTAGS, hashtags), [])
+
+    def test_batch_follow_and_unfollow_hashtags(self):
+        me, hashtags = self.etag(ME), self.etag(MY_HASHTAGS)
+        self.write("post", "/followed-hashtags/batch-follow/", {"ids": [self.hashtag.pk]})
+        self.assertEqual(self.assert_modified(ME, me)["id_and_name_of_followed_hashtags"][0]["name"], "django")
+        self.assertEqual(len(self.assert_modified(MY_HASHTAGS, hashtags)), 1)
+
+        me, hashtags = self.etag(ME), self.etag(MY_HASHTAGS)
+        self.write("post", "/followed-hashtags/batch-unfollow/", {"ids": [self.hashtag.pk]})
+        self.assertEqual(self.assert_modified(ME, me)["id_and_name_of_followed_hashtags"], [])
+        self.assertEqual(self.assert_modified(MY_HASHTAGS, hashtags), [])
+
+    def test_follow_and_unfollow_users(self):
+        me = self.etag(ME)
+        self.write("post", "/followed-users/batch-follow/", {"ids": [self.bob.pk]})
+        self.assert_modified(ME, me)
+        self.assertTrue(FollowedUsers.objects.filter(follower=self.alice, followed_user=self.bob).exists())
+
+        me = self.etag(ME)
+        self.write("post", "/followed-users/batch-unfollow/", {"ids": [self.bob.pk]})
+        self.assert_modified(ME, me)
+
+        self.write("post", "/followed-users/batch-follow/", {"ids": [self.bob.pk]})
+        me = self.etag(ME)
+        follow = FollowedUsers.objects.get(follower=self.alice, followed_user=self.bob)
+        self.write("delete", f"/followed-users/{follow.pk}/")
+        self.assert_modified(ME, me)
+
+    def test_create_update_and_delete_post(self):
+        posts, me = self.etag(POSTS), self.etag(ME)
+        response = self.write("post", POSTS, {"text": "New post", "hashtags": [{"name": "django"}]})
+        post_id = response.json()["id"]
+        self.assertEqual(self.assert_modified(POSTS, posts)["results"][0]["id"], post_id)
+        self.assertEqual(self.assert_modified(ME, me)["posts_count"], 1)
+
+        detail = f"/posts/{post_id}/"
+        posts, post = self.etag(POSTS), self.etag(detail)
+        self.write("patch", detail, {"text": "Edited post"})
+        self.assertEqual(self.assert_modified(POSTS, posts)["results"][0]["text"], "Edited post")
+        self.assertEqual(self.assert_modified(detail, post)["text"], "Edited post")
+
+        posts, me = self.etag(POSTS), self.etag(ME)
+        self.write("delete", detail)
+        self.assertNotIn(post_id, [post["id"] for post in self.assert_modified(POSTS, posts)["results"]])
+        self.assertEqual(self.assert_modified(ME, me)["posts_count"], 0)
+
+    def test_unrelated_writes_keep_304(self):
+        posts, me, hashtags = self.etag(POSTS), self.etag(ME), self.etag(MY_HASHTAGS)
+        carol = self.client_for(self.carol)
+        self.write("post", "/followed-hashtags/batch-follow/", {"ids": [self.hashtag.pk]}, client=carol)
+        self.write("post", "/followed-users/batch-follow/", {"ids": [self.bob.pk]}, client=carol)
+        self.write("post", "/liked-users/batch-like/", {"ids": [self.bob.pk]}, client=carol)
+        self.assert_not_modified(POSTS, posts)
+        self.assert_not_modified(ME, me)
+        self.assert_not_modified(MY_HASHTAGS, hashtags)
+
+        # Another user's like changes the post list, but not alice's own profile
+        self.write("post", f"/posts/{self.post.pk}/like/", client=carol)
+        self.assert_modified(POSTS, posts)
+        self.assert_not_modified(ME, me)
@@ -0,0 +1,38 @@
+import base64
+import json
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from hive_backend.models import CustomUser, Post
+
+
+def cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+class InvalidCursorTests(TestCase):
+    """A malformed or crafted cursor is a 404, never a server error."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("alice", password="password123")
+        Post.objects.create(user=cls.user, text="Hello")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_invalid_cursors(self):
+        for value in [
+            "not base64!", cursor({"time": 1}), cursor(["2024-01-01T00:00:00"]),
+            cursor(["2024-01-01T00:00:00", None]), cursor([None, 1]), cursor(["yesterday", 1]),
+            cursor(["2024-01-01T00:00:00", "x"]),
+        ]:
+            with self.subTest(cursor=value):
+                self.assertEqual(self.client.get("/posts/", {"cursor": value}).status_code, 404)
+
+    def test_valid_cursor(self):
+        response = self.client.get("/posts/", {"cursor": cursor(["2999-01-01T00:00:00+00:00", 1])})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 1)
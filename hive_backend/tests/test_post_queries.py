@@ -0,0 +1,59 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from hive_backend.models import CustomUser, Hashtag, Post, PostReference
+
+# Posts, hashtags (prefetch) and references (prefetch); the author and liked_by_me are in the posts query
+POST_LIST_QUERIES = 3
+
+
+class PostListQueryCountTests(TestCase):
+    """/posts/ runs the same number of queries whatever the number of posts (no N+1)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = CustomUser.objects.bulk_create(
+            [CustomUser(username=f"user{i}") for i in range(10)]
+        )
+        cls.hashtags = Hashtag.objects.bulk_create([Hashtag(name=f"tag{i}") for i in range(10)])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        cache.clear()
+
+    def create_posts(self, total):
+        """Add posts, each with two hashtags and a mention, until there are `total`."""
+        start = Post.objects.count()
+        posts = Post.objects.bulk_create([
+            Post(user=self.users[i % 10], text=f"post {i}") for i in range(start, total)
+        ])
+        now = timezone.now()
+        Post.hashtags.through.objects.bulk_create([
+            Post.hashtags.through(post=post, hashtag=self.hashtags[(post.pk + offset) % 10])
+            for post in posts for offset in (0, 1)
+        ])
+        PostReference.objects.bulk_create([
+            PostReference(post=post, user=self.users[(post.pk + 1) % 10], time=now) for post in posts
+        ])
+
+    def assert_constant_queries(self):
+        for total in (10, 100, 1000):
+            self.create_posts(total)
+            with self.subTest(posts=total):
+                cache.clear()  # Skip the conditional GET body cache
+                with self.assertNumQueries(POST_LIST_QUERIES):
+                    response = self.client.get("/posts/", {"page_size": 100})
+                self.assertEqual(response.status_code, 200)
+                results = response.json()["results"]
+                self.assertEqual(len(results), min(total, 100))
+                self.assertTrue(all(post["hashtags"] and post["references"] for post in results))
+
+    def test_values_fast_path(self):
+        self.assert_constant_queries()
+
+    @override_settings(FAST_LIST_SERIALIZATION=False)
+    def test_post_serializer(self):
+        self.assert_constant_queries()
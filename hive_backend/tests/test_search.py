@@ -0,0 +1,35 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from hive_backend import search
+from hive_backend.models import CustomUser, Hashtag, Post
+
+
+class SearchPlanTests(TestCase):
+    """The posts scan used for common terms finds the same posts as the index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user("alice", password="password123")
+        cls.hashtag = Hashtag.objects.create(name="gardening")
+        posts = [
+            Post.objects.create(user=user, text=text)
+            for text in ["Tomatoes in the garden", "garden party", "Party time", "nothing here"]
+        ]
+        posts[3].hashtags.add(cls.hashtag)
+
+    def matches(self, query):
+        if not search.fts_available():
+            self.skipTest("FTS5 index not available")
+        queryset = search.filter_posts(Post.objects.order_by("-time", "-id"), query)
+        return list(queryset.values_list("text", flat=True))
+
+    def test_scan_matches_index(self):
+        for query in ["garden", "party", "garden party", "gard", "time", "missing"]:
+            with self.subTest(query=query):
+                with mock.patch.object(search, "SCAN_THRESHOLD", 10**6):
+                    indexed = self.matches(query)
+                with mock.patch.object(search, "SCAN_THRESHOLD", 1):
+                    scanned = self.matches(query)
+                self.assertEqual(scanned, indexed)
@@ -0,0 +1,135 @@
+"""
+Materialized home timelines.
+
+Every post is fanned out on write into ``TimelineEntry`` rows for the users who
+follow its author or one of its hashtags, so reading a feed page is a single
+range scan over the ``(user, time, post)`` index instead of a join over all posts.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from .models import Post, TimelineEntry, FollowedUsers, FollowedHashtags
+
+# How many of the newest matching posts are copied into a timeline on a new follow
+BACKFILL_LIMIT = getattr(settings, "TIMELINE_BACKFILL_LIMIT", 200)
+
+
+def _insert(user_ids, posts):
+    """Insert (user, post) pairs, skipping the ones that are already present."""
+    entries = [
+        TimelineEntry(user_id=user_id, post_id=post_id, time=time)
+        for user_id in user_ids
+        for post_id, time in posts
+    ]
+    TimelineEntry.objects.bulk_create(entries, batch_size=500, ignore_conflicts=True)
+
+
+def get_recipients(post, hashtag_ids):
+    """Return the ids of users whose timeline should contain the post."""
+    recipients = set(
+        FollowedUsers.objects.filter(followed_user_id=post.user_id).values_list("follower_id", flat=True)
+    )
+    if hashtag_ids:
+        recipients.update(
+            FollowedHashtags.objects.filter(hashtag_id__in=hashtag_ids).values_list("user_id", flat=True)
+        )
+    return recipients
+
+
+def fan_out(post, hashtag_ids):
+    """Write a new post into the timelines of its followers. Returns the recipient ids."""
+    recipients = get_recipients(post, hashtag_ids)
+    _insert(recipients, [(post.id, post.time)])
+    return recipients
+
+
+def refresh_post(post):
+    """Re-sync the timeline entries of an edited post with its current hashtags."""
+    hashtag_ids = list(post.hashtags.values_list("id", flat=True))
+    recipients = get_recipients(post, hashtag_ids)
+    TimelineEntry.objects.filter(post=post).exclude(user_id__in=recipients).delete()
+    _insert(recipients, [(post.id, post.time)])
+    return recipients
+
+
+def backfill_followed_users(follower_id, user_ids):
+    """Copy the newest posts of newly followed users into the follower's timeline."""
+    posts = (
+        Post.objects.filter(user_id__in=user_ids)
+        .order_by("-time", "-id")
+        .values_list("id", "time")[:BACKFILL_LIMIT]
+    )
+    _insert([follower_id], posts)
+
+
+def backfill_followed_hashtags(user_id, hashtag_ids):
+    """Copy the newest posts with newly followed hashtags into the user's timeline."""
+    posts = (
+        Post.objects.filter(hashtags__in=hashtag_ids)
+        .distinct()
+        .order_by("-time", "-id")
+        .values_list("id", "time")[:BACKFILL_LIMIT]
+    )
+    _insert([user_id], posts)
+
+
+def remove_followed_users(follower_id, user_ids):
+    """
+    Drop posts of unfollowed users from the follower's timeline.
+
+    Must run after the follow rows are deleted. Posts that still match one of
+    the follower's hashtag follows are kept.
+    """
+    TimelineEntry.objects.filter(user_id=follower_id, post__user_id__in=user_ids).exclude(
+        post__hashtags__in=FollowedHashtags.objects.filter(user_id=follower_id).values("hashtag_id")
+    ).delete()
+
+
+def remove_followed_hashtags(user_id, hashtag_ids):
+    """
+    Drop posts with unfollowed hashtags from the user's timeline.
+
+    Must run after the follow rows are deleted. Posts that still match a
+    followed user or another followed hashtag are kept.
+    """
+    TimelineEntry.objects.filter(user_id=user_id, post__hashtags__in=hashtag_ids).exclude(
+        post__user_id__in=FollowedUsers.objects.filter(follower_id=user_id).values("followed_user_id")
+    ).exclude(
+        post__hashtags__in=FollowedHashtags.objects.filter(user_id=user_id).values("hashtag_id")
+    ).delete()
+
+
+def rebuild(batch_size=1000):
+    """
+    Rebuild every timeline from the follow tables (after bulk imports, which skip the fan-out).
+
+    Each user with follows gets the BACKFILL_LIMIT newest posts of the users and
+    hashtags they follow. Users are processed in id ranges of `batch_size`, one
+    transaction each. Returns the number of timelines rebuilt.
+    """
+    TimelineEntry.objects.all().delete()
+    rebuilt = 0
+    last_id = (
+        FollowedUsers.objects.order_by("-follower_id").values_list("follower_id", flat=True).first() or 0
+    )
+    last_id = max(
+        last_id, FollowedHashtags.objects.order_by("-user_id").values_list("user_id", flat=True).first() or 0
+    )
+    for start in range(0, last_id, batch_size):
+        users, hashtags = {}, {}
+        for follower_id, user_id in FollowedUsers.objects.filter(
+            follower_id__gt=start, follower_id__lte=start + batch_size
+        ).values_list("follower_id", "followed_user_id"):
+            users.setdefault(follower_id, []).append(user_id)
+        for user_id, hashtag_id in FollowedHashtags.objects.filter(
+            user_id__gt=start, user_id__lte=start + batch_size
+        ).values_list("user_id", "hashtag_id"):
+            hashtags.setdefault(user_id, []).append(hashtag_id)
+        with transaction.atomic():
+            for user_id in sorted(users.keys() | hashtags.keys()):
+                if user_id in users:
+                    backfill_followed_users(user_id, users[user_id])
+                if user_id in hashtags:
+                    backfill_followed_hashtags(user_id, hashtags[user_id])
+                rebuilt += 1
+    return rebuilt
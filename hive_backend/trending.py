@@ -0,0 +1,187 @@
+"""
+Trending hashtags.
+
+Each window (1h, 24h, 7d) is a ring of time buckets holding per-hashtag post
+and follow counts, plus running totals over the whole window. Writes add to the
+newest bucket; buckets that fall out of the window are subtracted from the
+totals and dropped. The ranking is recomputed from the totals at most every
+TRENDING_REFRESH_SECONDS, so a read is a slice of a cached list and never
+touches the posts table.
+
+Counters are per process. They are seeded from the last 7 days of posts when
+the server process starts (see wsgi.py / asgi.py), outside the lock so writes
+are not held up; writes committed meanwhile are replayed on top of the seed,
+skipping posts it has already counted. Follows are counted from this process's
+writes only, since follows carry no timestamp.
+"""
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Post
+
+# Window name -> (bucket length in seconds, number of buckets)
+WINDOWS = {
+    "1h": (5 * 60, 12),
+    "24h": (60 * 60, 24),
+    "7d": (6 * 60 * 60, 28),
+}
+DEFAULT_WINDOW = "24h"
+FOLLOW_WEIGHT = getattr(settings, "TRENDING_FOLLOW_WEIGHT", 2)
+REFRESH_SECONDS = getattr(settings, "TRENDING_REFRESH_SECONDS", 10)
+# Hashtags tracked per window; beyond this the least active ones are pruned (long tail)
+CAPACITY = getattr(settings, "TRENDING_CAPACITY", 50_000)
+
+
+class SlidingWindowCounter:
+    def __init__(self, bucket_seconds, bucket_count, capacity=CAPACITY):
+        self.bucket_seconds = bucket_seconds
+        self.span = bucket_seconds * bucket_count
+        self.capacity = capacity
+        self.buckets = deque()  # (bucket start, {hashtag id: [posts, follows]}), oldest first
+        self.totals = {}  # hashtag id -> [posts, follows] over the whole window
+        self.ranking = []
+        self.ranked_at = None
+
+    def _expire(self, now):
+        while self.buckets and self.buckets[0][0] <= now - self.span:
+            _, counts = self.buckets.popleft()
+            for hashtag_id, (posts, follows) in counts.items():
+                total = self.totals[hashtag_id]
+                total[0] -= posts
+                total[1] -= follows
+                if total[0] <= 0 and total[1] <= 0:
+                    del self.totals[hashtag_id]
+
+    def add(self, hashtag_id, timestamp, posts=0, follows=0):
+        now = time.time()
+        self._expire(now)
+        if timestamp <= now - self.span:
+            return
+        start = timestamp - timestamp % self.bucket_seconds
+        if not self.buckets or self.buckets[-1][0] < start:
+            self.buckets.append((start, {}))
+        # A slightly late event lands in the newest bucket, off by at most one bucket length
+        bucket = self.buckets[-1][1]
+        counts = bucket.setdefault(hashtag_id, [0, 0])
+        counts[0] += posts
+        counts[1] += follows
+        total = self.totals.setdefault(hashtag_id, [0, 0])
+        total[0] += posts
+        total[1] += follows
+        if len(self.totals) > self.capacity:
+            self._prune()
+
+    def _prune(self):
+        """Drop the least active quarter of the tracked hashtags, keeping memory bounded."""
+        keep = sorted(self.totals, key=self._score, reverse=True)[:self.capacity * 3 // 4]
+        keep = set(keep)
+        self.totals = {hashtag_id: total for hashtag_id, total in self.totals.items() if hashtag_id in keep}
+        for _, counts in self.buckets:
+            for hashtag_id in [hashtag_id for hashtag_id in counts if hashtag_id not in keep]:
+                del counts[hashtag_id]
+
+    def _score(self, hashtag_id):
+        posts, follows = self.totals[hashtag_id]
+        return posts + FOLLOW_WEIGHT * follows
+
+    def top(self, limit):
+        """Return [(hashtag id, posts, follows, score)] of the most active hashtags, best first."""
+        now = time.time()
+        if self.ranked_at is None or now - self.ranked_at >= REFRESH_SECONDS:
+            self._expire(now)
+            ranked = sorted(self.totals, key=lambda hashtag_id: (self._score(hashtag_id), -hashtag_id), reverse=True)
+            self.ranking = [
+                (hashtag_id, *self.totals[hashtag_id], self._score(hashtag_id)) for hashtag_id in ranked
+            ]
+            self.ranked_at = now
+        return self.ranking[:limit]
+
+
+class TrendingHashtags:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seed_lock = threading.Lock()
+        self.windows = {name: SlidingWindowCounter(*config) for name, config in WINDOWS.items()}
+        # Writes committed before seeding finishes, replayed on top of the seed; None once seeded
+        self._journal = []
+
+    @property
+    def seeded(self):
+        return self._journal is None
+
+    def seed(self):
+        """Count the hashtags of the posts inside the longest window, once per process."""
+        # One seed at a time; readers arriving meanwhile wait for it instead of starting another
+        with self._seed_lock:
+            if self.seeded:
+                return
+            span = max(bucket_seconds * count for bucket_seconds, count in WINDOWS.values())
+            since = timezone.now() - timedelta(seconds=span)
+            rows = (
+                Post.hashtags.through.objects.filter(post__time__gte=since)
+                .order_by("post__time")
+                .values_list("post_id", "hashtag_id", "post__time")
+                .iterator(chunk_size=10_000)
+            )
+            windows = {name: SlidingWindowCounter(*config) for name, config in WINDOWS.items()}
+            counted = set()
+            for post_id, hashtag_id, post_time in rows:
+                self._add(windows, hashtag_id, post_time.timestamp(), posts=1)
+                counted.add(post_id)
+            with self._lock:
+                for post_id, hashtag_ids, timestamp, kind in self._journal:
+                    if post_id in counted:
+                        continue  # Committed before the seed query read it
+                    for hashtag_id in hashtag_ids:
+                        self._add(windows, hashtag_id, timestamp, **{kind: 1})
+                self.windows = windows
+                self._journal = None
+
+    def _add(self, windows, hashtag_id, timestamp, posts=0, follows=0):
+        for window in windows.values():
+            window.add(hashtag_id, timestamp, posts=posts, follows=follows)
+
+    def _record(self, post_id, hashtag_ids, timestamp, kind):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((post_id, hashtag_ids, timestamp, kind))
+                return
+            for hashtag_id in hashtag_ids:
+                self._add(self.windows, hashtag_id, timestamp, **{kind: 1})
+
+    def record_post(self, post_id, hashtag_ids, post_time=None):
+        """Count a new post once the current transaction commits. Call after the post and its hashtags are saved."""
+        timestamp = (post_time or timezone.now()).timestamp()
+        transaction.on_commit(partial(self._record, post_id, list(hashtag_ids), timestamp, "posts"))
+
+    def record_follows(self, hashtag_ids):
+        """Count new follows once the current transaction commits."""
+        transaction.on_commit(partial(self._record, None, list(hashtag_ids), time.time(), "follows"))
+
+    def top(self, window, limit):
+        if not self.seeded:
+            # Warmed at startup; seeded here only when that failed (e.g. database not migrated yet)
+            self.seed()
+        with self._lock:
+            return self.windows[window].top(limit)
+
+
+trending_hashtags = TrendingHashtags()
+
+
+def warm():
+    """Seed the trending counters. Called when a server process starts."""
+    from django.db import DatabaseError
+
+    try:
+        trending_hashtags.seed()
+    except DatabaseError:
+        # Database not migrated yet; the counters are seeded on the first read
+        pass
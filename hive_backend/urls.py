@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import permissions
@@ -9,9 +10,10 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     UserViewSet, PostViewSet, HashtagViewSet,
     LikedUsersViewSet, FollowedHashtagsViewSet, LikedPostsViewSet, FollowedUsersViewSet,
-    UserRegistrationView, CustomTokenObtainPairView
+    UserRegistrationView, CustomTokenObtainPairView, TimelineViewSet, ExportView
 )
 from rest_framework_simplejwt.views import TokenRefreshView
+from .instrumentation import metrics_view
 
 # Configure the Swagger schema view
 schema_view = get_schema_view(
@@ -36,6 +38,7 @@ router.register(r'liked-users', LikedUsersViewSet, basename="liked-user")
 router.register(r'followed-hashtags', FollowedHashtagsViewSet, basename="followed-hashtag")
 router.register(r'liked-posts', LikedPostsViewSet, basename="liked-post")
 router.register(r'followed-users', FollowedUsersViewSet, basename="followed-user")
+router.register(r'timeline', TimelineViewSet, basename="timeline")
 
 # Define the URL patterns
 urlpatterns = [
@@ -53,6 +56,23 @@ urlpatterns = [
     # User Registration
     path('register/', UserRegistrationView.as_view(), name='user-registration'),
 
+    # Analytics export (NDJSON stream, admin only)
+    path('export/', ExportView.as_view(), name='export'),
+
+    # Per-route request metrics (Prometheus text format)
+    path('metrics', metrics_view, name='metrics'),
+
     # Include the router-generated viewset URLs
     path('', include(router.urls)),
 ]
+
+# Async read endpoints and the new-post stream (ASGI): matched before the router's sync versions of the same URLs
+if settings.ASYNC_VIEWS:
+    from . import async_views
+
+    urlpatterns[-1:-1] = [
+        path('posts/', async_views.post_list),
+        path('posts/stream/', async_views.post_stream, name='post-stream'),
+        path('users/me/', async_views.get_me),
+        path('hashtags/search/', async_views.search_hashtags),
+    ]
@@ -1,14 +1,28 @@
-from rest_framework import viewsets, status
+from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from .models import Post, Hashtag, LikedUsers, FollowedHashtags, LikedPosts, FollowedUsers
+from .models import (
+    Post, PostReference, Hashtag, LikedUsers, FollowedHashtags, LikedPosts, FollowedUsers, TimelineEntry, UserStats,
+)
+from . import batch, caching, export, search
+from .caching import conditional_cache
+from .cooccurrence import hashtag_cooccurrence
+from .fastpath import FastListMixin, LikedPostValuesSerializer, PostValuesSerializer
+from .graph import follow_graph
+from .hashtags import hashtag_index
+from .trending import trending_hashtags, WINDOWS, DEFAULT_WINDOW
+from .pagination import PostPagination, TimelinePagination, MentionPagination, IdPagination
 from .serializers import (
     PostSerializer, HashtagSerializer,
     LikedUsersSerializer, FollowedHashtagsSerializer,
@@ -25,6 +39,53 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
 
+def _posts_scopes(view, request):
+    return [caching.POSTS]
+
+
+def _my_scopes(view, request):
+    return [caching.user_scope(request.user.pk), caching.HASHTAGS]
+
+
+def _post_relations(queryset, fields, prefix=""):
+    """Join / prefetch only the post relations that the selected PostSerializer fields read."""
+    if 'user' in fields:
+        queryset = queryset.select_related(prefix + 'user')
+    if 'hashtags' in fields:
+        queryset = queryset.prefetch_related(prefix + 'hashtags')
+    if fields & {'references', 'reference_count'}:
+        queryset = queryset.prefetch_related(prefix + 'references')
+    return queryset
+
+
+def _entry_posts(queryset, request):
+    """Posts of TimelineEntry / PostReference rows: the selected post relations and liked_by_me in the row query."""
+    fields = PostSerializer.selected_fields(request)
+    queryset = _post_relations(queryset.select_related("post"), fields, prefix="post__")
+    if 'liked_by_me' in fields:
+        queryset = queryset.annotate(liked_by_me=Exists(
+            LikedPosts.objects.filter(user=request.user, post=OuterRef("post_id"))
+        ))
+    return queryset
+
+
+def _page_posts(page):
+    for entry in page:
+        if hasattr(entry, "liked_by_me"):
+            entry.post.liked_by_me = entry.liked_by_me
+    return [entry.post for entry in page]
+
+
+def _mention_stats(user):
+    """(read watermark, unread count) of the user's mentions: one primary key lookup."""
+    # Not user.stats: request.user may be a cached instance (see authentication.py) holding an old stats row
+    row = UserStats.objects.filter(user=user).values_list("mentions_watermark", "unread_mentions_count").first()
+    if row is None:
+        stats = UserStats.objects.for_user(user)
+        row = stats.mentions_watermark, stats.unread_mentions_count
+    return row
+
+
 # User ViewSet
 class UserViewSet(viewsets.ReadOnlyModelViewSet):  # ReadOnly turvallisuussyistä
     queryset = User.objects.all()
@@ -35,13 +96,74 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):  # ReadOnly turvallisuussyist
         from .serializers import UserSerializer  # Lazy import to avoid circular imports
         return UserSerializer
 
+    def get_queryset(self):
+        """Lataa vain pyydettyjen kenttien (?fields= / ?omit=) tarvitsemat relaatiot."""
+        # Counters come from the stats row, lists from prefetches: a constant number of queries per page
+        fields = self.get_serializer_class().selected_fields(self.request)
+        queryset = super().get_queryset()
+        if fields & self.get_serializer_class().STATS_FIELDS:
+            queryset = queryset.select_related('stats')
+        if 'liked_user_id' in fields:
+            queryset = queryset.prefetch_related('liked_users')
+        if 'id_and_name_of_followed_hashtags' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('followed_hashtags', queryset=FollowedHashtags.objects.select_related('hashtag'))
+            )
+        return queryset
+
     @action(detail=False, methods=["get"], url_path="me")
+    @conditional_cache(_my_scopes)
     def get_me(self, request):
         """Kirjautuneen käyttäjän tietojen haku."""
-        user = request.user
+        user = self.get_queryset().get(pk=request.user.pk)
         serializer = self.get_serializer(user)
         return Response(serializer.data)
 
+    @action(detail=False, methods=["get"], url_path="me/mentions")
+    def mentions(self, request):
+        """Postaukset, joissa kirjautunut käyttäjä mainitaan, uusin ensin; "unread" merkitsee lukemattomat."""
+        watermark, unread_count = _mention_stats(request.user)
+        paginator = MentionPagination()
+        page = paginator.paginate_queryset(
+            _entry_posts(PostReference.objects.filter(user=request.user), request), request, view=self
+        )
+        data = PostSerializer(_page_posts(page), many=True, context=self.get_serializer_context()).data
+        for item, mention in zip(data, page):
+            item["unread"] = mention.pk > watermark
+        response = paginator.get_paginated_response(data)
+        response.data["unread_count"] = unread_count
+        return response
+
+    @action(detail=False, methods=["get"], url_path="me/mentions/unread")
+    def unread_mentions(self, request):
+        """Lukemattomien mainintojen määrä (badge): yksi rivi, ei COUNT-kyselyä."""
+        return Response({"unread_count": _mention_stats(request.user)[1]})
+
+    @action(detail=False, methods=["post"], url_path="me/mentions/read")
+    def read_mentions(self, request):
+        """Merkitse kaikki maininnat luetuiksi."""
+        _mention_stats(request.user)  # Builds the stats row if the user has none yet
+        UserStats.objects.read_mentions(request.user.pk)
+        return Response({"unread_count": 0})
+
+    @action(detail=False, methods=["get"], url_path="suggestions")
+    def suggestions(self, request):
+        """Seurattavaksi ehdotetut käyttäjät: seurattujen seuraamat ja samoja hashtageja seuraavat."""
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), 50)
+        except ValueError:
+            limit = 10
+        # Scored from the in-memory graph (graph.py); the database only supplies names of active users
+        suggestions = follow_graph.suggest(request.user.pk, limit * 2)
+        usernames = dict(
+            User.objects.filter(pk__in=[suggestion["id"] for suggestion in suggestions], is_active=True)
+            .values_list("id", "username")
+        )
+        return Response([
+            {**suggestion, "username": usernames[suggestion["id"]]}
+            for suggestion in suggestions if suggestion["id"] in usernames
+        ][:limit])
+
 
 class UserRegistrationView(APIView):
     def post(self, request):
@@ -59,10 +181,12 @@ class UserRegistrationView(APIView):
 
 
 # Post ViewSet
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all().order_by('-time')
+class PostViewSet(FastListMixin, viewsets.ModelViewSet):
+    queryset = Post.objects.order_by('-time')
     serializer_class = PostSerializer
+    values_serializer_class = PostValuesSerializer  # List pages skip the ModelSerializer (fastpath.py)
     permission_classes = [IsAuthenticated]
+    pagination_class = PostPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['user']
 
@@ -71,59 +195,154 @@ class PostViewSet(viewsets.ModelViewSet):
         serializer.save()
 
     def get_queryset(self):
-        """Haku otsikon tai kuvauksen perusteella."""
-        queryset = super().get_queryset()
+        """Haku postauksen tekstin ja hashtagien perusteella."""
+        # Author, hashtags and references are loaded in three batched queries, whatever the page size;
+        # relations whose fields are not selected (?fields= / ?omit=) are skipped
+        fields = PostSerializer.selected_fields(self.request)
+        queryset = _post_relations(super().get_queryset(), fields)
+        if 'liked_by_me' in fields and self.request.user.is_authenticated:
+            queryset = queryset.annotate(liked_by_me=Exists(
+                LikedPosts.objects.filter(user=self.request.user, post=OuterRef('pk'))
+            ))
         query = self.request.query_params.get("search", None)
         if query:
-            queryset = queryset.filter(Q(title__icontains=query) | Q(description__icontains=query))
+            queryset = search.filter_posts(queryset, query)
         return queryset
 
+    @conditional_cache(_posts_scopes)
+    def list(self, request, *args, **kwargs):
+        """Postauslista; ETag / If-None-Match palauttaa 304, jos mikään postaus ei ole muuttunut."""
+        return super().list(request, *args, **kwargs)
+
+    @conditional_cache(_posts_scopes)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=False, methods=["get"], url_path="search")
+    def search_posts(self, request):
+        """Hae postauksia tekstistä ja hashtageista, osuvimmat ensin."""
+        query = request.query_params.get("q", "")
+        try:
+            limit = min(int(request.query_params.get("limit", 20)), 100)
+        except ValueError:
+            limit = 20
+        post_ids = search.ranked_post_ids(query, limit)
+        posts = self.filter_queryset(self.get_queryset()).in_bulk(post_ids)
+        serializer = self.get_serializer([posts[pk] for pk in post_ids if pk in posts], many=True)
+        return Response(serializer.data)
+
     @action(detail=True, methods=["post"], url_path="like")
     def like_post(self, request, pk=None):
         """Mahdollista postauksen tykkääminen."""
-        post = self.get_object()
+        post = get_object_or_404(Post.objects.only('id'), pk=pk)
         user = request.user
 
-        if LikedPosts.objects.filter(user=user, post=post).exists():
+        # Insert first and let the unique constraint catch duplicates: the transaction starts with a
+        # write, so on SQLite it waits for the write lock instead of failing a read-to-write upgrade.
+        # The like_count / stats updates run in the same transaction (see signals.py).
+        try:
+            with transaction.atomic():
+                LikedPosts.objects.create(user=user, post=post)
+        except IntegrityError:
             return Response({"detail": "Olet jo tykännyt tästä postauksesta."}, status=400)
-
-        LikedPosts.objects.create(user=user, post=post)
         return Response({"detail": "Postaus tykätty onnistuneesti."}, status=201)
 
     @action(detail=True, methods=["post"], url_path="unlike")
     def unlike_post(self, request, pk=None):
         """Mahdollista postauksen tykkäyksen poisto."""
-        post = self.get_object()
+        post = get_object_or_404(Post.objects.only('id'), pk=pk)
         user = request.user
 
         liked_post = LikedPosts.objects.filter(user=user, post=post).first()
         if not liked_post:
             return Response({"detail": "Et ole tykännyt tästä postauksesta."}, status=400)
 
-        liked_post.delete()
+        with transaction.atomic():
+            liked_post.delete()
         return Response({"detail": "Tykkäys poistettu onnistuneesti."}, status=200)
 
+    @action(detail=False, methods=["post"], url_path="batch-like")
+    def batch_like_posts(self, request):
+        """Tykkää monesta postauksesta kerralla: {"ids": [...]}."""
+        ids = batch.parse_ids(request.data.get("ids"))
+        return Response({"results": batch.like_posts(request.user, ids)})
+
+    @action(detail=False, methods=["post"], url_path="batch-unlike")
+    def batch_unlike_posts(self, request):
+        """Poista tykkäys monesta postauksesta kerralla: {"ids": [...]}."""
+        ids = batch.parse_ids(request.data.get("ids"))
+        return Response({"results": batch.unlike_posts(request.user, ids)})
+
 
 # Hashtag ViewSet
 class HashtagViewSet(viewsets.ModelViewSet):
     queryset = Hashtag.objects.all()
     serializer_class = HashtagSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = IdPagination
 
     @action(detail=False, methods=["get"], url_path="search")
     def search_hashtags(self, request):
-        """Hae hashtageja nimen perusteella."""
+        """Hae hashtageja nimen perusteella. ?autocomplete=1 hakee alkuosan perusteella, suosituimmat ensin."""
         query = request.query_params.get("q", "")
+        if request.query_params.get("autocomplete"):
+            try:
+                limit = min(int(request.query_params.get("limit", 10)), 50)
+            except ValueError:
+                limit = 10
+            matches = hashtag_index.search(query, limit)
+            return Response([{"id": hashtag_id, "name": name} for hashtag_id, name in matches])
         hashtags = self.queryset.filter(name__icontains=query)
         serializer = self.get_serializer(hashtags, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=["get"], url_path="related")
+    def related(self, request, pk=None):
+        """Hashtagit, joita käytetään usein samoissa postauksissa (NPMI-pisteet, suurin ensin)."""
+        hashtag = get_object_or_404(Hashtag.objects.only('id'), pk=pk)
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), 50)
+        except ValueError:
+            limit = 10
+        # Served from the in-memory co-occurrence index (cooccurrence.py)
+        related = hashtag_cooccurrence.related(hashtag.pk, limit)
+        names = {related_id: hashtag_index.name(related_id) for related_id, *_ in related}
+        missing = [related_id for related_id, name in names.items() if name is None]
+        if missing:
+            names.update(Hashtag.objects.filter(pk__in=missing).values_list("id", "name"))
+        return Response([
+            {"id": related_id, "name": names[related_id], "score": score, "posts_together": together}
+            for related_id, score, together in related if names.get(related_id) is not None
+        ])
+
+    @action(detail=False, methods=["get"], url_path="trending")
+    def trending(self, request):
+        """Nousussa olevat hashtagit: ?window=1h|24h|7d, järjestetty uusien postausten ja seuraajien mukaan."""
+        window = request.query_params.get("window", DEFAULT_WINDOW)
+        if window not in WINDOWS:
+            return Response({"detail": f"window must be one of: {', '.join(WINDOWS)}."}, status=400)
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 10)), 50))
+        except ValueError:
+            limit = 10
+        top = trending_hashtags.top(window, limit)
+        names = {hashtag_id: hashtag_index.name(hashtag_id) for hashtag_id, *_ in top}
+        missing = [hashtag_id for hashtag_id, name in names.items() if name is None]
+        if missing:
+            names.update(Hashtag.objects.filter(pk__in=missing).values_list("id", "name"))
+        return Response([
+            {"id": hashtag_id, "name": names[hashtag_id], "posts": posts, "follows": follows, "score": score}
+            # Hashtags deleted since they were counted are left out
+            for hashtag_id, posts, follows, score in top if names.get(hashtag_id) is not None
+        ])
+
 
 # LikedUsers ViewSet
 class LikedUsersViewSet(viewsets.ModelViewSet):
     queryset = LikedUsers.objects.all()
     serializer_class = LikedUsersSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = IdPagination
 
     def create(self, request, *args, **kwargs):
         """Estä saman käyttäjän tykkäyksen luominen useasti."""
@@ -135,12 +354,25 @@ class LikedUsersViewSet(viewsets.ModelViewSet):
 
         return super().create(request, *args, **kwargs)
 
+    @action(detail=False, methods=["post"], url_path="batch-like")
+    def batch_like_users(self, request):
+        """Tykkää monesta käyttäjästä kerralla: {"ids": [käyttäjä-id:t]}."""
+        ids = batch.parse_ids(request.data.get("ids"))
+        return Response({"results": batch.like_users(request.user, ids)})
+
+    @action(detail=False, methods=["post"], url_path="batch-unlike")
+    def batch_unlike_users(self, request):
+        """Poista tykkäys monelta käyttäjältä kerralla: {"ids": [käyttäjä-id:t]}."""
+        ids = batch.parse_ids(request.data.get("ids"))
+        return Response({"results": batch.unlike_users(request.user, ids)})
+
 
 # FollowedHashtags ViewSet
 class FollowedHashtagsViewSet(viewsets.ModelViewSet):
     queryset = FollowedHashtags.objects.all()
     serializer_class = FollowedHashtagsSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = IdPagination
 
     def perform_create(self, serializer):
         """Aseta kirjautunut käyttäjä seuraajaksi."""
@@ -157,19 +389,33 @@ class FollowedHashtagsViewSet(viewsets.ModelViewSet):
         return super().create(request, *args, **kwargs)
 
     @action(detail=False, methods=["get"], url_path="my-followed")
+    @conditional_cache(_my_scopes)
     def get_my_followed(self, request):
         """Hae kirjautuneen käyttäjän seuraamat hashtagit."""
         hashtags = self.queryset.filter(user=request.user)
         serializer = self.get_serializer(hashtags, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=["post"], url_path="batch-follow")
+    def batch_follow(self, request):
+        """Seuraa montaa hashtagia kerralla: {"ids": [hashtag-id:t]}."""
+        ids = batch.parse_ids(request.data.get("ids"))
+        return Response({"results": batch.follow_hashtags(request.user, ids)})
+
+    @action(detail=False, methods=["post"], url_path="batch-unfollow")
+    def batch_unfollow(self, request):
+        """Lopeta monen hashtagin seuraaminen kerralla: {"ids": [hashtag-id:t]}."""
+        ids = batch.parse_ids(request.data.get("ids"))
+        return Response({"results": batch.unfollow_hashtags(request.user, ids)})
+
 
 
 # FollowedUsers ViewSet
 class FollowedUsersViewSet(viewsets.ModelViewSet):
-    queryset = FollowedUsers.objects.all()
+    queryset = FollowedUsers.objects.select_related('follower', 'followed_user')
     serializer_class = FollowedUsersSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = IdPagination
 
     @action(detail=False, methods=["get"], url_path="my-followed-users")
     def get_my_followed_users(self, request):
@@ -178,12 +424,26 @@ class FollowedUsersViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(followed_users, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=["post"], url_path="batch-follow")
+    def batch_follow(self, request):
+        """Seuraa montaa käyttäjää kerralla: {"ids": [käyttäjä-id:t]}."""
+        ids = batch.parse_ids(request.data.get("ids"))
+        return Response({"results": batch.follow_users(request.user, ids)})
+
+    @action(detail=False, methods=["post"], url_path="batch-unfollow")
+    def batch_unfollow(self, request):
+        """Lopeta monen käyttäjän seuraaminen kerralla: {"ids": [käyttäjä-id:t]}."""
+        ids = batch.parse_ids(request.data.get("ids"))
+        return Response({"results": batch.unfollow_users(request.user, ids)})
+
 
 # LikedPosts ViewSet
-class LikedPostsViewSet(viewsets.ReadOnlyModelViewSet):
+class LikedPostsViewSet(FastListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = LikedPosts.objects.all()
     serializer_class = LikedPostsSerializer
+    values_serializer_class = LikedPostValuesSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = IdPagination
 
     @action(detail=False, methods=["get"], url_path="my-likes")
     def get_my_likes(self, request):
@@ -191,3 +451,39 @@ class LikedPostsViewSet(viewsets.ReadOnlyModelViewSet):
         liked_posts = self.queryset.filter(user=request.user)
         serializer = self.get_serializer(liked_posts, many=True)
         return Response(serializer.data)
+
+
+# Timeline ViewSet
+class TimelineViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    serializer_class = PostSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = TimelinePagination
+
+    def get_queryset(self):
+        """Kirjautuneen käyttäjän kotisyöte: seurattujen käyttäjien ja hashtagien postaukset."""
+        if getattr(self, "swagger_fake_view", False):
+            return TimelineEntry.objects.none()
+        return _entry_posts(TimelineEntry.objects.filter(user=self.request.user), self.request)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(_page_posts(page), many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+# Analytics export (admin only)
+class ExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Postaukset, tykkäykset ja seuraamiset NDJSON-virtana: ?tables=posts,liked_posts&since=<watermark>."""
+        try:
+            tables = export.parse_tables(request.query_params.get("tables", ""))
+            # Under ASGI an async iterator, which Django streams without buffering it through a thread
+            asynchronous = isinstance(request._request, ASGIRequest)
+            lines = export.iter_ndjson(tables, request.query_params.get("since", ""), asynchronous=asynchronous)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+        response["Content-Disposition"] = 'attachment; filename="hive-export.ndjson"'
+        return response
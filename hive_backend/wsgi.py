@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hive_backend.settings')
 
 application = get_wsgi_application()
+
+# Warm the in-memory indexes before the first request
+from hive_backend import cooccurrence, graph, hashtags, trending  # noqa: E402
+
+hashtags.warm()
+graph.warm()
+cooccurrence.warm()
+trending.warm()